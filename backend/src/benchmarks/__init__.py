@@ -0,0 +1,3 @@
+"""
+Performance benchmarks for the backend, run from `backend/src` with `python -m benchmarks.<name>`
+"""
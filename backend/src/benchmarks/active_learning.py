@@ -0,0 +1,128 @@
+"""
+Compare the labels needed to train a scorer with uncertainty and with insertion order
+
+Builds a synthetic corpus of topics of Zipf-distributed sizes, each with its own cue
+words and class, so that most samples are easy and redundant and the rare topics are
+the hard ones.  Labels are then revealed in batches, either the next samples in order
+or the samples the current model is most uncertain about, as the `uncertainty` queue
+order serves them.  After each batch the scorer is refitted and its accuracy measured
+on held-out samples.
+
+    python -m benchmarks.active_learning --size 20000
+"""
+
+from typing import List, Sequence, Tuple
+import argparse
+import random
+
+import numpy as np
+
+from scoring import scorer_class, uncertainty
+from util.constants import QueueOrders
+
+NUM_TOPICS = 60
+CUES_PER_TOPIC = 3
+VOCABULARY_SIZE = 5000
+WORDS_PER_SAMPLE = 20
+TEST_SIZE = 5000
+
+# Labels revealed at once, as a queue batch would be labeled before the next refit
+BATCH_SIZE = 25
+MAX_LABELS = 3000
+
+
+def synthetic_corpus(size: int, seed: int) -> Tuple[List[str], np.ndarray]:
+    """Texts of topics with Zipf-distributed sizes, and their classes"""
+
+    rng = random.Random(seed)
+    topic_weights = [1 / (rank + 1) for rank in range(NUM_TOPICS)]
+    topic_classes = [rng.random() < 0.5 for _ in range(NUM_TOPICS)]
+    vocabulary = [f"w{index}" for index in range(VOCABULARY_SIZE)]
+    word_weights = [1 / (rank + 1) for rank in range(VOCABULARY_SIZE)]
+
+    topics = rng.choices(range(NUM_TOPICS), topic_weights, k=size)
+    texts = []
+    for topic in topics:
+        words = rng.choices(vocabulary, word_weights, k=WORDS_PER_SAMPLE)
+        words += [f"cue{topic}x{rng.randrange(CUES_PER_TOPIC)}"]
+        rng.shuffle(words)
+        texts.append(" ".join(words))
+
+    return texts, np.array([topic_classes[topic] for topic in topics])
+
+
+def _accuracy(scorer, texts: Sequence[str], targets: np.ndarray) -> float:
+    return float(np.mean((scorer.predict_proba(texts) >= 0.5) == targets))
+
+
+def learning_curve(
+    texts: List[str], targets: np.ndarray, order: str
+) -> List[Tuple[int, float]]:
+    """Held-out accuracy after each batch of labels revealed in the given order"""
+
+    pool, pool_targets = texts[TEST_SIZE:], targets[TEST_SIZE:]
+    test, test_targets = texts[:TEST_SIZE], targets[:TEST_SIZE]
+    scorer = scorer_class()()
+
+    labeled = np.zeros(len(pool), dtype=bool)
+    labeled[:BATCH_SIZE] = True
+    curve = []
+    while labeled.sum() <= min(MAX_LABELS, len(pool) - BATCH_SIZE):
+        indexes = np.flatnonzero(labeled)
+        if len(set(pool_targets[indexes])) == 2:
+            scorer.fit([pool[i] for i in indexes], pool_targets[indexes])
+            curve.append((len(indexes), _accuracy(scorer, test, test_targets)))
+        else:
+            curve.append((len(indexes), 0.5))
+
+        candidates = np.flatnonzero(~labeled)
+        if order == QueueOrders.UNCERTAINTY and curve[-1][1] != 0.5:
+            scores = uncertainty(scorer.predict_proba([pool[i] for i in candidates]))
+            # Ties are broken by insertion order, like the queue's index
+            candidates = candidates[np.argsort(-scores, kind="stable")]
+        labeled[candidates[:BATCH_SIZE]] = True
+
+    return curve
+
+
+def labels_to_reach(curve: List[Tuple[int, float]], accuracy: float) -> int:
+    """Labels after which the accuracy first reached a target, or -1"""
+
+    return next((labels for labels, value in curve if value >= accuracy), -1)
+
+
+def main(argv: List[str] = None) -> None:
+    """Command line entrypoint"""
+
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n", maxsplit=1)[0])
+    parser.add_argument(
+        "--size", type=int, default=20_000, help="Samples in the corpus"
+    )
+    parser.add_argument("--seeds", type=int, default=3, help="Corpora to average")
+    parser.add_argument(
+        "--targets",
+        type=float,
+        nargs="+",
+        default=[0.8, 0.85, 0.9],
+        help="Held-out accuracies to reach",
+    )
+    args = parser.parse_args(argv)
+
+    needed = {order: [] for order in QueueOrders.valid_orders}
+    for seed in range(args.seeds):
+        texts, targets = synthetic_corpus(args.size, seed)
+        for order, counts in needed.items():
+            curve = learning_curve(texts, targets, order)
+            counts.append([labels_to_reach(curve, target) for target in args.targets])
+
+    print(f"{'accuracy':>10} {'insertion':>10} {'uncertainty':>12}")
+    for index, target in enumerate(args.targets):
+        row = []
+        for counts in needed.values():
+            values = [seed_counts[index] for seed_counts in counts]
+            row.append("never" if -1 in values else f"{np.mean(values):.0f}")
+        print(f"{target:>10.2f} {row[0]:>10} {row[1]:>12}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,157 @@
+"""
+Compare full-table scans against the composite sample indexes
+
+Builds a synthetic store for every requested size, with datasets ingested one after
+another and the leading share of each dataset already labeled, as it would be partway
+through annotation.  It then times the hot sample queries once with the composite indexes dropped and once
+with them in place.
+
+    python -m benchmarks.indexes --sizes 100000 1000000 10000000
+"""
+
+from typing import Callable, Dict, List
+import argparse
+import os
+import random
+import tempfile
+import time
+
+from sqlalchemy import create_engine, text
+from sqlalchemy.engine import Connection
+
+from database import Base
+from database.sample import Sample
+
+# Importing the models registers their tables on `Base.metadata`
+from database import dataset, label_definition  # pylint: disable=unused-import
+
+NUM_DATASETS = 10
+LABELED_FRACTION = 0.3
+INSERT_BATCH_SIZE = 50000
+
+QUERIES: Dict[str, str] = {
+    "count_unlabeled": "SELECT COUNT(*) FROM samples "
+    "WHERE dataset_id = :dataset_id AND is_labeled = 0",
+    "first_unlabeled_page": "SELECT sample_id FROM samples "
+    "WHERE dataset_id = :dataset_id AND is_labeled = 0 "
+    "ORDER BY sample_id LIMIT 50",
+    "deep_unlabeled_page": "SELECT sample_id FROM samples "
+    "WHERE dataset_id = :dataset_id AND is_labeled = 0 AND sample_id > :after "
+    "ORDER BY sample_id LIMIT 50",
+    "saved_for_later": "SELECT sample_id FROM samples "
+    "WHERE dataset_id = :dataset_id AND save_for_later = 1 LIMIT 50",
+}
+
+
+def populate(connection: Connection, size: int) -> None:
+    """Insert `size` synthetic samples split evenly across the datasets"""
+
+    rng = random.Random(0)
+    insert = Sample.__table__.insert()
+    per_dataset = size // NUM_DATASETS
+
+    for start in range(0, size, INSERT_BATCH_SIZE):
+        batch = []
+        for i in range(start, min(start + INSERT_BATCH_SIZE, size)):
+            is_labeled = i % per_dataset < per_dataset * LABELED_FRACTION
+            batch.append(
+                dict(
+                    dataset_id=min(i // per_dataset, NUM_DATASETS - 1) + 1,
+                    original_id=str(i),
+                    text=f"synthetic sample number {i}",
+                    is_labeled=is_labeled,
+                    save_for_later=rng.random() < 0.01,
+                )
+            )
+        connection.execute(insert, batch)
+
+
+def time_query(connection: Connection, sql: str, params: dict, repeat: int) -> float:
+    """Best-of-`repeat` wall time of a query in milliseconds"""
+
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        connection.execute(text(sql), params).fetchall()
+        timings.append((time.perf_counter() - start) * 1000)
+
+    return min(timings)
+
+
+def run_queries(connection: Connection, size: int, repeat: int) -> Dict[str, float]:
+    """Time every benchmark query against the middle dataset"""
+
+    dataset_id = NUM_DATASETS // 2
+    per_dataset = size // NUM_DATASETS
+    after = (dataset_id - 1) * per_dataset + int(per_dataset * 0.9)
+
+    params = dict(dataset_id=dataset_id, after=after)
+    return {
+        name: time_query(connection, sql, params, repeat)
+        for name, sql in QUERIES.items()
+    }
+
+
+def with_indexes(connection: Connection, create: bool) -> None:
+    """Drop or (re)create the composite indexes on the samples table"""
+
+    for index in Sample.__table__.indexes:
+        if create:
+            index.create(connection, checkfirst=True)
+        else:
+            index.drop(connection, checkfirst=True)
+
+
+def benchmark_size(size: int, repeat: int, report: Callable[[str], None]) -> None:
+    """Build a store of `size` samples and compare scan and index timings"""
+
+    with tempfile.TemporaryDirectory() as directory:
+        engine = create_engine(f"sqlite:///{os.path.join(directory, 'bench.db')}")
+        Base.metadata.create_all(bind=engine)
+
+        with engine.begin() as connection:
+            with_indexes(connection, create=False)
+            start = time.perf_counter()
+            populate(connection, size)
+            report(f"Populated {size:,} samples in {time.perf_counter() - start:.1f}s")
+
+        with engine.connect() as connection:
+            scan = run_queries(connection, size, repeat)
+
+            start = time.perf_counter()
+            with_indexes(connection, create=True)
+            connection.execute(text("ANALYZE"))
+            report(f"Built indexes in {time.perf_counter() - start:.1f}s")
+
+            indexed = run_queries(connection, size, repeat)
+
+        engine.dispose()
+
+    report(f"{'query':<24}{'scan (ms)':>12}{'index (ms)':>12}{'speedup':>10}")
+    for name in QUERIES:
+        speedup = scan[name] / indexed[name] if indexed[name] > 0 else float("inf")
+        report(f"{name:<24}{scan[name]:>12.2f}{indexed[name]:>12.2f}{speedup:>9.1f}x")
+    report("")
+
+
+def main(argv: List[str] = None) -> None:
+    """Command line entrypoint"""
+
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n", maxsplit=1)[0])
+    parser.add_argument(
+        "--sizes",
+        type=int,
+        nargs="+",
+        default=[100_000, 1_000_000, 10_000_000],
+        help="Total number of samples in each synthetic store",
+    )
+    parser.add_argument("--repeat", type=int, default=5, help="Runs per query")
+    args = parser.parse_args(argv)
+
+    for size in args.sizes:
+        print(f"== {size:,} samples across {NUM_DATASETS} datasets")
+        benchmark_size(size, args.repeat, print)
+
+
+if __name__ == "__main__":
+    main()
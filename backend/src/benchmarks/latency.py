@@ -0,0 +1,234 @@
+"""
+Load test measuring get_one_sample latency while heavy requests run concurrently
+
+Starts the API with uvicorn against a temporary store, fills a dataset with synthetic
+samples, then samples the latency of `GET /datasets/{id}/samples/{sample_id}` while the
+server is idle, while exports are streaming and while an import is running.
+
+    python -m benchmarks.latency --samples 200000 --duration 10
+"""
+
+from typing import Callable, Dict, List
+import argparse
+import contextlib
+import io
+import os
+import random
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import requests
+
+PREFIX = "/api/v1"
+SRC_DIR = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+
+# Seconds to wait for the server to send any data before giving up on a request
+REQUEST_TIMEOUT = 60
+
+DATASET_BODY = {
+    "name": "Latency benchmark",
+    "description": "Synthetic dataset created by benchmarks.latency",
+    "labels": [{"name": "positive", "variant": "boolean"}],
+}
+
+
+def free_port() -> int:
+    """Ask the OS for an unused TCP port"""
+
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+@contextlib.contextmanager
+def run_server(lablr_dir: str):
+    """Run the API in a uvicorn subprocess and yield its base url"""
+
+    port = free_port()
+    env = dict(os.environ, LABLR_DIR=lablr_dir)
+    process = subprocess.Popen(  # pylint: disable=consider-using-with
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", str(port)],
+        cwd=SRC_DIR,
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    base_url = f"http://127.0.0.1:{port}{PREFIX}"
+
+    try:
+        deadline = time.monotonic() + 30
+        while True:
+            try:
+                requests.get(f"{base_url}/datasets", timeout=1)
+                break
+            except requests.ConnectionError:
+                if time.monotonic() > deadline:
+                    raise
+                time.sleep(0.1)
+        yield base_url
+    finally:
+        process.terminate()
+        process.wait()
+
+
+def synthetic_csv(num_samples: int) -> bytes:
+    """Build an in-memory CSV of synthetic samples"""
+
+    rng = random.Random(0)
+    words = ["alpha", "beta", "gamma", "delta", "epsilon", "zeta", "eta", "theta"]
+
+    output = io.StringIO()
+    output.write("id,text\n")
+    for i in range(num_samples):
+        text = " ".join(rng.choice(words) for _ in range(20))
+        output.write(f"{i},{text}\n")
+
+    return output.getvalue().encode("utf-8")
+
+
+def upload(base_url: str, dataset_id: int, contents: bytes) -> int:
+    """Start an ingestion job and return its id"""
+
+    response = requests.post(
+        f"{base_url}/datasets/{dataset_id}/samples",
+        data=dict(id_field="id", text_field="text"),
+        files=dict(file=("samples.csv", contents, "text/csv")),
+        timeout=REQUEST_TIMEOUT,
+    )
+    response.raise_for_status()
+    return response.json()["job_id"]
+
+
+def wait_for_job(base_url: str, job_id: int) -> None:
+    """Poll a job until it finishes"""
+
+    while requests.get(f"{base_url}/jobs/{job_id}", timeout=REQUEST_TIMEOUT).json()[
+        "status"
+    ] in (
+        "pending",
+        "running",
+    ):
+        time.sleep(0.2)
+
+
+def prepare_dataset(base_url: str, num_samples: int) -> Dict:
+    """Create a half-labeled dataset and return its id and sample ids"""
+
+    dataset_id = requests.post(
+        f"{base_url}/datasets", json=DATASET_BODY, timeout=REQUEST_TIMEOUT
+    ).json()["dataset_id"]
+    wait_for_job(base_url, upload(base_url, dataset_id, synthetic_csv(num_samples)))
+
+    sample_ids = []
+    params = dict(limit=5000)
+    while True:
+        body = requests.get(
+            f"{base_url}/datasets/{dataset_id}/samples",
+            params=params,
+            timeout=REQUEST_TIMEOUT,
+        ).json()
+        sample_ids.extend(s["sample_id"] for s in body["samples"])
+        cursor = body["metadata"]["pagination"]["next_cursor"]
+        if cursor is None:
+            break
+        params = dict(limit=5000, after=cursor)
+
+    # Label every other sample so that exports have rows to write
+    labeled = sample_ids[::2]
+    for start in range(0, len(labeled), 5000):
+        batch = {sid: {"positive": 1} for sid in labeled[start : start + 5000]}
+        requests.put(
+            f"{base_url}/datasets/{dataset_id}/samples:batch",
+            json=dict(samples=batch),
+            timeout=REQUEST_TIMEOUT,
+        ).raise_for_status()
+
+    return dict(dataset_id=dataset_id, sample_ids=sample_ids)
+
+
+def measure(
+    base_url: str, dataset: Dict, duration: float, background: Callable = None
+) -> List[float]:
+    """Sample get_one_sample latencies (ms) while `background` runs in a loop"""
+
+    stop = threading.Event()
+
+    def loop():
+        while not stop.is_set():
+            background()
+
+    worker = None
+    if background is not None:
+        worker = threading.Thread(target=loop, daemon=True)
+        worker.start()
+        time.sleep(0.5)  # Let the background load ramp up
+
+    rng = random.Random(1)
+    session = requests.Session()
+    latencies = []
+    deadline = time.monotonic() + duration
+    while time.monotonic() < deadline:
+        sample_id = rng.choice(dataset["sample_ids"])
+        start = time.perf_counter()
+        session.get(
+            f"{base_url}/datasets/{dataset['dataset_id']}/samples/{sample_id}"
+        ).raise_for_status()
+        latencies.append((time.perf_counter() - start) * 1000)
+
+    stop.set()
+    if worker is not None:
+        worker.join()
+
+    return latencies
+
+
+def percentile(values: List[float], fraction: float) -> float:
+    """Nearest-rank percentile of a list of values"""
+
+    ordered = sorted(values)
+    return ordered[min(int(len(ordered) * fraction), len(ordered) - 1)]
+
+
+def main(argv: List[str] = None) -> None:
+    """Command line entrypoint"""
+
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n", maxsplit=1)[0])
+    parser.add_argument("--samples", type=int, default=200_000)
+    parser.add_argument("--duration", type=float, default=10, help="Seconds per phase")
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as lablr_dir, run_server(lablr_dir) as base_url:
+        print(f"Preparing a dataset of {args.samples:,} samples...")
+        dataset = prepare_dataset(base_url, args.samples)
+        import_contents = synthetic_csv(args.samples)
+
+        def export():
+            url = f"{base_url}/datasets/{dataset['dataset_id']}/export"
+            with requests.get(url, stream=True, timeout=REQUEST_TIMEOUT) as response:
+                for _ in response.iter_content(chunk_size=64 * 1024):
+                    pass
+
+        def ingest():
+            wait_for_job(
+                base_url, upload(base_url, dataset["dataset_id"], import_contents)
+            )
+
+        phases = [("idle", None), ("during export", export), ("during import", ingest)]
+
+        print(f"{'phase':<16}{'requests':>10}{'p50 (ms)':>10}{'p99 (ms)':>10}")
+        for name, background in phases:
+            latencies = measure(base_url, dataset, args.duration, background)
+            print(
+                f"{name:<16}{len(latencies):>10}"
+                f"{statistics.median(latencies):>10.2f}"
+                f"{percentile(latencies, 0.99):>10.2f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
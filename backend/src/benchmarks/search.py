@@ -0,0 +1,148 @@
+"""
+Measure full-text search latency against a substring scan
+
+Builds a synthetic SQLite store whose sample text is drawn from a Zipf-distributed
+vocabulary, so that query words range from very common to rare, with the FTS5 table
+and its triggers in place during ingestion.  It then times a page of ranked search
+results, and the count of matches, once with `LIKE '%word%'` and once through the
+full-text index.
+
+    python -m benchmarks.search --size 1000000
+"""
+
+from typing import Callable, List
+import argparse
+import itertools
+import os
+import random
+import tempfile
+import time
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import Session
+
+from database import Base
+from database.migrations import add_samples_fts
+from database.sample import Sample
+
+# Importing the models registers their tables on `Base.metadata`
+from database import dataset, label_definition  # pylint: disable=unused-import
+from util import search
+
+NUM_DATASETS = 10
+VOCABULARY_SIZE = 20_000
+WORDS_PER_SAMPLE = 20
+INSERT_BATCH_SIZE = 50000
+PAGE_SIZE = 50
+
+# Vocabulary ranks of the searched words, from the most common to rare ones
+QUERY_RANKS = {"common": 1, "frequent": 20, "uncommon": 500, "rare": 15_000}
+
+
+def word(rank: int) -> str:
+    """Synthetic word of a given frequency rank"""
+
+    return f"w{rank}x"
+
+
+def populate(session: Session, size: int) -> None:
+    """Insert `size` samples of Zipf-distributed words split evenly across datasets"""
+
+    rng = random.Random(0)
+    vocabulary = [word(rank) for rank in range(1, VOCABULARY_SIZE + 1)]
+    cum_weights = list(
+        itertools.accumulate(1 / rank for rank in range(1, VOCABULARY_SIZE + 1))
+    )
+    per_dataset = size // NUM_DATASETS
+    insert = Sample.__table__.insert()
+
+    for start in range(0, size, INSERT_BATCH_SIZE):
+        batch = [
+            dict(
+                dataset_id=min(i // per_dataset, NUM_DATASETS - 1) + 1,
+                original_id=str(i),
+                text=" ".join(
+                    rng.choices(vocabulary, cum_weights=cum_weights, k=WORDS_PER_SAMPLE)
+                ),
+            )
+            for i in range(start, min(start + INSERT_BATCH_SIZE, size))
+        ]
+        session.execute(insert, batch)
+
+
+def best_of(run: Callable[[], object], repeat: int) -> float:
+    """Best-of-`repeat` wall time of a call in milliseconds"""
+
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        run()
+        timings.append((time.perf_counter() - start) * 1000)
+
+    return min(timings)
+
+
+def benchmark(size: int, repeat: int, report: Callable[[str], None]) -> None:
+    """Build a store of `size` samples and compare scan and full-text timings"""
+
+    with tempfile.TemporaryDirectory() as directory:
+        engine = create_engine(f"sqlite:///{os.path.join(directory, 'bench.db')}")
+        Base.metadata.create_all(bind=engine)
+        with engine.begin() as connection:
+            add_samples_fts(connection)
+
+        session = Session(bind=engine)
+        start = time.perf_counter()
+        populate(session, size)
+        session.commit()
+        report(
+            f"Ingested and indexed {size:,} samples "
+            f"in {time.perf_counter() - start:.1f}s"
+        )
+
+        dataset_id = NUM_DATASETS // 2
+        samples = session.query(Sample.sample_id).filter_by(dataset_id=dataset_id)
+
+        report(
+            f"{'word':<10}{'matches':>10}{'scan page':>12}{'scan count':>12}"
+            f"{'fts page':>12}{'fts count':>12}   (ms)"
+        )
+        for name, rank in QUERY_RANKS.items():
+            scan = samples.filter(Sample.text.like(f"%{word(rank)}%")).order_by(
+                Sample.sample_id
+            )
+            ranked = search.ranked(session, samples, word(rank))
+            matching = search.matching(session, samples, word(rank))
+            matches = matching.count()
+
+            timings = [
+                best_of(scan.limit(PAGE_SIZE).all, repeat),
+                best_of(scan.order_by(None).count, repeat),
+                best_of(ranked.limit(PAGE_SIZE).all, repeat),
+                best_of(matching.count, repeat),
+            ]
+            report(
+                f"{name:<10}{matches:>10,}"
+                + "".join(f"{timing:>12.2f}" for timing in timings)
+            )
+
+        session.close()
+        engine.dispose()
+
+
+def main(argv: List[str] = None) -> None:
+    """Command line entrypoint"""
+
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n", maxsplit=1)[0])
+    parser.add_argument(
+        "--size", type=int, default=1_000_000, help="Total number of samples"
+    )
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per query")
+    args = parser.parse_args(argv)
+
+    print(f"== {args.size:,} samples across {NUM_DATASETS} datasets")
+    benchmark(args.size, args.repeat, print)
+
+
+if __name__ == "__main__":
+    main()
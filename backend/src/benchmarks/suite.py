@@ -0,0 +1,433 @@
+"""
+Benchmark suite timing the API's hot paths, with regression checks against a baseline
+
+Starts the API with uvicorn against a temporary store, and for every size ingests a
+dataset of that many synthetic samples, then measures:
+
+- ingestion throughput, in rows per second
+- `get_samples` latency for the first page, a deep `offset` page and a deep cursor page
+- `label_sample` throughput from concurrent clients, and batch labeling throughput
+- export throughput, in MB per second
+- the duration of a background `delete_dataset`
+
+Results are written as JSON, along with the host and parameters they were measured
+with.  Given a baseline written by an earlier run, every metric is compared with it, and
+the run fails when one is worse by more than the tolerance.  Timings only compare on
+the same host, so when the baseline was measured on another host or backend, or with
+other parameters, regressions are reported without failing the run.
+
+    python -m benchmarks.suite --sizes 10000 1000000 --output results.json \\
+        --baseline benchmarks/baseline.json
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterator, List
+import argparse
+import datetime
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+
+import requests
+
+from .latency import (
+    DATASET_BODY,
+    REQUEST_TIMEOUT,
+    SRC_DIR,
+    percentile,
+    run_server,
+    wait_for_job,
+)
+
+# Samples per page, as requested by the frontend and batch labeling
+PAGE_SIZE = 50
+BATCH_SIZE = 5000
+
+# Bytes read per chunk when streaming uploads and exports
+CHUNK_SIZE = 1024 * 1024
+
+WORDS = ["alpha", "beta", "gamma", "delta", "epsilon", "zeta", "eta", "theta"]
+
+Metrics = Dict[str, float]
+
+# Latencies slower than the baseline by less than this are within a run's jitter
+NOISE_FLOOR_MS = 10
+
+# Fields of the environment that must match the baseline's for timings to compare
+HOST_FIELDS = ["python", "platform", "cpus", "backend"]
+
+
+def write_csv(path: str, num_samples: int) -> None:
+    """Write a CSV of synthetic samples to disk, so large sizes are not held in memory"""
+
+    rng = random.Random(0)
+    with open(path, "w", encoding="utf-8") as output:
+        output.write("id,text\n")
+        for i in range(num_samples):
+            text = " ".join(rng.choice(WORDS) for _ in range(20))
+            output.write(f"{i},{text}\n")
+
+
+def multipart_stream(path: str, boundary: str) -> Iterator[bytes]:
+    """Encode an upload form as a multipart body, reading the file chunk by chunk"""
+
+    for name, value in (("id_field", "id"), ("text_field", "text")):
+        yield (
+            f"--{boundary}\r\n"
+            f'Content-Disposition: form-data; name="{name}"\r\n\r\n{value}\r\n'
+        ).encode()
+
+    yield (
+        f"--{boundary}\r\n"
+        'Content-Disposition: form-data; name="file"; filename="samples.csv"\r\n'
+        "Content-Type: text/csv\r\n\r\n"
+    ).encode()
+    with open(path, "rb") as contents:
+        while True:
+            chunk = contents.read(CHUNK_SIZE)
+            if not chunk:
+                break
+            yield chunk
+    yield f"\r\n--{boundary}--\r\n".encode()
+
+
+def timed_get(session: requests.Session, url: str, params: Dict) -> float:
+    """Milliseconds taken by a GET request"""
+
+    start = time.perf_counter()
+    session.get(url, params=params, timeout=REQUEST_TIMEOUT).raise_for_status()
+    return (time.perf_counter() - start) * 1000
+
+
+def measure_ingestion(base_url: str, dataset_id: int, path: str) -> Metrics:
+    """Upload a CSV and time its ingestion job"""
+
+    boundary = uuid.uuid4().hex
+    start = time.perf_counter()
+    response = requests.post(
+        f"{base_url}/datasets/{dataset_id}/samples",
+        data=multipart_stream(path, boundary),
+        headers={"Content-Type": f"multipart/form-data; boundary={boundary}"},
+        timeout=REQUEST_TIMEOUT,
+    )
+    response.raise_for_status()
+    job_id = response.json()["job_id"]
+    wait_for_job(base_url, job_id)
+    seconds = time.perf_counter() - start
+
+    job = requests.get(f"{base_url}/jobs/{job_id}", timeout=REQUEST_TIMEOUT).json()
+    if job["status"] != "completed":
+        raise RuntimeError(f"Ingestion job {job_id} ended {job['status']}")
+
+    return dict(ingest_rows_per_sec=job["rows_done"] / seconds)
+
+
+def measure_pages(
+    base_url: str, dataset_id: int, num_samples: int, repeat: int
+) -> Metrics:
+    """Time the first page, and a page 90% deep by offset and by cursor"""
+
+    url = f"{base_url}/datasets/{dataset_id}/samples"
+    session = requests.Session()
+    deep = num_samples * 9 // 10
+    cursor = session.get(
+        url, params=dict(offset=deep, limit=1), timeout=REQUEST_TIMEOUT
+    ).json()["metadata"]["pagination"]["next_cursor"]
+
+    pages = dict(
+        shallow=dict(offset=0, limit=PAGE_SIZE),
+        deep_offset=dict(offset=deep, limit=PAGE_SIZE),
+        deep_cursor=dict(after=cursor, limit=PAGE_SIZE),
+    )
+
+    metrics = {}
+    for name, params in pages.items():
+        timed_get(session, url, params)  # Warm up the connection and caches
+        latencies = [timed_get(session, url, params) for _ in range(repeat)]
+        metrics[f"get_samples_{name}_p50_ms"] = statistics.median(latencies)
+        metrics[f"get_samples_{name}_p99_ms"] = percentile(latencies, 0.99)
+
+    return metrics
+
+
+def page_ids(base_url: str, dataset_id: int, count: int) -> Iterator[List[int]]:
+    """Walk the first `count` sample ids of a dataset, a batch at a time"""
+
+    params = dict(limit=min(BATCH_SIZE, count))
+    while count > 0:
+        body = requests.get(
+            f"{base_url}/datasets/{dataset_id}/samples",
+            params=params,
+            timeout=REQUEST_TIMEOUT,
+        ).json()
+        sample_ids = [s["sample_id"] for s in body["samples"]][:count]
+        if not sample_ids:
+            return
+        yield sample_ids
+
+        count -= len(sample_ids)
+        cursor = body["metadata"]["pagination"]["next_cursor"]
+        if cursor is None:
+            return
+        params = dict(limit=min(BATCH_SIZE, count), after=cursor)
+
+
+def measure_labeling(
+    base_url: str, dataset_id: int, num_samples: int, clients: int, fraction: float
+) -> Metrics:
+    """Label samples one by one from concurrent clients, then a fraction in batches"""
+
+    per_client = 200
+    sample_ids = [
+        sample_id
+        for batch in page_ids(base_url, dataset_id, min(clients * per_client, 10_000))
+        for sample_id in batch
+    ]
+
+    def label(ids: List[int]) -> List[float]:
+        session = requests.Session()
+        latencies = []
+        for sample_id in ids:
+            start = time.perf_counter()
+            session.put(
+                f"{base_url}/datasets/{dataset_id}/samples/{sample_id}",
+                json=dict(labels=dict(positive=1)),
+                timeout=REQUEST_TIMEOUT,
+            ).raise_for_status()
+            latencies.append((time.perf_counter() - start) * 1000)
+        return latencies
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=clients) as pool:
+        latencies = [
+            latency
+            for client_latencies in pool.map(
+                label, [sample_ids[i::clients] for i in range(clients)]
+            )
+            for latency in client_latencies
+        ]
+    seconds = time.perf_counter() - start
+
+    metrics = dict(
+        label_sample_per_sec=len(latencies) / seconds,
+        label_sample_p99_ms=percentile(latencies, 0.99),
+    )
+
+    # Label a fraction of the dataset so that exports have rows to write
+    labeled = 0
+    start = time.perf_counter()
+    for batch in page_ids(base_url, dataset_id, int(num_samples * fraction)):
+        requests.put(
+            f"{base_url}/datasets/{dataset_id}/samples:batch",
+            json=dict(samples={sid: {"positive": 0} for sid in batch}),
+            timeout=REQUEST_TIMEOUT,
+        ).raise_for_status()
+        labeled += len(batch)
+    if labeled:
+        metrics["label_batch_rows_per_sec"] = labeled / (time.perf_counter() - start)
+
+    return metrics
+
+
+def measure_exports(base_url: str, dataset_id: int) -> Metrics:
+    """Stream every export format with the samples' text, and time them"""
+
+    metrics = {}
+    for export_format in ("csv", "parquet"):
+        size = 0
+        start = time.perf_counter()
+        with requests.get(
+            f"{base_url}/datasets/{dataset_id}/export",
+            params=dict(format=export_format, include_text=True),
+            stream=True,
+            timeout=REQUEST_TIMEOUT,
+        ) as response:
+            response.raise_for_status()
+            for chunk in response.iter_content(chunk_size=CHUNK_SIZE):
+                size += len(chunk)
+        seconds = time.perf_counter() - start
+        metrics[f"export_{export_format}_mb_per_sec"] = size / 1e6 / seconds
+
+    return metrics
+
+
+def measure_delete(base_url: str, dataset_id: int) -> Metrics:
+    """Time a background delete of the dataset, until its job finishes"""
+
+    start = time.perf_counter()
+    response = requests.delete(
+        f"{base_url}/datasets/{dataset_id}",
+        params=dict(background=True),
+        timeout=REQUEST_TIMEOUT,
+    )
+    response.raise_for_status()
+    wait_for_job(base_url, response.json()["job_id"])
+
+    return dict(delete_dataset_seconds=time.perf_counter() - start)
+
+
+def run_size(base_url: str, num_samples: int, args: argparse.Namespace) -> Metrics:
+    """Run every measurement on a fresh dataset of `num_samples` samples"""
+
+    dataset_id = requests.post(
+        f"{base_url}/datasets", json=DATASET_BODY, timeout=REQUEST_TIMEOUT
+    ).json()["dataset_id"]
+
+    with tempfile.TemporaryDirectory() as csv_dir:
+        path = os.path.join(csv_dir, "samples.csv")
+        write_csv(path, num_samples)
+        metrics = measure_ingestion(base_url, dataset_id, path)
+
+    metrics.update(measure_pages(base_url, dataset_id, num_samples, args.repeat))
+    metrics.update(
+        measure_labeling(
+            base_url, dataset_id, num_samples, args.clients, args.labeled_fraction
+        )
+    )
+    metrics.update(measure_exports(base_url, dataset_id))
+    metrics.update(measure_delete(base_url, dataset_id))
+
+    return metrics
+
+
+def environment(base_url: str, args: argparse.Namespace) -> Dict:
+    """Describe where and how the results were measured, as results only compare on one
+    host with the same parameters"""
+
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=SRC_DIR,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+
+    storage = requests.get(f"{base_url}/admin/storage", timeout=REQUEST_TIMEOUT).json()
+    return dict(
+        date=datetime.datetime.now().isoformat(timespec="seconds"),
+        commit=commit,
+        python=platform.python_version(),
+        platform=platform.platform(),
+        cpus=os.cpu_count(),
+        backend=storage.get("backend"),
+        parameters=dict(
+            clients=args.clients,
+            repeat=args.repeat,
+            labeled_fraction=args.labeled_fraction,
+        ),
+    )
+
+
+def lower_is_better(metric: str) -> bool:
+    """Latencies and durations improve downwards, throughputs upwards"""
+
+    return metric.endswith("_ms") or metric.endswith("_seconds")
+
+
+def mismatches(measured: Dict, baseline: Dict) -> List[str]:
+    """Describe every difference of host or parameters with the baseline's environment"""
+
+    reference = baseline.get("environment", {})
+    return [
+        f"{field}: {measured.get(field)} here, {reference.get(field)} in the baseline"
+        for field in HOST_FIELDS + ["parameters"]
+        if measured.get(field) != reference.get(field)
+    ]
+
+
+def compare(results: Dict, baseline: Dict, tolerance: float) -> List[str]:
+    """Describe every metric worse than in the baseline by more than `tolerance`"""
+
+    regressions = []
+    for size, metrics in results["results"].items():
+        for metric, value in metrics.items():
+            reference = baseline.get("results", {}).get(size, {}).get(metric)
+            if not reference:
+                continue
+
+            if metric.endswith("_ms") and value - reference < NOISE_FLOOR_MS:
+                continue
+            if lower_is_better(metric):
+                change = value / reference - 1
+            else:
+                change = reference / value - 1 if value else float("inf")
+            if change > tolerance:
+                regressions.append(
+                    f"{metric} at {int(size):,} samples: {value:.2f} "
+                    f"vs {reference:.2f} in the baseline ({change:+.0%} worse)"
+                )
+
+    return regressions
+
+
+def main(argv: List[str] = None) -> None:
+    """Command line entrypoint"""
+
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n", maxsplit=1)[0])
+    parser.add_argument(
+        "--sizes", type=int, nargs="+", default=[10_000, 1_000_000, 10_000_000]
+    )
+    parser.add_argument("--clients", type=int, default=8, help="Concurrent labelers")
+    parser.add_argument("--repeat", type=int, default=50, help="Requests per page")
+    parser.add_argument(
+        "--labeled-fraction",
+        type=float,
+        default=0.1,
+        help="Fraction of each dataset batch labeled before exporting",
+    )
+    parser.add_argument("--output", help="Path of the JSON results to write")
+    parser.add_argument("--baseline", help="Path of JSON results to compare with")
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=0.25,
+        help="Relative slowdown of a metric reported as a regression",
+    )
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as lablr_dir, run_server(lablr_dir) as base_url:
+        results = dict(environment=environment(base_url, args), results={})
+        for num_samples in args.sizes:
+            print(f"Benchmarking {num_samples:,} samples...")
+            metrics = run_size(base_url, num_samples, args)
+            results["results"][str(num_samples)] = metrics
+            for metric, value in metrics.items():
+                print(f"  {metric:<36}{value:>14.2f}")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as output:
+            json.dump(results, output, indent=2)
+            output.write("\n")
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as baseline_file:
+            baseline = json.load(baseline_file)
+
+        regressions = compare(results, baseline, args.tolerance)
+        for regression in regressions:
+            print(f"Regression: {regression}")
+        if not regressions:
+            print(f"No regression beyond {args.tolerance:.0%} of the baseline")
+            return
+
+        differences = mismatches(results["environment"], baseline)
+        if differences:
+            print("Not failing, as the baseline was measured differently:")
+            for difference in differences:
+                print(f"  {difference}")
+            return
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
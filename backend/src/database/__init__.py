@@ -2,20 +2,41 @@
 Initialize SQLAlchemy engine, session, and base model
 """
 
-import os
-
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import make_url
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import QueuePool
 
+from util import config
+from . import storage, writer
 
-SQLALCHEMY_DATABASE_URL = f"sqlite:///{os.environ.get('HOME')}/.lablr/store.db"
+SQLALCHEMY_DATABASE_URL = config.DATABASE_URL
+IS_SQLITE = make_url(SQLALCHEMY_DATABASE_URL).get_backend_name() == "sqlite"
 
 
 engine = create_engine(
     SQLALCHEMY_DATABASE_URL,
-    connect_args={"check_same_thread": False},  # SQLite only
+    connect_args={"check_same_thread": False} if IS_SQLITE else {},
+    poolclass=QueuePool,
+    pool_size=config.DB_POOL_SIZE,
+    max_overflow=config.DB_MAX_OVERFLOW,
+    pool_timeout=config.DB_POOL_TIMEOUT,
+    # Server connections can be closed under the pool, e.g. by a database restart
+    pool_pre_ping=not IS_SQLITE,
 )
+
+# A database server handles concurrent writers itself, a SQLite file does not
+write_lock = None
+if IS_SQLITE:
+    event.listen(engine, "connect", storage.apply_pragmas)
+
+    # Write transactions from every thread and worker process are applied one at a time
+    write_lock = writer.WriteLock(
+        f"{config.LABLR_DIR}/store.db.lock", timeout=config.WRITE_LOCK_TIMEOUT
+    )
+    writer.install(engine, write_lock)
+
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
 Base = declarative_base()
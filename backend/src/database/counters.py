@@ -0,0 +1,49 @@
+"""
+Maintain the per-dataset sample and label counters stored on the Dataset model
+"""
+
+from typing import Union
+
+from sqlalchemy import func, select, update
+from sqlalchemy.engine import Connection
+from sqlalchemy.orm import Session
+
+from .dataset import Dataset
+from .sample import Sample
+
+
+def increment(
+    db_session: Union[Session, Connection],
+    dataset_id: int,
+    samples: int = 0,
+    labeled: int = 0,
+) -> None:
+    """Atomically adjust a dataset's counters as part of the caller's transaction"""
+
+    if not samples and not labeled:
+        return
+
+    db_session.execute(
+        update(Dataset)
+        .where(Dataset.dataset_id == dataset_id)
+        .values(
+            sample_count=Dataset.sample_count + samples,
+            labeled_count=Dataset.labeled_count + labeled,
+        )
+    )
+
+
+def recount(db_session: Union[Session, Connection], dataset_id: int) -> dict:
+    """Recompute a dataset's counters from the samples table"""
+
+    base = select(func.count()).where(Sample.dataset_id == dataset_id)
+    sample_count = db_session.execute(base).scalar()
+    labeled_count = db_session.execute(base.where(Sample.is_labeled.is_(True))).scalar()
+
+    db_session.execute(
+        update(Dataset)
+        .where(Dataset.dataset_id == dataset_id)
+        .values(sample_count=sample_count, labeled_count=labeled_count)
+    )
+
+    return dict(sample_count=sample_count, labeled_count=labeled_count)
@@ -6,6 +6,7 @@ from sqlalchemy import Column, Integer, String, DateTime
 from sqlalchemy.orm import relationship
 
 from . import Base
+from .types import Id
 
 
 class Dataset(Base):
@@ -13,10 +14,18 @@ class Dataset(Base):
 
     __tablename__ = "datasets"
 
-    dataset_id = Column(Integer, primary_key=True, index=True)
+    # SQLite would otherwise reuse the id of the last deleted dataset, which other
+    # processes may still have in their caches
+    __table_args__ = dict(sqlite_autoincrement=True)
+
+    dataset_id = Column(Id, primary_key=True, index=True)
     name = Column(String)
     description = Column(String)
     created_at = Column(DateTime)
 
+    # Counters maintained in the same transaction as every sample write
+    sample_count = Column(Integer, nullable=False, default=0, server_default="0")
+    labeled_count = Column(Integer, nullable=False, default=0, server_default="0")
+
     labels = relationship("LabelDefinition", back_populates="dataset")
     samples = relationship("Sample", back_populates="dataset")
@@ -0,0 +1,84 @@
+"""
+Declare the SQLAlchemy model for the Job data object
+"""
+
+from typing import List, Union
+from datetime import datetime, timedelta
+
+from sqlalchemy import Column, Integer, Float, String, DateTime, JSON, ForeignKey
+from sqlalchemy import or_, select, update
+from sqlalchemy.engine import Connection
+from sqlalchemy.orm import Session
+
+from util.constants import JobStatus
+from . import Base
+from .types import Id
+
+
+class Job(Base):
+    """SQLAlchemy model for the Job data object"""
+
+    __tablename__ = "jobs"
+
+    job_id = Column(Id, primary_key=True, index=True)
+    # Detached (set to null) once a delete job has removed its dataset
+    dataset_id = Column(
+        Id, ForeignKey("datasets.dataset_id"), index=True, nullable=True
+    )
+
+    kind = Column(String)
+    status = Column(String)
+    params = Column(JSON)
+
+    # Progress, checkpointed together with each committed batch
+    rows_done = Column(Integer, default=0)
+    bytes_done = Column(Integer, default=0)
+    bytes_total = Column(Integer, default=0)
+    rows_per_second = Column(Float, default=0.0)
+    eta_seconds = Column(Float, nullable=True)
+    errors = Column(JSON, default=list)
+    stats = Column(JSON, default=dict)
+
+    created_at = Column(DateTime)
+    started_at = Column(DateTime, nullable=True)
+    updated_at = Column(DateTime, nullable=True)
+    finished_at = Column(DateTime, nullable=True)
+
+    # Refreshed by the process running the job, see `jobs.start_heartbeat`
+    heartbeat_at = Column(DateTime, nullable=True)
+
+
+def requeue_stale(
+    db_session: Union[Session, Connection], stale_seconds: float
+) -> List[int]:
+    """Hand back to the queue the running jobs whose process stopped beating
+
+    Each job is requeued with a conditional update, so when several processes look
+    for stale jobs at once, only one of them gets it.  Returns the ids of the jobs
+    requeued by this call.  Jobs claimed before heartbeats were recorded have none
+    and count as stale.
+    """
+
+    cutoff = datetime.now() - timedelta(seconds=stale_seconds)
+    stale = or_(Job.heartbeat_at.is_(None), Job.heartbeat_at < cutoff)
+
+    job_ids = (
+        db_session.execute(
+            select(Job.job_id).where(Job.status == JobStatus.RUNNING, stale)
+        )
+        .scalars()
+        .all()
+    )
+
+    requeued = []
+    for job_id in job_ids:
+        statement = (
+            update(Job)
+            .where(Job.job_id == job_id, Job.status == JobStatus.RUNNING, stale)
+            .values(status=JobStatus.PENDING, updated_at=datetime.now())
+            .execution_options(synchronize_session=False)
+        )
+        if db_session.execute(statement).rowcount:
+            requeued.append(job_id)
+
+    return requeued
@@ -2,10 +2,11 @@
 Declare the SQLAlchemy model for the LabelDefinition data object
 """
 
-from sqlalchemy import Column, Integer, Float, String, ForeignKey
+from sqlalchemy import Column, Float, String, ForeignKey
 from sqlalchemy.orm import relationship
 
 from . import Base
+from .types import Id
 
 
 class LabelDefinition(Base):
@@ -13,8 +14,8 @@ class LabelDefinition(Base):
 
     __tablename__ = "label_definitions"
 
-    label_definition_id = Column(Integer, primary_key=True, index=True)
-    dataset_id = Column(Integer, ForeignKey("datasets.dataset_id"))
+    label_definition_id = Column(Id, primary_key=True, index=True)
+    dataset_id = Column(Id, ForeignKey("datasets.dataset_id"))
 
     name = Column(String)
     variant = Column(String)
@@ -0,0 +1,159 @@
+"""
+Declare the SQLAlchemy model of label statistics, and maintain them incrementally
+
+Every label definition of a dataset has a row per histogram bin, counting the values
+that fall in it and their sum.  Boolean labels have the bins 0 and 1, and numerical
+labels a bin per `interval` step from their `minimum`, holding the values nearest to
+it.  Labeling a sample subtracts its previous labels from the bins and adds the new
+ones in the same transaction, so the statistics never need a scan of the samples.
+"""
+
+from typing import Dict, Iterable, Mapping, Optional, Tuple, Union
+
+from sqlalchemy import Column, Float, ForeignKey, Integer, delete, func, select
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.engine import Connection
+from sqlalchemy.orm import Session
+
+from util.constants import LabelVariants
+from . import Base
+from .label_definition import LabelDefinition
+from .sample_label import SampleLabel
+from .types import Id
+
+# (label_definition_id, bin) -> (count, sum of values)
+Deltas = Dict[Tuple[int, int], Tuple[int, float]]
+
+# Label values of a sample, keyed by label definition id, before and after a change
+LabelChange = Tuple[Optional[Mapping[int, float]], Optional[Mapping[int, float]]]
+
+
+class LabelStat(Base):
+    """SQLAlchemy model for the values of a label falling in one histogram bin"""
+
+    __tablename__ = "label_stats"
+
+    dataset_id = Column(Id, ForeignKey("datasets.dataset_id"), primary_key=True)
+    label_definition_id = Column(
+        Id, ForeignKey("label_definitions.label_definition_id"), primary_key=True
+    )
+    bin = Column(Integer, primary_key=True, autoincrement=False)
+
+    count = Column(Integer, nullable=False, default=0, server_default="0")
+    value_sum = Column(Float, nullable=False, default=0.0, server_default="0")
+
+
+def bin_of(definition, value: float) -> int:
+    """Histogram bin of a label value, given its definition or validation rule"""
+
+    if definition.variant == LabelVariants.BOOLEAN:
+        return int(value)
+    if not definition.interval or definition.interval <= 0:
+        return 0
+    return round((value - definition.minimum) / definition.interval)
+
+
+def _add(deltas: Deltas, definitions: Mapping, values, sign: int) -> None:
+    for definition_id, value in (values or {}).items():
+        definition = definitions.get(definition_id)
+        if definition is None:
+            continue
+
+        key = (definition_id, bin_of(definition, value))
+        count, value_sum = deltas.get(key, (0, 0.0))
+        deltas[key] = (count + sign, value_sum + sign * value)
+
+
+def _apply(
+    db_session: Union[Session, Connection], dataset_id: int, deltas: Deltas
+) -> None:
+    rows = [
+        dict(
+            dataset_id=dataset_id,
+            label_definition_id=definition_id,
+            bin=bin_index,
+            count=count,
+            value_sum=value_sum,
+        )
+        for (definition_id, bin_index), (count, value_sum) in sorted(deltas.items())
+        if count or value_sum
+    ]
+    if not rows:
+        return
+
+    bind = db_session.get_bind() if isinstance(db_session, Session) else db_session
+    dialect = postgresql if bind.dialect.name == "postgresql" else sqlite
+
+    # Rows are upserted in key order, so that concurrent transactions on a database
+    # server lock them in the same order and do not deadlock
+    table = LabelStat.__table__
+    statement = dialect.insert(table)
+    statement = statement.on_conflict_do_update(
+        index_elements=["dataset_id", "label_definition_id", "bin"],
+        set_=dict(
+            count=table.c.count + statement.excluded["count"],
+            value_sum=table.c.value_sum + statement.excluded["value_sum"],
+        ),
+    )
+    db_session.execute(statement, rows)
+
+
+def update(
+    db_session: Session,
+    dataset_id: int,
+    definitions: Iterable,
+    changes: Iterable[LabelChange],
+) -> None:
+    """Move the label values of relabeled samples to their new bins, in the caller's
+    transaction
+
+    `definitions` are the dataset's label definitions (or validation rules).  The
+    previous values must be read with the samples locked, after their update began.
+    """
+
+    by_id = {definition.label_definition_id: definition for definition in definitions}
+    deltas: Deltas = {}
+    for old_values, new_values in changes:
+        _add(deltas, by_id, old_values, -1)
+        _add(deltas, by_id, new_values, 1)
+    _apply(db_session, dataset_id, deltas)
+
+
+def recompute(db_session: Union[Session, Connection], dataset_id: int) -> None:
+    """Rebuild a dataset's statistics from the label values of its samples
+
+    Values are counted per distinct value by a scan of the `(label_definition_id,
+    value)` index, then binned."""
+
+    definitions = {
+        definition.label_definition_id: definition
+        for definition in db_session.execute(
+            select(
+                LabelDefinition.label_definition_id,
+                LabelDefinition.variant,
+                LabelDefinition.minimum,
+                LabelDefinition.interval,
+            ).where(LabelDefinition.dataset_id == dataset_id)
+        )
+    }
+
+    db_session.execute(delete(LabelStat).where(LabelStat.dataset_id == dataset_id))
+
+    deltas: Deltas = {}
+    counted = db_session.execute(
+        select(SampleLabel.label_definition_id, SampleLabel.value, func.count())
+        .where(SampleLabel.label_definition_id.in_(list(definitions)))
+        .group_by(SampleLabel.label_definition_id, SampleLabel.value)
+    )
+    for definition_id, value, count in counted:
+        key = (definition_id, bin_of(definitions[definition_id], value))
+        total, value_sum = deltas.get(key, (0, 0.0))
+        deltas[key] = (total + count, value_sum + count * value)
+
+    _apply(db_session, dataset_id, deltas)
+
+
+def delete_dataset(db_session: Union[Session, Connection], dataset_id: int) -> None:
+    """Delete the statistics of a dataset, before its label definitions"""
+
+    db_session.execute(delete(LabelStat).where(LabelStat.dataset_id == dataset_id))
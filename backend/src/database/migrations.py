@@ -0,0 +1,296 @@
+"""
+Idempotent schema migrations for stores created by older versions of the application
+
+`Base.metadata.create_all` only creates missing tables, so columns and indexes added
+to existing tables are brought up to date here.  Every migration checks the current
+schema before changing it, so they are safe to run on every startup.
+"""
+
+from typing import Callable, List
+import logging
+
+from sqlalchemy import Column, inspect, select, text
+from sqlalchemy.engine import Connection, Engine
+from sqlalchemy.schema import CreateTable
+
+from . import counters, label_stats
+from .dataset import Dataset
+from .job import Job
+from .sample import Sample
+
+logger = logging.getLogger(__name__)
+
+
+def _columns(connection: Connection, table: str) -> List[str]:
+    return [column["name"] for column in inspect(connection).get_columns(table)]
+
+
+def _add_column(connection: Connection, table: str, column: Column) -> None:
+    ddl = (
+        f"ALTER TABLE {table} ADD COLUMN {column.name} "
+        f"{column.type.compile(dialect=connection.dialect)}"
+    )
+
+    # Existing rows take the server default, so the column can be NOT NULL
+    if column.server_default is not None:
+        default = column.server_default.arg
+        if not isinstance(default, str):
+            default = default.compile(dialect=connection.dialect)
+        ddl += f" DEFAULT {default}"
+        if not column.nullable:
+            ddl += " NOT NULL"
+
+    connection.execute(text(ddl))
+
+
+def _create_indexes(connection: Connection, *names: str) -> None:
+    for index in Sample.__table__.indexes:
+        if index.name in names:
+            index.create(connection, checkfirst=True)
+
+
+def add_dataset_counters(connection: Connection) -> None:
+    """Add the `sample_count` and `labeled_count` columns and backfill them
+
+    Datasets counting no samples while they have some are recounted on every run, so
+    a store whose backfill failed after its columns were added is repaired too.
+    Requires the `is_labeled` column of samples."""
+
+    existing = _columns(connection, "datasets")
+    for column in ("sample_count", "labeled_count"):
+        if column not in existing:
+            connection.execute(
+                text(
+                    f"ALTER TABLE datasets ADD COLUMN {column} "
+                    "INTEGER NOT NULL DEFAULT 0"
+                )
+            )
+
+    dataset_ids = connection.execute(
+        text(
+            "SELECT d.dataset_id FROM datasets AS d WHERE d.sample_count = 0 "
+            "AND EXISTS (SELECT 1 FROM samples AS s WHERE s.dataset_id = d.dataset_id)"
+        )
+    )
+    for (dataset_id,) in dataset_ids.fetchall():
+        counters.recount(connection, dataset_id)
+
+
+def add_sample_labeled_state(connection: Connection) -> None:
+    """Materialize the labeled state of samples and add the composite indexes"""
+
+    if "is_labeled" not in _columns(connection, "samples"):
+        connection.execute(
+            text("ALTER TABLE samples ADD COLUMN is_labeled BOOLEAN NOT NULL DEFAULT 0")
+        )
+        connection.execute(
+            text("UPDATE samples SET is_labeled = 1 WHERE labels IS NOT NULL")
+        )
+
+    _create_indexes(
+        connection,
+        "ix_samples_dataset_sample",
+        "ix_samples_dataset_labeled",
+        "ix_samples_dataset_save_for_later",
+    )
+
+
+def add_sample_leases(connection: Connection) -> None:
+    """Add the work queue's lease columns to samples"""
+
+    existing = _columns(connection, "samples")
+    for column in (Sample.__table__.c.leased_by, Sample.__table__.c.leased_until):
+        if column.name not in existing:
+            _add_column(connection, "samples", column)
+
+    _create_indexes(connection, "ix_samples_dataset_leased_by")
+
+
+def add_labels_gin_index(connection: Connection) -> None:
+    """Index the labels of samples for containment and key queries on PostgreSQL"""
+
+    # The labels column is gone once they are normalized, see `normalize_sample_labels`
+    if connection.dialect.name != "postgresql" or "labels" not in _columns(
+        connection, "samples"
+    ):
+        return
+
+    connection.execute(
+        text(
+            "CREATE INDEX IF NOT EXISTS ix_samples_labels_gin ON samples USING gin (labels)"
+        )
+    )
+
+
+# External content FTS5 table over `samples.text`, kept in sync by triggers
+SAMPLES_FTS_DDL = (
+    "CREATE VIRTUAL TABLE IF NOT EXISTS samples_fts "
+    "USING fts5(text, content='samples', content_rowid='sample_id')",
+    "CREATE TRIGGER IF NOT EXISTS samples_fts_insert AFTER INSERT ON samples BEGIN "
+    "INSERT INTO samples_fts (rowid, text) VALUES (new.sample_id, new.text); END",
+    "CREATE TRIGGER IF NOT EXISTS samples_fts_delete AFTER DELETE ON samples BEGIN "
+    "INSERT INTO samples_fts (samples_fts, rowid, text) "
+    "VALUES ('delete', old.sample_id, old.text); END",
+    "CREATE TRIGGER IF NOT EXISTS samples_fts_update AFTER UPDATE OF text ON samples "
+    "BEGIN INSERT INTO samples_fts (samples_fts, rowid, text) "
+    "VALUES ('delete', old.sample_id, old.text); "
+    "INSERT INTO samples_fts (rowid, text) VALUES (new.sample_id, new.text); END",
+)
+
+
+def add_samples_fts(connection: Connection) -> None:
+    """Index the text of samples for full-text search, see `util.search`"""
+
+    if connection.dialect.name == "postgresql":
+        connection.execute(
+            text(
+                "CREATE INDEX IF NOT EXISTS ix_samples_text_fts ON samples "
+                "USING gin (to_tsvector('simple', text))"
+            )
+        )
+        return
+
+    if connection.dialect.name != "sqlite":
+        return
+
+    created = not inspect(connection).has_table("samples_fts")
+    for statement in SAMPLES_FTS_DDL:
+        connection.execute(text(statement))
+
+    # Samples stored before the table existed are indexed once
+    if created:
+        connection.execute(
+            text("INSERT INTO samples_fts (samples_fts) VALUES ('rebuild')")
+        )
+
+
+def add_sample_clusters(connection: Connection) -> None:
+    """Add the near-duplicate clusters of samples and the statistics of jobs"""
+
+    existing = _columns(connection, "samples")
+    for column in (Sample.__table__.c.cluster_id, Sample.__table__.c.is_duplicate):
+        if column.name not in existing:
+            _add_column(connection, "samples", column)
+
+    if "stats" not in _columns(connection, "jobs"):
+        _add_column(connection, "jobs", Job.__table__.c.stats)
+
+    _create_indexes(connection, "ix_samples_dataset_cluster")
+
+
+def add_sample_uncertainty(connection: Connection) -> None:
+    """Add the uncertainty of samples for the active learning queue order"""
+
+    if "uncertainty" not in _columns(connection, "samples"):
+        _add_column(connection, "samples", Sample.__table__.c.uncertainty)
+
+    _create_indexes(connection, "ix_samples_dataset_uncertainty")
+
+
+def add_job_heartbeats(connection: Connection) -> None:
+    """Add the heartbeat of running jobs"""
+
+    if "heartbeat_at" not in _columns(connection, "jobs"):
+        _add_column(connection, "jobs", Job.__table__.c.heartbeat_at)
+
+
+def add_dataset_autoincrement(connection: Connection) -> None:
+    """Stop SQLite from reusing the ids of deleted datasets
+
+    SQLite only honours `AUTOINCREMENT` from a table's creation, so the table is
+    copied into a new one declared with it, which then replaces it.  Foreign keys are
+    not enforced, so the tables referencing datasets are left untouched."""
+
+    if connection.dialect.name != "sqlite":
+        return
+
+    ddl = connection.execute(
+        text("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = 'datasets'")
+    ).scalar()
+    if "AUTOINCREMENT" in ddl.upper():
+        return
+
+    table = Dataset.__table__
+    create = str(CreateTable(table).compile(dialect=connection.dialect))
+    connection.execute(text(create.replace("datasets", "datasets_new", 1)))
+
+    columns = ", ".join(column.name for column in table.columns)
+    connection.execute(
+        text(f"INSERT INTO datasets_new ({columns}) SELECT {columns} FROM datasets")
+    )
+    connection.execute(text("DROP TABLE datasets"))
+    connection.execute(text("ALTER TABLE datasets_new RENAME TO datasets"))
+    for index in table.indexes:
+        index.create(connection, checkfirst=True)
+
+
+# Rows of `sample_labels` for every labeled key of the JSON labels of samples
+NORMALIZE_LABELS_SQL = {
+    "sqlite": "INSERT INTO sample_labels (sample_id, label_definition_id, value) "
+    "SELECT s.sample_id, d.label_definition_id, CAST(j.value AS REAL) "
+    "FROM samples AS s, json_each(s.labels) AS j "
+    "JOIN label_definitions AS d ON d.dataset_id = s.dataset_id AND d.name = j.key "
+    "WHERE s.labels IS NOT NULL ON CONFLICT DO NOTHING",
+    "postgresql": "INSERT INTO sample_labels (sample_id, label_definition_id, value) "
+    "SELECT s.sample_id, d.label_definition_id, CAST(j.value AS DOUBLE PRECISION) "
+    "FROM samples AS s CROSS JOIN LATERAL jsonb_each_text("
+    "CASE WHEN jsonb_typeof(s.labels) = 'object' THEN s.labels END) AS j "
+    "JOIN label_definitions AS d ON d.dataset_id = s.dataset_id AND d.name = j.key "
+    "ON CONFLICT DO NOTHING",
+}
+
+
+# First SQLite version supporting `ALTER TABLE ... DROP COLUMN`
+SQLITE_DROP_COLUMN = (3, 35, 0)
+
+
+def normalize_sample_labels(connection: Connection) -> None:
+    """Move the JSON labels of samples into the `sample_labels` table"""
+
+    if "labels" not in _columns(connection, "samples"):
+        return
+
+    connection.execute(text(NORMALIZE_LABELS_SQL[connection.dialect.name]))
+
+    # Older SQLite versions cannot drop columns, so the column is emptied instead,
+    # which makes the migration a no-op from then on
+    dialect = connection.dialect
+    if dialect.name == "sqlite" and dialect.server_version_info < SQLITE_DROP_COLUMN:
+        connection.execute(text("UPDATE samples SET labels = NULL"))
+    else:
+        connection.execute(text("ALTER TABLE samples DROP COLUMN labels"))
+
+
+def backfill_label_stats(connection: Connection) -> None:
+    """Compute the label statistics of datasets labeled before they were maintained"""
+
+    if connection.execute(select(label_stats.LabelStat).limit(1)).first():
+        return
+
+    labeled = select(Sample.dataset_id).where(Sample.is_labeled.is_(True)).distinct()
+    for (dataset_id,) in connection.execute(labeled).fetchall():
+        label_stats.recompute(connection, dataset_id)
+
+
+MIGRATIONS: List[Callable[[Connection], None]] = [
+    add_sample_labeled_state,
+    add_dataset_counters,
+    add_labels_gin_index,
+    add_sample_leases,
+    add_samples_fts,
+    add_sample_clusters,
+    normalize_sample_labels,
+    backfill_label_stats,
+    add_sample_uncertainty,
+    add_job_heartbeats,
+    add_dataset_autoincrement,
+]
+
+
+def run_migrations(engine: Engine) -> None:
+    """Apply every pending migration in order, each in its own transaction"""
+
+    for migration in MIGRATIONS:
+        with engine.begin() as connection:
+            logger.debug(f"Checking migration `{migration.__name__}`")
+            migration(connection)
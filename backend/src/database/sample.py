@@ -2,23 +2,77 @@
 Declare the SQLAlchemy model for the Sample data object
 """
 
-from sqlalchemy import Column, Integer, String, Boolean, JSON, ForeignKey
+from typing import Dict, Optional
+
+from sqlalchemy import (
+    Column,
+    String,
+    Boolean,
+    DateTime,
+    Float,
+    ForeignKey,
+    Index,
+    false,
+)
 from sqlalchemy.orm import relationship
 
 from . import Base
+from .sample_label import SampleLabel
+from .types import Id
 
 
 class Sample(Base):
     """SQLAlchemy model for the Sample data object"""
 
     __tablename__ = "samples"
+    __table_args__ = (
+        Index("ix_samples_dataset_sample", "dataset_id", "sample_id"),
+        Index("ix_samples_dataset_labeled", "dataset_id", "is_labeled", "sample_id"),
+        Index("ix_samples_dataset_save_for_later", "dataset_id", "save_for_later"),
+        Index("ix_samples_dataset_leased_by", "dataset_id", "leased_by"),
+        Index("ix_samples_dataset_cluster", "dataset_id", "cluster_id"),
+    )
 
-    sample_id = Column(Integer, primary_key=True, index=True)
-    dataset_id = Column(Integer, ForeignKey("datasets.dataset_id"))
+    sample_id = Column(Id, primary_key=True, index=True)
+    dataset_id = Column(Id, ForeignKey("datasets.dataset_id"))
 
     original_id = Column(String)
     text = Column(String)
-    labels = Column(JSON, nullable=True)
+    is_labeled = Column(Boolean, nullable=False, default=False, server_default=false())
     save_for_later = Column(Boolean, default=False)
 
+    # Near-duplicates linked at ingestion share a cluster, whose labels spread to all
+    # of its samples.  Only the cluster's canonical sample is not a duplicate.
+    cluster_id = Column(String, nullable=True)
+    is_duplicate = Column(
+        Boolean, nullable=False, default=False, server_default=false()
+    )
+
+    # Uncertainty of the dataset's scorer about the sample, see `scoring`.  Samples
+    # are fully uncertain until first scored, so they are served in insertion order.
+    uncertainty = Column(Float, nullable=False, default=1.0, server_default="1")
+
+    # Lease handed out by the work queue, see `util.work_queue`
+    leased_by = Column(String, nullable=True)
+    leased_until = Column(DateTime, nullable=True)
+
     dataset = relationship("Dataset", back_populates="samples")
+    label_values = relationship(SampleLabel, order_by=SampleLabel.label_definition_id)
+
+    @property
+    def labels(self) -> Optional[Dict[str, float]]:
+        """Values of the sample's labels keyed by name, None until it is labeled"""
+
+        if not self.is_labeled:
+            return None
+        return {value.definition.name: value.value for value in self.label_values}
+
+
+# Unlabeled samples are handed out from the most uncertain, ties in insertion order
+Index(
+    "ix_samples_dataset_uncertainty",
+    Sample.dataset_id,
+    Sample.is_labeled,
+    Sample.uncertainty.desc(),
+    Sample.sample_id,
+)
@@ -0,0 +1,75 @@
+"""
+Declare the SQLAlchemy model for the SampleLabel data object, and write label values
+
+Every label value of a sample is a typed row keyed by the sample and the label's
+definition.  The `(label_definition_id, value)` index turns filters on a label's
+value into range scans, and aggregates read values without decoding any JSON.
+"""
+
+from typing import Dict, Iterable, Mapping
+
+from sqlalchemy import Column, Float, ForeignKey, Index, delete, select
+from sqlalchemy.orm import Session, relationship
+
+from util.chunks import chunks
+from . import Base
+from .types import Id
+
+# Label values of samples keyed by sample id, then by label definition id
+LabelValues = Dict[int, Dict[int, float]]
+
+
+class SampleLabel(Base):
+    """SQLAlchemy model for the value of one label of a sample"""
+
+    __tablename__ = "sample_labels"
+    __table_args__ = (
+        Index(
+            "ix_sample_labels_definition_value",
+            "label_definition_id",
+            "value",
+            "sample_id",
+        ),
+    )
+
+    sample_id = Column(Id, ForeignKey("samples.sample_id"), primary_key=True)
+    label_definition_id = Column(
+        Id, ForeignKey("label_definitions.label_definition_id"), primary_key=True
+    )
+    value = Column(Float, nullable=False)
+
+    definition = relationship("LabelDefinition", lazy="joined")
+
+
+def read(db_session: Session, sample_ids: Iterable[int]) -> LabelValues:
+    """Label values of samples, omitting samples without any"""
+
+    values: LabelValues = {}
+    for chunk in chunks(sorted(sample_ids)):
+        rows = db_session.execute(
+            select(
+                SampleLabel.sample_id,
+                SampleLabel.label_definition_id,
+                SampleLabel.value,
+            ).where(SampleLabel.sample_id.in_(chunk))
+        )
+        for sample_id, label_definition_id, value in rows:
+            values.setdefault(sample_id, {})[label_definition_id] = value
+
+    return values
+
+
+def replace(db_session: Session, values: Mapping[int, Mapping[int, float]]) -> None:
+    """Replace every label value of the given samples, in the caller's transaction"""
+
+    sample_ids = sorted(values)
+    for chunk in chunks(sample_ids):
+        db_session.execute(delete(SampleLabel).where(SampleLabel.sample_id.in_(chunk)))
+
+    rows = [
+        dict(sample_id=sample_id, label_definition_id=definition_id, value=value)
+        for sample_id in sample_ids
+        for definition_id, value in values[sample_id].items()
+    ]
+    if rows:
+        db_session.execute(SampleLabel.__table__.insert(), rows)
@@ -0,0 +1,49 @@
+"""
+One-time preparation of the store before any request or job is served
+"""
+
+import fcntl
+import logging
+import os
+
+from util import config
+from . import Base, engine
+from .job import requeue_stale
+from .migrations import run_migrations
+
+# Importing the models registers their tables on `Base.metadata`
+from . import dataset, label_definition, sample  # pylint: disable=unused-import
+from . import label_stats  # pylint: disable=unused-import
+
+logger = logging.getLogger(__name__)
+
+
+def prepare_store() -> None:
+    """Create directories and tables, migrate the schema and requeue interrupted jobs
+
+    A file lock makes concurrent callers take turns, and every step is idempotent.
+    Only jobs whose heartbeat is stale are requeued, so a process starting while
+    others run jobs leaves their jobs alone.
+    """
+
+    for directory in (config.LABLR_DIR, config.UPLOADS_DIR):
+        os.makedirs(directory, exist_ok=True)
+
+    with open(
+        os.path.join(config.LABLR_DIR, "setup.lock"), "w", encoding="utf-8"
+    ) as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            Base.metadata.create_all(bind=engine)
+            run_migrations(engine)
+
+            # Jobs left running by a stopped process are handed back to the queue
+            with engine.begin() as connection:
+                requeued = requeue_stale(connection, config.JOB_STALE_SECONDS)
+            if requeued:
+                logger.info(f"Re-queued {len(requeued)} interrupted job(s)")
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    # Connections must not be shared with processes forked after this point
+    engine.dispose()
@@ -0,0 +1,93 @@
+"""
+SQLite storage profiles applied to every new database connection
+
+A profile is a set of PRAGMA statements.  The active profile is selected with the
+`LABLR_STORAGE_PROFILE` environment variable, and any single pragma can be overridden
+with `LABLR_SQLITE_<PRAGMA>`, e.g. `LABLR_SQLITE_SYNCHRONOUS=FULL`.
+"""
+
+from typing import Dict
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+STORAGE_PROFILES: Dict[str, Dict[str, str]] = {
+    # SQLite's own defaults: rollback journal and a full fsync on every commit
+    "default": {},
+    # Readers never block the writer, and commits only fsync at WAL checkpoints
+    "balanced": {
+        "journal_mode": "WAL",
+        "synchronous": "NORMAL",
+        "busy_timeout": "5000",
+        "cache_size": str(-64 * 1024),  # Negative values are in KiB, i.e. 64 MiB
+        "mmap_size": str(256 * 1024 * 1024),
+        "temp_store": "MEMORY",
+    },
+    # Same concurrency as `balanced`, but every commit is durable on power loss
+    "durable": {
+        "journal_mode": "WAL",
+        "synchronous": "FULL",
+        "busy_timeout": "5000",
+        "cache_size": str(-64 * 1024),
+        "mmap_size": str(256 * 1024 * 1024),
+        "temp_store": "MEMORY",
+    },
+}
+
+# Pragmas reported by the diagnostics endpoint, whether or not a profile sets them
+REPORTED_PRAGMAS = (
+    "journal_mode",
+    "synchronous",
+    "busy_timeout",
+    "cache_size",
+    "mmap_size",
+    "temp_store",
+)
+
+PROFILE_NAME = os.environ.get("LABLR_STORAGE_PROFILE", "balanced")
+
+
+def get_pragmas() -> Dict[str, str]:
+    """Pragmas of the active profile, with environment overrides applied"""
+
+    if PROFILE_NAME not in STORAGE_PROFILES:
+        raise ValueError(
+            f"Storage profile `{PROFILE_NAME}` must be one of {tuple(STORAGE_PROFILES)}"
+        )
+
+    pragmas = dict(STORAGE_PROFILES[PROFILE_NAME])
+    for pragma in REPORTED_PRAGMAS:
+        override = os.environ.get(f"LABLR_SQLITE_{pragma.upper()}")
+        if override is not None:
+            pragmas[pragma] = override
+
+    return pragmas
+
+
+PRAGMAS = get_pragmas()
+
+
+def apply_pragmas(dbapi_connection, _connection_record=None) -> None:
+    """Engine `connect` event listener that applies the profile to a new connection"""
+
+    cursor = dbapi_connection.cursor()
+    try:
+        for pragma, value in PRAGMAS.items():
+            cursor.execute(f"PRAGMA {pragma}={value}")
+    finally:
+        cursor.close()
+
+
+def effective_pragmas(dbapi_connection) -> Dict[str, str]:
+    """Read back the values SQLite is actually using on a connection"""
+
+    cursor = dbapi_connection.cursor()
+    try:
+        values = {}
+        for pragma in REPORTED_PRAGMAS:
+            cursor.execute(f"PRAGMA {pragma}")
+            values[pragma] = str(cursor.fetchone()[0])
+        return values
+    finally:
+        cursor.close()
@@ -0,0 +1,26 @@
+"""
+Column types shared by the models
+"""
+
+from sqlalchemy import Integer
+from sqlalchemy.types import TypeDecorator
+
+
+class Id(TypeDecorator):  # pylint: disable=abstract-method,too-many-ancestors
+    """Integer primary or foreign key that tolerates malformed ids taken from a URL
+
+    SQLite compares an integer column with any string, but PostgreSQL rejects the
+    query.  A value that is not an integer is bound as NULL instead, which matches
+    no row, so lookups of malformed ids behave like lookups of missing ones.
+    """
+
+    impl = Integer
+    cache_ok = True
+
+    def process_bind_param(self, value, dialect):
+        if value is None or isinstance(value, int):
+            return value
+        try:
+            return int(value)
+        except (TypeError, ValueError):
+            return None
@@ -0,0 +1,108 @@
+"""
+Serialize every write transaction against the SQLite store across threads and processes
+
+SQLite allows a single writer at a time.  Rather than letting concurrent writers race
+for the file lock and fail with "database is locked", a connection takes the store's
+write lock when it issues its first write statement and holds it until the transaction
+commits or rolls back.  The lock is a thread lock within a process combined with an
+exclusive `flock` on a file next to the store, so any number of worker processes can
+read concurrently while writes from all of them are applied one at a time.
+"""
+
+from typing import Optional
+import fcntl
+import os
+import threading
+import time
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import OperationalError
+
+WRITE_STATEMENTS = ("INSERT", "UPDATE", "DELETE", "REPLACE", "CREATE", "DROP", "ALTER")
+
+# Key in `Connection.info` marking a connection that holds the write lock
+HOLDS_LOCK = "lablr_holds_write_lock"
+
+
+class WriteLock:
+    """Process-wide and cross-process exclusive lock guarding write transactions"""
+
+    def __init__(self, path: str, timeout: float):
+        self.path = path
+        self.timeout = timeout
+        self._thread_lock = threading.Lock()
+        self._fd: Optional[int] = None
+        self._fd_pid: Optional[int] = None
+
+    def _file(self) -> int:
+        # Descriptors inherited across fork share their flock, so every process opens
+        # its own
+        if self._fd is None or self._fd_pid != os.getpid():
+            self._fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+            self._fd_pid = os.getpid()
+        return self._fd
+
+    def acquire(self) -> None:
+        """Block until this thread is the only writer, or raise after `timeout`"""
+
+        deadline = time.monotonic() + self.timeout
+        if not self._thread_lock.acquire(  # pylint: disable=consider-using-with
+            timeout=self.timeout
+        ):
+            raise OperationalError(
+                "acquire write lock", None, TimeoutError("write lock timed out")
+            )
+
+        try:
+            while True:
+                try:
+                    fcntl.flock(self._file(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    return
+                except BlockingIOError:
+                    if time.monotonic() > deadline:
+                        raise
+                    time.sleep(0.005)
+        except BaseException as error:
+            self._thread_lock.release()
+            raise OperationalError(
+                "acquire write lock", None, TimeoutError("write lock timed out")
+            ) from error
+
+    def release(self) -> None:
+        """Allow the next writer to proceed"""
+
+        fcntl.flock(self._file(), fcntl.LOCK_UN)
+        self._thread_lock.release()
+
+
+def _is_write(statement: str) -> bool:
+    return statement.lstrip().split(None, 1)[0].upper() in WRITE_STATEMENTS
+
+
+def install(engine: Engine, lock: WriteLock) -> None:
+    """Make every connection of `engine` take `lock` for the length of a write transaction"""
+
+    def acquire(conn, cursor, statement, *args):  # pylint: disable=unused-argument
+        if not conn.info.get(HOLDS_LOCK) and _is_write(statement):
+            lock.acquire()
+            conn.info[HOLDS_LOCK] = True
+
+    def release(conn, *args):  # pylint: disable=unused-argument
+        if conn.info.pop(HOLDS_LOCK, False):
+            lock.release()
+
+    def release_on_reset(
+        dbapi_connection, connection_record
+    ):  # pylint: disable=unused-argument
+        # Connections returned to the pool mid-transaction are rolled back directly
+        # on the DBAPI connection, bypassing the engine's rollback event
+        if connection_record is not None and connection_record.info.pop(
+            HOLDS_LOCK, False
+        ):
+            lock.release()
+
+    event.listen(engine, "before_cursor_execute", acquire)
+    event.listen(engine, "commit", release)
+    event.listen(engine, "rollback", release)
+    event.listen(engine.pool, "reset", release_on_reset)
@@ -0,0 +1,26 @@
+"""
+Gunicorn configuration for serving the API with several worker processes
+
+    gunicorn -c gunicorn.conf.py main:app
+"""
+
+# pylint: disable=invalid-name
+
+import os
+
+bind = os.environ.get("LABLR_BIND", "127.0.0.1:8000")
+workers = int(os.environ.get("LABLR_WORKERS", "1"))
+worker_class = "uvicorn.workers.UvicornWorker"
+
+# Long imports and exports run in background jobs or stream, so requests stay short
+timeout = int(os.environ.get("LABLR_WORKER_TIMEOUT", "120"))
+graceful_timeout = 30
+
+
+def on_starting(server):  # pylint: disable=unused-argument
+    """Prepare the store once in the master process, before any worker is forked"""
+
+    from database.setup import prepare_store  # pylint: disable=import-outside-toplevel
+
+    prepare_store()
+    os.environ["LABLR_STORE_PREPARED"] = "1"
@@ -0,0 +1,17 @@
+"""
+Streaming ingestion of sample files into the database
+"""
+
+from .dedup import Deduplicator
+from .formats import open_reader, upload_format
+from .parallel import ParallelCSVReader
+from .readers import (
+    CSVSampleReader,
+    InvalidUploadError,
+    JSONLSampleReader,
+    ParquetSampleReader,
+    Row,
+    check_rows,
+    iter_batches,
+)
+from .writer import insert_batch
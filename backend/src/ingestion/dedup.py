@@ -0,0 +1,208 @@
+"""
+Near-duplicate detection of sample text with MinHash signatures and LSH
+
+Every text is normalized (lowercased, whitespace collapsed) and cut into overlapping
+character shingles.  Its MinHash signature holds, for each of `NUM_PERM` hash
+functions, the smallest hash of any of its shingles; the fraction of equal entries
+of two signatures estimates the Jaccard similarity of their shingle sets.  Signatures
+are computed for many texts at once with vectorized NumPy arithmetic, in a process
+pool for large batches.
+
+Locality-sensitive hashing splits signatures into `BANDS` bands.  Texts sharing any
+band are candidates, and a candidate is a duplicate when the estimated similarity
+reaches the threshold.  Only the first text of each cluster, its canonical sample, is
+indexed, which costs about 2 KB of memory per distinct text.
+"""
+
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, NamedTuple, Optional, Sequence
+import multiprocessing
+import threading
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+from util import config
+
+SHINGLE_SIZE = 5
+NUM_PERM = 64
+BANDS = 16
+ROWS_PER_BAND = NUM_PERM // BANDS
+
+# Texts whose signatures are computed together, bounding the size of the hash matrix
+CHUNK_SIZE = 1000
+
+_rng = np.random.default_rng(0x1AB1)
+
+# Multiply-shift hash functions, one per signature entry (multipliers must be odd)
+PERM_MULTIPLIERS = _rng.integers(1, 2**63, NUM_PERM, dtype=np.uint64) | np.uint64(1)
+PERM_OFFSETS = _rng.integers(0, 2**63, NUM_PERM, dtype=np.uint64)
+
+# Polynomial hash of the bytes of a shingle
+SHINGLE_POWERS = np.uint64(1099511628211) ** np.arange(
+    SHINGLE_SIZE - 1, -1, -1, dtype=np.uint64
+)
+
+# Combines the rows of a band into a single bucket key
+BAND_MULTIPLIERS = _rng.integers(1, 2**63, ROWS_PER_BAND, dtype=np.uint64)
+
+
+def _normalize(text: Optional[str]) -> bytes:
+    # Short texts are padded so that they have at least one shingle
+    return " ".join((text or "").lower().split()).ljust(SHINGLE_SIZE).encode("utf-8")
+
+
+def _mix(values: np.ndarray) -> np.ndarray:
+    """Scramble the bits of 64-bit hashes (the murmur3 finalizer)"""
+
+    values = values ^ (values >> np.uint64(33))
+    values = values * np.uint64(0xFF51AFD7ED558CCD)
+    values = values ^ (values >> np.uint64(33))
+    values = values * np.uint64(0xC4CEB9FE1A85EC53)
+    return values ^ (values >> np.uint64(33))
+
+
+def minhash_signatures(texts: Sequence[Optional[str]]) -> np.ndarray:
+    """MinHash signatures of texts as a (len(texts), NUM_PERM) uint32 array"""
+
+    if not texts:
+        return np.empty((0, NUM_PERM), dtype=np.uint32)
+
+    # Shingle every text of the chunk in one pass over their concatenated bytes
+    encoded = [_normalize(text) for text in texts]
+    lengths = np.array([len(data) for data in encoded])
+    data = np.frombuffer(b"".join(encoded), dtype=np.uint8).astype(np.uint64)
+
+    windows = sliding_window_view(data, SHINGLE_SIZE)
+    ends = np.cumsum(lengths)
+    starts = ends - lengths
+    owner = np.repeat(np.arange(len(texts)), lengths)[: len(windows)]
+    valid = np.arange(len(windows)) + SHINGLE_SIZE <= ends[owner]
+    shingles = _mix(windows[valid] @ SHINGLE_POWERS)
+
+    # Apply each hash function to every shingle, then take each text's minimum
+    first_shingle = starts - np.arange(len(texts)) * (SHINGLE_SIZE - 1)
+    signatures = np.empty((len(texts), NUM_PERM), dtype=np.uint32)
+    for i, (multiplier, offset) in enumerate(zip(PERM_MULTIPLIERS, PERM_OFFSETS)):
+        hashed = (shingles * multiplier + offset) >> np.uint64(32)
+        signatures[:, i] = np.minimum.reduceat(hashed, first_shingle)
+
+    return signatures
+
+
+_pool: Optional[ProcessPoolExecutor] = None  # pylint: disable=invalid-name
+_pool_lock = threading.Lock()
+
+
+def _get_pool() -> ProcessPoolExecutor:
+    global _pool  # pylint: disable=global-statement
+
+    with _pool_lock:
+        if _pool is None:
+            # Forking the multi-threaded server would copy locks held by other threads
+            _pool = ProcessPoolExecutor(
+                max_workers=config.DEDUP_WORKERS,
+                mp_context=multiprocessing.get_context("forkserver"),
+            )
+        return _pool
+
+
+def compute_signatures(
+    texts: Sequence[Optional[str]], workers: int = None
+) -> np.ndarray:
+    """MinHash signatures of texts, computed in the process pool for large batches"""
+
+    workers = config.DEDUP_WORKERS if workers is None else workers
+    chunks = [texts[i : i + CHUNK_SIZE] for i in range(0, len(texts), CHUNK_SIZE)]
+    if workers <= 1 or len(chunks) <= 1:
+        results = [minhash_signatures(chunk) for chunk in chunks]
+    else:
+        results = list(_get_pool().map(minhash_signatures, chunks))
+
+    if not results:
+        return minhash_signatures([])
+    return np.concatenate(results)
+
+
+def band_keys(signatures: np.ndarray) -> np.ndarray:
+    """LSH bucket key of every band of every signature, as a (n, BANDS) array"""
+
+    bands = signatures.astype(np.uint64).reshape(-1, BANDS, ROWS_PER_BAND)
+    return _mix((bands * BAND_MULTIPLIERS).sum(axis=2, dtype=np.uint64))
+
+
+class Match(NamedTuple):
+    """Outcome of deduplicating one row"""
+
+    cluster: int  # Row index of the cluster's canonical row
+    is_duplicate: bool
+
+
+class Deduplicator:
+    """Incremental LSH index assigning each row of an upload to a cluster
+
+    Rows must be passed in file order.  Feeding the same rows again, e.g. when a job
+    resumes, rebuilds the same clusters.
+    """
+
+    def __init__(self, threshold: float = None):
+        self.threshold = config.DEDUP_THRESHOLD if threshold is None else threshold
+        self.buckets: List[Dict[int, int]] = [{} for _ in range(BANDS)]
+        self.signatures = np.empty((1024, NUM_PERM), dtype=np.uint32)
+        self.canonical_rows: List[int] = []
+        self.rows_seen = 0
+        self.duplicates = 0
+        self.clusters_with_duplicates = set()
+
+    def _find(self, signature: np.ndarray, keys: np.ndarray) -> Optional[int]:
+        candidates = {
+            bucket[key]
+            for bucket, key in zip(self.buckets, keys.tolist())
+            if key in bucket
+        }
+        for candidate in sorted(candidates):
+            similarity = np.mean(self.signatures[candidate] == signature)
+            if similarity >= self.threshold:
+                return candidate
+        return None
+
+    def _add(self, signature: np.ndarray, keys: np.ndarray) -> int:
+        index = len(self.canonical_rows)
+        if index == len(self.signatures):
+            self.signatures = np.concatenate([self.signatures, self.signatures])
+        self.signatures[index] = signature
+        self.canonical_rows.append(self.rows_seen)
+
+        for bucket, key in zip(self.buckets, keys.tolist()):
+            bucket.setdefault(key, index)
+        return index
+
+    def assign(self, texts: Sequence[Optional[str]]) -> List[Match]:
+        """Cluster the next rows of the upload"""
+
+        signatures = compute_signatures(texts)
+        keys = band_keys(signatures)
+
+        matches = []
+        for signature, row_keys in zip(signatures, keys):
+            index = self._find(signature, row_keys)
+            if index is None:
+                matches.append(Match(self.rows_seen, False))
+                self._add(signature, row_keys)
+            else:
+                matches.append(Match(self.canonical_rows[index], True))
+                self.duplicates += 1
+                self.clusters_with_duplicates.add(index)
+            self.rows_seen += 1
+
+        return matches
+
+    @property
+    def stats(self) -> Dict[str, int]:
+        """Counts reported on the ingestion job"""
+
+        return dict(
+            rows=self.rows_seen,
+            duplicates=self.duplicates,
+            clusters=len(self.clusters_with_duplicates),
+        )
@@ -0,0 +1,72 @@
+"""
+Detection of the format of an upload from its file name, and the reader parsing it
+"""
+
+from typing import BinaryIO, Optional, Tuple
+
+from util.constants import Compressions, UploadFormats
+from .parallel import ParallelCSVReader, should_parallelize
+from .readers import (
+    CSVSampleReader,
+    InvalidUploadError,
+    JSONLSampleReader,
+    ParquetSampleReader,
+    decompress,
+)
+
+# Formats that can be read as a compressed stream; Parquet compresses its pages itself
+STREAMED_FORMATS = (UploadFormats.CSV, UploadFormats.JSONL)
+
+
+def upload_format(filename: str) -> Tuple[str, Optional[str]]:
+    """Format and compression of an upload, e.g. `("jsonl", "gz")` for `a.jsonl.gz`"""
+
+    name = (filename or "").lower()
+
+    compression = None
+    for candidate in Compressions.valid_compressions:
+        if name.endswith(f".{candidate}"):
+            compression = candidate
+            name = name[: -len(candidate) - 1]
+
+    for file_format in UploadFormats.valid_formats:
+        if name.endswith(f".{file_format}") and (
+            compression is None or file_format in STREAMED_FORMATS
+        ):
+            return file_format, compression
+
+    raise InvalidUploadError(
+        "File provided must be in .csv, .jsonl or .parquet format, and .csv or "
+        ".jsonl files may be compressed as .gz or .zst."
+    )
+
+
+def open_reader(
+    fileobj: BinaryIO,
+    id_field: str,
+    text_field: str,
+    file_format: str = UploadFormats.CSV,
+    compression: Optional[str] = None,
+):
+    """Reader of the (id, text) rows of a file in the given format
+
+    Large uncompressed CSV files are parsed in parallel.  Compressed files are
+    decompressed as they are read, and their progress is reported in bytes of the
+    compressed file."""
+
+    if file_format == UploadFormats.PARQUET:
+        return ParquetSampleReader(fileobj, id_field, text_field)
+
+    if (
+        file_format == UploadFormats.CSV
+        and compression is None
+        and should_parallelize(fileobj)
+    ):
+        return ParallelCSVReader(fileobj, id_field, text_field)
+
+    reader_class = (
+        CSVSampleReader if file_format == UploadFormats.CSV else JSONLSampleReader
+    )
+    return reader_class(
+        decompress(fileobj, compression), id_field, text_field, source=fileobj
+    )
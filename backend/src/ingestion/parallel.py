@@ -0,0 +1,263 @@
+"""
+Parallel parsing of large CSV files, by byte ranges of whole records
+
+The file is memory-mapped and cut into ranges of about `config.INGESTION_CHUNK_BYTES`.
+A range may only end after a newline that is outside of any quoted field.  As in
+`csv.reader`, a quote only opens a field at the start of that field, and is kept as
+a literal character anywhere else in an unquoted field.  A regular expression skips
+whole fields up to each candidate newline, so finding the boundaries runs in C and
+is cheap next to parsing.
+
+Every range is decoded and parsed with `csv.reader` in a process pool, which returns
+only the id and text columns.  The ranges' columns are handed back in file order, so
+the job's single writer inserts them exactly as it would a sequentially read file.
+"""
+
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import BinaryIO, Deque, Iterator, List, Optional, Tuple
+import codecs
+import csv
+import io
+import mmap
+import multiprocessing
+import os
+import re
+import threading
+
+from util import config
+from .readers import InvalidUploadError, Row
+
+# The id and text columns of a range, and the number of lines it spans
+Columns = Tuple[List[Optional[str]], List[Optional[str]], int]
+
+# Ranges parsed ahead of the writer, per worker
+PREFETCH_PER_WORKER = 2
+
+
+# A field from its start: a quoted field, in which quotes are escaped by writing them
+# twice, followed by the rest of the field read verbatim, or an unquoted field, which
+# cannot start with a quote but may hold some anywhere else
+FIELD = rb'(?:"[^"]*(?:""[^"]*)*"(?!")[^,\r\n]*|[^",\r\n][^,\r\n]*)?'
+
+# Fields and the delimiters or line breaks between them
+FIELDS = re.compile(FIELD + rb"(?:[,\r\n]" + FIELD + rb")*")
+
+# Bytes of fields skipped by one match when looking for the end of a range
+SCAN_BYTES = 65536
+
+
+def _skip_fields(data: mmap.mmap, pos: int, newline: int) -> int:
+    """Skip the fields from the start of a field at `pos` up to a newline, returning
+    the newline's offset when it is outside of quotes, or else the offset after the
+    quote closing the field around it (the file's size when it is never closed)"""
+
+    while True:
+        # Long matches are slow to track, so fields are skipped up to nearer newlines
+        limit = data.find(b"\n", min(pos + SCAN_BYTES, newline))
+        stop = FIELDS.match(data, pos, limit).end()
+        if stop < limit:
+            break
+        if limit == newline:
+            return newline
+        pos = limit
+
+    # Only a quoted field still open at the newline stops the match early
+    pos = stop + 1
+    while True:
+        quote = data.find(b'"', pos)
+        if quote == -1:
+            return len(data)
+        if data[quote + 1 : quote + 2] != b'"':
+            return quote + 1
+        pos = quote + 2
+
+
+def record_ranges(
+    data: mmap.mmap, start: int, chunk_bytes: int
+) -> Iterator[Tuple[int, int]]:
+    """Split `data[start:]` into (start, end) ranges of about `chunk_bytes`, each
+    holding whole CSV records"""
+
+    size = len(data)
+    pos = start
+    while start < size:
+        end = start + chunk_bytes
+        if end >= size:
+            yield start, size
+            return
+
+        # Extend the range to the first newline from `end` outside of quoted fields
+        while True:
+            newline = data.find(b"\n", max(pos, end))
+            if newline == -1:
+                yield start, size
+                return
+            pos = _skip_fields(data, pos, newline)
+            if pos == newline:
+                pos += 1
+                break
+
+        yield start, pos
+        start = pos
+
+
+class RangeError(Exception):
+    """Raised by a worker with the line of a parsing error, counted from its range's
+    start, a message template and its detail"""
+
+
+def parse_range(
+    path: str, start: int, end: int, id_index: int, text_index: int
+) -> Columns:
+    """Decode and parse the records of a byte range, keeping the id and text columns
+
+    Blank lines are skipped and missing fields read as None, like `csv.DictReader`.
+    """
+
+    with open(path, "rb") as fileobj:
+        fileobj.seek(start)
+        data = fileobj.read(end - start)
+
+    try:
+        text = data.decode("utf-8")
+    except UnicodeDecodeError as error:
+        line = data.count(b"\n", 0, error.start) + 1
+        raise RangeError(
+            line, "File is not valid UTF-8 near line {line}.", ""
+        ) from None
+
+    ids: List[Optional[str]] = []
+    texts: List[Optional[str]] = []
+    reader = csv.reader(io.StringIO(text, newline=""), delimiter=",")
+    try:
+        for row in reader:
+            if not row:
+                continue
+            ids.append(row[id_index] if id_index < len(row) else None)
+            texts.append(row[text_index] if text_index < len(row) else None)
+    except csv.Error as error:
+        raise RangeError(
+            reader.line_num, "Malformed CSV on line {line}: {detail}", str(error)
+        ) from None
+
+    return ids, texts, data.count(b"\n")
+
+
+_pool: Optional[ProcessPoolExecutor] = None  # pylint: disable=invalid-name
+_pool_lock = threading.Lock()
+
+
+def _get_pool() -> ProcessPoolExecutor:
+    global _pool  # pylint: disable=global-statement
+
+    with _pool_lock:
+        if _pool is None:
+            # Forking the multi-threaded server would copy locks held by other threads
+            _pool = ProcessPoolExecutor(
+                max_workers=config.INGESTION_WORKERS,
+                mp_context=multiprocessing.get_context("forkserver"),
+            )
+        return _pool
+
+
+class ParallelCSVReader:
+    """Parse a CSV file in a process pool, yielding its (id, text) rows in order"""
+
+    def __init__(
+        self,
+        fileobj: BinaryIO,
+        id_field: str,
+        text_field: str,
+        chunk_bytes: int = None,
+    ):
+        self.path = fileobj.name
+        self.chunk_bytes = chunk_bytes or config.INGESTION_CHUNK_BYTES
+        self.position = 0
+        self._pending: Deque[Tuple[int, Future]] = deque()
+        self._data = mmap.mmap(fileobj.fileno(), 0, access=mmap.ACCESS_READ)
+
+        # The header is the first record, parsed here to find the fields' columns
+        bom = len(codecs.BOM_UTF8) if self._data[:3] == codecs.BOM_UTF8 else 0
+        header_end = next(record_ranges(self._data, bom, 1), (0, 0))[1]
+        try:
+            header = self._data[:header_end].decode("utf-8-sig")
+            fieldnames = next(csv.reader(io.StringIO(header, newline="")), [])
+        except (UnicodeDecodeError, csv.Error) as error:
+            self.close()
+            raise InvalidUploadError(f"Unable to read CSV header: {error}") from error
+
+        # Check that id and text fields are valid
+        for field in (id_field, text_field):
+            if field not in fieldnames:
+                self.close()
+                raise InvalidUploadError(
+                    f"Field `{field}` not found in provided CSV.  Must be one of {fieldnames}"
+                )
+
+        self.id_index = fieldnames.index(id_field)
+        self.text_index = fieldnames.index(text_field)
+        self.header_end = header_end
+        self.header_lines = self._data[:header_end].count(b"\n")
+
+    def __iter__(self) -> Iterator[Row]:
+        pool = _get_pool()
+        ranges = record_ranges(self._data, self.header_end, self.chunk_bytes)
+        prefetch = max(config.INGESTION_WORKERS, 1) * PREFETCH_PER_WORKER
+        lines = self.header_lines
+
+        for start, end in ranges:
+            self._pending.append(
+                (
+                    end,
+                    pool.submit(
+                        parse_range,
+                        self.path,
+                        start,
+                        end,
+                        self.id_index,
+                        self.text_index,
+                    ),
+                )
+            )
+            if len(self._pending) < prefetch:
+                continue
+            lines = yield from self._next_columns(lines)
+
+        while self._pending:
+            lines = yield from self._next_columns(lines)
+
+    def _next_columns(self, lines: int) -> Iterator[Row]:
+        end, future = self._pending.popleft()
+        try:
+            ids, texts, range_lines = future.result()
+        except RangeError as error:
+            line, template, detail = error.args
+            raise InvalidUploadError(
+                template.format(line=lines + line, detail=detail)
+            ) from None
+
+        self.position = end
+        yield from zip(ids, texts)
+        return lines + range_lines
+
+    def tell(self) -> int:
+        """Offset of the end of the last range whose rows were read"""
+
+        return self.position
+
+    def close(self) -> None:
+        """Cancel the ranges still queued and release the memory map"""
+
+        while self._pending:
+            self._pending.popleft()[1].cancel()
+        if self._data is not None:
+            self._data.close()
+            self._data = None
+
+
+def should_parallelize(fileobj: BinaryIO) -> bool:
+    """Whether a file is large enough to be split among several workers"""
+
+    size = os.fstat(fileobj.fileno()).st_size
+    return config.INGESTION_WORKERS > 1 and size > 2 * config.INGESTION_CHUNK_BYTES
@@ -0,0 +1,296 @@
+"""
+Incremental readers that turn an uploaded file into rows of (original_id, text)
+"""
+
+from typing import BinaryIO, Iterable, Iterator, List, Optional, Tuple
+from itertools import islice
+import csv
+import io
+import json
+import os
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from util.constants import Compressions
+
+Row = Tuple[str, str]
+
+# Arrow codec decompressing each compression of an upload
+CODECS = {Compressions.GZIP: "gzip", Compressions.ZSTD: "zstd"}
+
+# Bytes decompressed at once when reading a compressed upload
+DECOMPRESS_BUFFER_BYTES = 1024 * 1024
+
+
+class InvalidUploadError(ValueError):
+    """Raised when an uploaded file cannot be parsed into samples"""
+
+
+class CSVSampleReader:
+    """Decode and parse a CSV file one row at a time
+
+    The underlying binary file is wrapped in an incremental decoder, so only the
+    current read buffer is ever held in memory rather than the entire upload.
+    """
+
+    def __init__(
+        self,
+        fileobj: BinaryIO,
+        id_field: str,
+        text_field: str,
+        source: Optional[BinaryIO] = None,
+    ):
+        self.id_field = id_field
+        self.text_field = text_field
+        self._source = source or fileobj
+
+        # `utf-8-sig` transparently strips a BOM written by spreadsheet software
+        self._stream = io.TextIOWrapper(fileobj, encoding="utf-8-sig", newline="")
+        self._reader = csv.DictReader(self._stream, delimiter=",")
+
+        try:
+            fieldnames = self._reader.fieldnames or []
+        except (UnicodeDecodeError, csv.Error) as error:
+            self.close()
+            raise InvalidUploadError(f"Unable to read CSV header: {error}") from error
+        except InvalidUploadError:
+            self.close()
+            raise
+
+        # Check that id and text fields are valid
+        for field in (id_field, text_field):
+            if field not in fieldnames:
+                self.close()
+                raise InvalidUploadError(
+                    f"Field `{field}` not found in provided CSV.  Must be one of {fieldnames}"
+                )
+
+    def __iter__(self) -> Iterator[Row]:
+        try:
+            for row in self._reader:
+                yield row[self.id_field], row[self.text_field]
+        except UnicodeDecodeError as error:
+            raise InvalidUploadError(
+                f"File is not valid UTF-8 near line {self._reader.line_num}."
+            ) from error
+        except csv.Error as error:
+            raise InvalidUploadError(
+                f"Malformed CSV on line {self._reader.line_num}: {error}"
+            ) from error
+
+    def tell(self) -> int:
+        """Offset up to which the file, or the compressed `source`, has been read"""
+
+        return self._source.tell()
+
+    def close(self) -> None:
+        """Release the decoder without closing the underlying upload"""
+
+        if self._stream is not None:
+            self._stream.detach()
+            self._stream = None
+
+
+class JSONLSampleReader:
+    """Decode and parse a file of JSON objects, one per line, one row at a time
+
+    Like CSV columns, the id and text fields must be keys of the first object.  Ids
+    that are not strings are converted to text, and missing keys read as None.
+    """
+
+    def __init__(
+        self,
+        fileobj: BinaryIO,
+        id_field: str,
+        text_field: str,
+        source: Optional[BinaryIO] = None,
+    ):
+        self.id_field = id_field
+        self.text_field = text_field
+        self.line_num = 0
+        self._source = source or fileobj
+        self._stream = io.TextIOWrapper(fileobj, encoding="utf-8-sig")
+
+        try:
+            self._first = self._next_record()
+        except InvalidUploadError:
+            self.close()
+            raise
+
+        fieldnames = list(self._first or {})
+        for field in (id_field, text_field):
+            if field not in fieldnames:
+                self.close()
+                raise InvalidUploadError(
+                    f"Field `{field}` not found in the first JSON object.  "
+                    f"Must be one of {fieldnames}"
+                )
+
+    def _next_record(self) -> Optional[dict]:
+        try:
+            for line in self._stream:
+                self.line_num += 1
+                if not line.strip():
+                    continue
+
+                record = json.loads(line)
+                if not isinstance(record, dict):
+                    raise InvalidUploadError(
+                        f"Line {self.line_num} is not a JSON object."
+                    )
+                return record
+        except UnicodeDecodeError as error:
+            raise InvalidUploadError(
+                f"File is not valid UTF-8 near line {self.line_num + 1}."
+            ) from error
+        except json.JSONDecodeError as error:
+            raise InvalidUploadError(
+                f"Malformed JSON on line {self.line_num}: {error}"
+            ) from error
+
+        return None
+
+    def __iter__(self) -> Iterator[Row]:
+        record = self._first
+        while record is not None:
+            original_id = record.get(self.id_field)
+            if original_id is not None and not isinstance(original_id, str):
+                original_id = json.dumps(original_id)
+            yield original_id, record.get(self.text_field)
+            record = self._next_record()
+
+    def tell(self) -> int:
+        """Offset up to which the file, or the compressed `source`, has been read"""
+
+        return self._source.tell()
+
+    def close(self) -> None:
+        """Release the decoder without closing the underlying upload"""
+
+        if self._stream is not None:
+            self._stream.detach()
+            self._stream = None
+
+
+class ParquetSampleReader:
+    """Read the id and text columns of a Parquet file, one row group at a time"""
+
+    def __init__(self, fileobj: BinaryIO, id_field: str, text_field: str):
+        self.id_field = id_field
+        self.text_field = text_field
+        self.rows_read = 0
+        self._size = os.fstat(fileobj.fileno()).st_size
+        self._map = None
+
+        try:
+            # Files on disk are memory-mapped, so pages are read without copies
+            if isinstance(getattr(fileobj, "name", None), str):
+                self._map = pa.memory_map(fileobj.name)
+            self._file = pq.ParquetFile(self._map or fileobj)
+        except (pa.ArrowException, OSError) as error:
+            self.close()
+            raise InvalidUploadError(f"Unable to read Parquet file: {error}") from error
+
+        fieldnames = self._file.schema_arrow.names
+        for field in (id_field, text_field):
+            if field not in fieldnames:
+                self.close()
+                raise InvalidUploadError(
+                    f"Field `{field}` not found in provided Parquet file.  "
+                    f"Must be one of {fieldnames}"
+                )
+
+    def _column(self, table: pa.Table, field: str) -> List[Optional[str]]:
+        try:
+            return table.column(field).cast(pa.string()).to_pylist()
+        except (pa.ArrowInvalid, pa.ArrowNotImplementedError) as error:
+            raise InvalidUploadError(
+                f"Column `{field}` of type {table.schema.field(field).type} "
+                f"cannot be read as text"
+            ) from error
+
+    def __iter__(self) -> Iterator[Row]:
+        columns = list(dict.fromkeys((self.id_field, self.text_field)))
+        for index in range(self._file.num_row_groups):
+            try:
+                table = self._file.read_row_group(index, columns=columns)
+            except (pa.ArrowException, OSError) as error:
+                raise InvalidUploadError(
+                    f"Unable to read row group {index} of Parquet file: {error}"
+                ) from error
+
+            rows = zip(
+                self._column(table, self.id_field),
+                self._column(table, self.text_field),
+            )
+            self.rows_read += table.num_rows
+            yield from rows
+
+    def tell(self) -> int:
+        """Offset of the file estimated from the rows read, as row groups are read
+        whole"""
+
+        total = self._file.metadata.num_rows
+        return self._size * self.rows_read // total if total else self._size
+
+    def close(self) -> None:
+        """Release the memory map, without closing the underlying upload"""
+
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+
+
+class DecompressedStream(io.RawIOBase):
+    """Decompressed bytes of an Arrow compressed stream, raising `InvalidUploadError`
+    when the file is corrupt or truncated"""
+
+    def __init__(self, stream: pa.CompressedInputStream):
+        super().__init__()
+        self._stream = stream
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, buffer) -> int:
+        try:
+            data = self._stream.read(len(buffer))
+        except (pa.ArrowException, OSError) as error:
+            raise InvalidUploadError(f"Unable to decompress file: {error}") from error
+
+        buffer[: len(data)] = data
+        return len(data)
+
+
+def decompress(fileobj: BinaryIO, compression: Optional[str]) -> BinaryIO:
+    """Wrap a compressed file in a stream of its decompressed bytes"""
+
+    if compression is None:
+        return fileobj
+    stream = pa.CompressedInputStream(
+        pa.PythonFile(fileobj, mode="r"), CODECS[compression]
+    )
+    return io.BufferedReader(DecompressedStream(stream), DECOMPRESS_BUFFER_BYTES)
+
+
+def check_rows(rows: Iterable[Row], id_field: str, text_field: str) -> Iterator[Row]:
+    """Pass rows through, failing on the first one without an id or a text, which
+    readers return as None for missing columns, keys and null values"""
+
+    for number, (original_id, text) in enumerate(rows, start=1):
+        for field, value in ((id_field, original_id), (text_field, text)):
+            if value is None:
+                raise InvalidUploadError(f"Row {number} has no value for `{field}`.")
+        yield original_id, text
+
+
+def iter_batches(rows: Iterable[Row], batch_size: int) -> Iterator[List[Row]]:
+    """Group an iterable of rows into lists of at most `batch_size` rows"""
+
+    iterator = iter(rows)
+    while True:
+        batch = list(islice(iterator, batch_size))
+        if not batch:
+            return
+        yield batch
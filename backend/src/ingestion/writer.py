@@ -0,0 +1,95 @@
+"""
+Bulk insertion of parsed rows into the samples table
+"""
+
+from typing import Iterable, List, Optional, Sequence, Tuple
+import csv
+import io
+
+from sqlalchemy.orm import Session
+
+from database import counters, sample
+from util import cache
+from .readers import Row
+
+# (cluster_id, is_duplicate) of a row linked to its near-duplicates
+Cluster = Tuple[str, bool]
+
+# Empty fields are kept as empty strings rather than being read as NULL, except for
+# the cluster, which is NULL when a row is not linked
+COPY_STATEMENT = (
+    "COPY samples (dataset_id, original_id, text, save_for_later, cluster_id, "
+    "is_duplicate) FROM STDIN WITH (FORMAT csv, FORCE_NOT_NULL (original_id, text))"
+)
+
+
+def _copy_rows(
+    db_session: Session, dataset_id: int, batch: List[Row], clusters: Sequence[Cluster]
+) -> None:
+    """Stream a batch into PostgreSQL with `COPY`, much faster than an executemany"""
+
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for (original_id, text), (cluster_id, is_duplicate) in zip(batch, clusters):
+        writer.writerow(
+            (
+                dataset_id,
+                original_id,
+                text,
+                "f",
+                cluster_id,
+                "t" if is_duplicate else "f",
+            )
+        )
+    buffer.seek(0)
+
+    # The raw DBAPI connection of the session takes part in its transaction
+    cursor = db_session.connection().connection.cursor()
+    try:
+        cursor.copy_expert(COPY_STATEMENT, buffer)
+    finally:
+        cursor.close()
+
+
+def insert_batch(
+    db_session: Session,
+    dataset_id: int,
+    batch: Iterable[Row],
+    clusters: Optional[Sequence[Cluster]] = None,
+) -> int:
+    """Insert a batch of rows with a single executemany (or `COPY`) statement
+
+    `clusters`, if given, holds the near-duplicate cluster of every row.  The
+    dataset's sample counter is updated in the same transaction.  The caller owns
+    the transaction and is responsible for committing or rolling back.
+    """
+
+    rows = list(batch)
+    if not rows:
+        return 0
+
+    if clusters is None:
+        clusters = [(None, False)] * len(rows)
+
+    if db_session.get_bind().dialect.name == "postgresql":
+        _copy_rows(db_session, dataset_id, rows, clusters)
+    else:
+        db_session.execute(
+            sample.Sample.__table__.insert(),
+            [
+                dict(
+                    dataset_id=dataset_id,
+                    original_id=original_id,
+                    text=text,
+                    cluster_id=cluster_id,
+                    is_duplicate=is_duplicate,
+                )
+                for (original_id, text), (cluster_id, is_duplicate) in zip(
+                    rows, clusters
+                )
+            ],
+        )
+    counters.increment(db_session, dataset_id, samples=len(rows))
+    cache.invalidate_on_commit(db_session, dataset_id)
+
+    return len(rows)
@@ -0,0 +1,278 @@
+"""
+Background job runner backed by the `jobs` table
+
+Jobs are executed by a small thread pool.  All progress is written to the database,
+so jobs interrupted by a restart can be resumed from their last checkpoint.
+
+While a process runs jobs, a heartbeat thread refreshes their `heartbeat_at` every
+`config.JOB_HEARTBEAT_SECONDS`.  The same thread hands back to the queue, and runs,
+the jobs whose heartbeat is older than `config.JOB_STALE_SECONDS`, whose process was
+stopped or crashed.  A job is thus never resumed while another process runs it, even
+when several processes share the store.
+"""
+
+from concurrent.futures import Future, ThreadPoolExecutor
+from datetime import datetime
+from typing import Callable, Dict, Optional, Set
+import logging
+import threading
+import time
+
+from sqlalchemy import JSON, DateTime, cast, exists, insert, literal, select
+from sqlalchemy.orm import Session
+
+from database import SessionLocal, dataset, job
+from util import config
+from util.constants import JobKinds, JobStatus
+from . import delete, ingest, score
+
+logger = logging.getLogger(__name__)
+
+JobHandler = Callable[[Session, job.Job], None]
+
+HANDLERS: Dict[str, JobHandler] = {
+    JobKinds.INGEST: ingest.run_ingest_job,
+    JobKinds.DELETE: delete.run_delete_job,
+    JobKinds.SCORE: score.run_score_job,
+}
+
+_executor = ThreadPoolExecutor(
+    max_workers=config.JOB_WORKERS, thread_name_prefix="lablr-job"
+)
+
+# Jobs running in this process, whose heartbeat it refreshes
+_running: Set[int] = set()
+_running_lock = threading.Lock()
+
+_heartbeat: Optional[threading.Thread] = None  # pylint: disable=invalid-name
+_heartbeat_lock = threading.Lock()
+
+
+def run_job(job_id: int) -> None:
+    """Execute a job to completion, recording failures on the job itself"""
+
+    db_session = SessionLocal()
+    try:
+        # Claim the job atomically, so that it runs in exactly one worker process
+        claimed = (
+            db_session.query(job.Job)
+            .filter_by(job_id=job_id, status=JobStatus.PENDING)
+            .update(
+                dict(
+                    status=JobStatus.RUNNING,
+                    started_at=datetime.now(),
+                    heartbeat_at=datetime.now(),
+                ),
+                synchronize_session=False,
+            )
+        )
+        db_session.commit()
+        if not claimed:
+            return
+
+        with _running_lock:
+            _running.add(job_id)
+        try:
+            _run_claimed(db_session, job_id)
+        finally:
+            with _running_lock:
+                _running.discard(job_id)
+    finally:
+        db_session.close()
+
+
+def _run_claimed(db_session: Session, job_id: int) -> None:
+    db_job = db_session.query(job.Job).filter_by(job_id=job_id).first()
+
+    try:
+        HANDLERS[db_job.kind](db_session, db_job)
+    except Exception as error:  # pylint: disable=broad-except
+        logger.exception(f"Job {job_id} failed")
+        db_session.rollback()
+        db_job.status = JobStatus.FAILED
+        db_job.errors = [*(db_job.errors or []), str(error)]
+    else:
+        # A job that stopped because it was cancelled keeps its status
+        if db_job.status != JobStatus.CANCELLED:
+            db_job.status = JobStatus.COMPLETED
+            db_job.eta_seconds = 0.0
+
+    db_job.finished_at = datetime.now()
+    db_job.updated_at = db_job.finished_at
+    db_session.commit()
+
+
+def count_active(db_session: Session, dataset_id: int, kind: str = None) -> int:
+    """Number of jobs of a dataset that are pending or running"""
+
+    query = (
+        db_session.query(job.Job)
+        .filter_by(dataset_id=dataset_id)
+        .filter(job.Job.status.in_(JobStatus.active))
+    )
+    if kind is not None:
+        query = query.filter_by(kind=kind)
+
+    return query.count()
+
+
+def cancel(db_session: Session, dataset_id: int, kind: str) -> int:
+    """Cancel the pending and running jobs of a dataset of one kind, and return their
+    number
+
+    Cancelled jobs are detached from the dataset, so that they outlive its deletion.
+    A running job stops at its next checkpoint, see `score.run_score_job`.
+    """
+
+    now = datetime.now()
+    return (
+        db_session.query(job.Job)
+        .filter_by(dataset_id=dataset_id, kind=kind)
+        .filter(job.Job.status.in_(JobStatus.active))
+        .update(
+            dict(
+                status=JobStatus.CANCELLED,
+                dataset_id=None,
+                finished_at=now,
+                updated_at=now,
+            ),
+            synchronize_session=False,
+        )
+    )
+
+
+def create_unless_active(
+    db_session: Session, dataset_id: int, kind: str, params: dict
+) -> Optional[int]:
+    """Add a pending job to a dataset unless it has an active job of the same kind,
+    and return the new job's id
+
+    The job is inserted by a single conditional statement, which runs under the
+    store's write lock on SQLite.  On a database server the dataset's row is locked
+    first, so that concurrent calls add one job at most.  The caller commits, then
+    submits the job.
+    """
+
+    db_session.query(dataset.Dataset.dataset_id).filter_by(
+        dataset_id=dataset_id
+    ).with_for_update().first()
+
+    active = exists().where(
+        job.Job.dataset_id == dataset_id,
+        job.Job.kind == kind,
+        job.Job.status.in_(JobStatus.active),
+    )
+
+    def json_value(value):
+        # PostgreSQL reads the bound string as text, while SQLite would cast it to a
+        # number
+        value = literal(value, JSON)
+        if db_session.get_bind().dialect.name == "postgresql":
+            return cast(value, JSON)
+        return value
+
+    values = dict(
+        dataset_id=literal(dataset_id),
+        kind=literal(kind),
+        status=literal(JobStatus.PENDING),
+        params=json_value(params),
+        rows_done=literal(0),
+        errors=json_value([]),
+        stats=json_value({}),
+        created_at=literal(datetime.now(), DateTime),
+    )
+    statement = insert(job.Job).from_select(
+        list(values), select(*values.values()).where(~active)
+    )
+    if not db_session.execute(statement).rowcount:
+        return None
+
+    return (
+        db_session.query(job.Job.job_id)
+        .filter_by(dataset_id=dataset_id, kind=kind, status=JobStatus.PENDING)
+        .order_by(job.Job.job_id.desc())
+        .limit(1)
+        .scalar()
+    )
+
+
+def submit(job_id: int) -> Future:
+    """Queue a job for execution on the worker pool"""
+
+    start_heartbeat()
+    return _executor.submit(run_job, job_id)
+
+
+def beat() -> None:
+    """Refresh the heartbeat of the jobs running in this process, then run the jobs
+    whose heartbeat is stale"""
+
+    with _running_lock:
+        job_ids = list(_running)
+
+    db_session = SessionLocal()
+    try:
+        if job_ids:
+            db_session.query(job.Job).filter(
+                job.Job.job_id.in_(job_ids), job.Job.status == JobStatus.RUNNING
+            ).update(dict(heartbeat_at=datetime.now()), synchronize_session=False)
+            db_session.commit()
+
+        requeued = job.requeue_stale(db_session, config.JOB_STALE_SECONDS)
+        db_session.commit()
+    finally:
+        db_session.close()
+
+    for job_id in requeued:
+        logger.info(f"Resuming job {job_id}, whose process stopped")
+        _executor.submit(run_job, job_id)
+
+
+def _beat_forever() -> None:
+    while True:
+        time.sleep(config.JOB_HEARTBEAT_SECONDS)
+        try:
+            beat()
+        except Exception:  # pylint: disable=broad-except
+            logger.exception("Job heartbeat failed")
+
+
+def start_heartbeat() -> None:
+    """Start the heartbeat thread of this process, unless it is running already"""
+
+    global _heartbeat  # pylint: disable=global-statement
+
+    with _heartbeat_lock:
+        if _heartbeat is None:
+            _heartbeat = threading.Thread(
+                target=_beat_forever, name="lablr-job-heartbeat", daemon=True
+            )
+            _heartbeat.start()
+
+
+def resume_pending() -> int:
+    """Queue every pending job, such as those interrupted when the store was last used
+
+    Each job is claimed atomically when it starts, so several worker processes can
+    call this concurrently and every job still runs once.  Also starts the heartbeat,
+    which resumes the running jobs of processes that stop later on.
+    """
+
+    start_heartbeat()
+
+    db_session = SessionLocal()
+    try:
+        job_ids = [
+            job_id
+            for (job_id,) in db_session.query(job.Job.job_id)
+            .filter_by(status=JobStatus.PENDING)
+            .order_by(job.Job.job_id)
+        ]
+    finally:
+        db_session.close()
+
+    for job_id in job_ids:
+        logger.info(f"Resuming pending job {job_id}")
+        submit(job_id)
+
+    return len(job_ids)
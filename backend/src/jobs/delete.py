@@ -0,0 +1,146 @@
+"""
+Set-based deletion of a dataset and every row that depends on it
+"""
+
+from typing import Optional
+from datetime import datetime
+import logging
+import time
+
+from sqlalchemy import delete, select
+from sqlalchemy.orm import Session
+
+from database import (
+    dataset,
+    job,
+    label_definition,
+    label_stats,
+    sample,
+    sample_label,
+)
+import scoring
+from util import cache, config, validation, work_queue
+
+logger = logging.getLogger(__name__)
+
+
+def delete_dependents(
+    db_session: Session, dataset_id: int, keep_job_id: Optional[int] = None
+) -> None:
+    """Delete everything but the samples that belongs to a dataset, then the dataset
+
+    Every table is cleared with one `DELETE ... WHERE dataset_id = ?` statement.  The
+    job with id `keep_job_id` is detached from the dataset instead of deleted, so that
+    its outcome can still be fetched.
+    """
+
+    jobs_query = db_session.query(job.Job).filter_by(dataset_id=dataset_id)
+    if keep_job_id is not None:
+        jobs_query = jobs_query.filter(job.Job.job_id != keep_job_id)
+        db_session.query(job.Job).filter_by(job_id=keep_job_id).update(
+            dict(dataset_id=None), synchronize_session=False
+        )
+    jobs_query.delete(synchronize_session=False)
+
+    label_stats.delete_dataset(db_session, dataset_id)
+    db_session.query(label_definition.LabelDefinition).filter_by(
+        dataset_id=dataset_id
+    ).delete(synchronize_session=False)
+
+    db_session.query(dataset.Dataset).filter_by(dataset_id=dataset_id).delete(
+        synchronize_session=False
+    )
+    cache.invalidate_on_commit(db_session)
+    cache.invalidate_on_commit(db_session, dataset_id)
+
+
+def forget_dataset(dataset_id: int) -> None:
+    """Drop what this process keeps in memory about a dataset once its deletion is
+    committed, so that no request running meanwhile caches it again
+
+    Other processes expire their validators after `config.CACHE_TTL_SECONDS`, and
+    dataset ids are never reused, so what they keep is never applied to another
+    dataset."""
+
+    validation.invalidate_validator(dataset_id)
+    work_queue.invalidate_queue(dataset_id)
+    scoring.forget_scorer(dataset_id)
+
+
+def delete_dataset_rows(db_session: Session, dataset_id: int) -> int:
+    """Delete a dataset and all of its rows in the caller's transaction
+
+    Returns the number of samples deleted.  The caller calls `forget_dataset` once
+    it commits.
+    """
+
+    sample_ids = select(sample.Sample.sample_id).where(
+        sample.Sample.dataset_id == dataset_id
+    )
+    db_session.query(sample_label.SampleLabel).filter(
+        sample_label.SampleLabel.sample_id.in_(sample_ids)
+    ).delete(synchronize_session=False)
+
+    deleted = (
+        db_session.query(sample.Sample)
+        .filter_by(dataset_id=dataset_id)
+        .delete(synchronize_session=False)
+    )
+    delete_dependents(db_session, dataset_id)
+
+    return deleted
+
+
+def run_delete_job(db_session: Session, db_job: job.Job) -> None:
+    """Delete a dataset's samples in chunks, committing after every chunk
+
+    Each chunk is a short transaction, so the database write lock is released
+    regularly and other writers such as labeling are never blocked for long.
+    """
+
+    dataset_id = db_job.params["dataset_id"]
+    sample_total = db_job.params.get("sample_count", 0)
+    resumed_from = db_job.rows_done or 0
+    started = time.monotonic()
+
+    # The chunk is ordered, so that the label values and the samples deleted with it
+    # belong to the same samples
+    chunk = (
+        select(sample.Sample.sample_id)
+        .where(sample.Sample.dataset_id == dataset_id)
+        .order_by(sample.Sample.sample_id)
+        .limit(config.DELETE_CHUNK_SIZE)
+        .scalar_subquery()
+    )
+    labels_statement = (
+        delete(sample_label.SampleLabel)
+        .where(sample_label.SampleLabel.sample_id.in_(chunk))
+        .execution_options(synchronize_session=False)
+    )
+    statement = (
+        delete(sample.Sample)
+        .where(sample.Sample.sample_id.in_(chunk))
+        .execution_options(synchronize_session=False)
+    )
+
+    while True:
+        db_session.execute(labels_statement)
+        deleted = db_session.execute(statement).rowcount
+        if deleted == 0:
+            break
+
+        elapsed = time.monotonic() - started
+        db_job.rows_done += deleted
+        db_job.updated_at = datetime.now()
+        db_job.rows_per_second = (db_job.rows_done - resumed_from) / elapsed
+        if db_job.rows_per_second > 0:
+            remaining = max(sample_total - db_job.rows_done, 0)
+            db_job.eta_seconds = remaining / db_job.rows_per_second
+        cache.invalidate_on_commit(db_session, dataset_id)
+        db_session.commit()
+
+    delete_dependents(db_session, dataset_id, keep_job_id=db_job.job_id)
+    db_session.commit()
+    forget_dataset(dataset_id)
+
+    logger.info(f"Job {db_job.job_id} deleted dataset {dataset_id}")
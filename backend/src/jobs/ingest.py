@@ -0,0 +1,130 @@
+"""
+Job handler that ingests a spooled upload into the samples table
+"""
+
+from typing import List
+from datetime import datetime
+from itertools import islice
+import logging
+import os
+import time
+
+from sqlalchemy.orm import Session
+
+from database import job
+from ingestion import (
+    Deduplicator,
+    Row,
+    check_rows,
+    insert_batch,
+    iter_batches,
+    open_reader,
+)
+from util import config
+from util.constants import DedupModes, UploadFormats
+
+logger = logging.getLogger(__name__)
+
+
+def run_ingest_job(db_session: Session, db_job: job.Job) -> None:
+    """Insert the rows of a spooled upload, committing a checkpoint with every batch
+
+    Rows already recorded in `rows_done` by a previous attempt are skipped, so an
+    interrupted job resumes from its last committed batch.  With the `dedup` param
+    set, near-duplicate rows are dropped or linked to the first row like them.
+    """
+
+    params = db_job.params
+    path = params["path"]
+
+    try:
+        _ingest_file(db_session, db_job, path)
+    finally:
+        if params.get("delete_source", True) and os.path.exists(path):
+            os.remove(path)
+
+
+def _ingest_file(db_session: Session, db_job: job.Job, path: str) -> None:
+    params = db_job.params
+    resumed_from = db_job.rows_done or 0
+    started = time.monotonic()
+
+    with open(path, "rb") as fileobj:
+        db_job.bytes_total = os.fstat(fileobj.fileno()).st_size
+
+        # Jobs queued before other formats were accepted only have CSV files
+        reader = open_reader(
+            fileobj,
+            params["id_field"],
+            params["text_field"],
+            params.get("format", UploadFormats.CSV),
+            params.get("compression"),
+        )
+        try:
+            rows = check_rows(reader, params["id_field"], params["text_field"])
+            deduplicator = None
+            if params.get("dedup", DedupModes.NONE) != DedupModes.NONE:
+                deduplicator = Deduplicator()
+
+                # Clusters only live in memory, so a resumed job rebuilds them from
+                # the rows it already ingested
+                for batch in iter_batches(
+                    islice(rows, resumed_from), config.INGESTION_BATCH_SIZE
+                ):
+                    deduplicator.assign([text for _, text in batch])
+            else:
+                rows = islice(rows, resumed_from, None)
+
+            for batch in iter_batches(rows, config.INGESTION_BATCH_SIZE):
+                if deduplicator is None:
+                    insert_batch(db_session, db_job.dataset_id, batch)
+                else:
+                    _insert_deduplicated(db_session, db_job, deduplicator, batch)
+
+                # Progress is committed in the same transaction as the batch itself
+                elapsed = time.monotonic() - started
+                db_job.rows_done += len(batch)
+                db_job.bytes_done = min(reader.tell(), db_job.bytes_total)
+                db_job.updated_at = datetime.now()
+                db_job.rows_per_second = (db_job.rows_done - resumed_from) / elapsed
+                db_job.eta_seconds = _estimate_eta(db_job, elapsed)
+                db_session.commit()
+        finally:
+            reader.close()
+
+    logger.info(
+        f"Job {db_job.job_id} ingested {db_job.rows_done} samples "
+        f"({db_job.rows_per_second:.0f} rows/sec)"
+    )
+
+
+def _insert_deduplicated(
+    db_session: Session,
+    db_job: job.Job,
+    deduplicator: Deduplicator,
+    batch: List[Row],
+) -> None:
+    matches = deduplicator.assign([text for _, text in batch])
+
+    if db_job.params["dedup"] == DedupModes.DROP:
+        kept = [row for row, match in zip(batch, matches) if not match.is_duplicate]
+        insert_batch(db_session, db_job.dataset_id, kept)
+    else:
+        # Clusters are named after the job and the row of their canonical sample
+        clusters = [
+            (f"{db_job.job_id}:{match.cluster}", match.is_duplicate)
+            for match in matches
+        ]
+        insert_batch(db_session, db_job.dataset_id, batch, clusters)
+
+    db_job.stats = dict(dedup=db_job.params["dedup"], **deduplicator.stats)
+
+
+def _estimate_eta(db_job: job.Job, elapsed: float):
+    """Extrapolate the remaining time from the bytes consumed so far"""
+
+    if elapsed <= 0 or not db_job.bytes_done:
+        return None
+
+    bytes_per_second = db_job.bytes_done / elapsed
+    return (db_job.bytes_total - db_job.bytes_done) / bytes_per_second
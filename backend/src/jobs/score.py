@@ -0,0 +1,123 @@
+"""
+Job handler that retrains a dataset's scorer and scores its unlabeled samples
+"""
+
+from datetime import datetime
+import logging
+import time
+
+import numpy as np
+from sqlalchemy import bindparam
+from sqlalchemy.orm import Session
+
+from database import job, label_definition, sample, sample_label
+import scoring
+from util import config
+from util.constants import JobStatus
+
+logger = logging.getLogger(__name__)
+
+
+def _training_set(db_session: Session, dataset_id: int, definition_id: int):
+    rows = (
+        db_session.query(sample.Sample.text, sample_label.SampleLabel.value)
+        .join(
+            sample_label.SampleLabel,
+            sample_label.SampleLabel.sample_id == sample.Sample.sample_id,
+        )
+        .filter(
+            sample.Sample.dataset_id == dataset_id,
+            sample.Sample.is_duplicate.is_(False),
+            sample_label.SampleLabel.label_definition_id == definition_id,
+        )
+        .all()
+    )
+    return [text for text, _ in rows], np.array([value for _, value in rows])
+
+
+def run_score_job(db_session: Session, db_job: job.Job) -> None:
+    """Fit the dataset's scorer on its labels, then score its unlabeled samples
+
+    The scorer is trained to predict the job's label, and its uncertainty about
+    every unlabeled sample is written in chunks of `config.SCORE_CHUNK_SIZE`, each
+    committed with the id of its last sample.  An interrupted job retrains, then
+    resumes after that id.  A cancelled job stops before its next chunk.  Without
+    enough labels of each class, the job is skipped, which `stats` records.
+    """
+
+    params = db_job.params
+    dataset_id = params["dataset_id"]
+    after_id = (db_job.stats or {}).get("after_id", 0)
+    definition = (
+        db_session.query(label_definition.LabelDefinition)
+        .filter_by(label_definition_id=params["label_definition_id"])
+        .first()
+    )
+
+    texts, values = _training_set(
+        db_session, dataset_id, definition.label_definition_id
+    )
+    targets = scoring.binary_targets(definition, values)
+    positives = int(targets.sum())
+    db_job.stats = dict(labels=len(targets), positives=positives)
+    if len(targets) < config.SCORE_MIN_LABELS or positives in (0, len(targets)):
+        # Recorded so that the next queue request retries once a label is added
+        db_job.stats = dict(db_job.stats, skipped=True)
+        logger.info(f"Job {db_job.job_id} has too few labels of each class to train")
+        return
+
+    scorer = scoring.get_scorer(dataset_id)
+    scorer.fit(texts, targets)
+
+    table = sample.Sample.__table__
+    statement = (
+        table.update()
+        .where(table.c.sample_id == bindparam("b_sample_id"))
+        .values(uncertainty=bindparam("b_uncertainty"))
+    )
+
+    sample_total = params.get("sample_count", 0)
+    resumed_from = db_job.rows_done or 0
+    started = time.monotonic()
+
+    while True:
+        db_session.refresh(db_job, ["status"])
+        if db_job.status == JobStatus.CANCELLED:
+            logger.info(f"Job {db_job.job_id} was cancelled")
+            return
+
+        rows = (
+            db_session.query(sample.Sample.sample_id, sample.Sample.text)
+            .filter_by(dataset_id=dataset_id, is_labeled=False, is_duplicate=False)
+            .filter(sample.Sample.sample_id > after_id)
+            .order_by(sample.Sample.sample_id)
+            .limit(config.SCORE_CHUNK_SIZE)
+            .all()
+        )
+        if not rows:
+            break
+
+        # Inference is vectorized over the whole chunk
+        uncertainties = scoring.uncertainty(
+            scorer.predict_proba([text for _, text in rows])
+        )
+        db_session.execute(
+            statement,
+            [
+                dict(b_sample_id=sample_id, b_uncertainty=value)
+                for (sample_id, _), value in zip(rows, uncertainties.tolist())
+            ],
+        )
+
+        after_id = rows[-1][0]
+        elapsed = time.monotonic() - started
+        db_job.rows_done += len(rows)
+        db_job.updated_at = datetime.now()
+        db_job.rows_per_second = (db_job.rows_done - resumed_from) / elapsed
+        if db_job.rows_per_second > 0:
+            remaining = max(sample_total - db_job.rows_done, 0)
+            db_job.eta_seconds = remaining / db_job.rows_per_second
+        db_job.stats = dict(labels=len(targets), positives=positives, after_id=after_id)
+        db_session.commit()
+
+    logger.info(f"Job {db_job.job_id} scored {db_job.rows_done} samples")
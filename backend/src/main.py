@@ -2,18 +2,18 @@
 Entrypoint script for the FastAPI application
 """
 
-import os
-
+import anyio
 from fastapi import FastAPI
 
-from routers import datasets, samples
-from database import engine, Base
-
-LABLR_DIR = f"{os.environ.get('HOME')}/.lablr"
-if not os.path.exists(LABLR_DIR):
-    os.makedirs(LABLR_DIR)
+from routers import admin, datasets, jobs, samples
+from database.setup import prepare_store
+from util.config import REQUEST_THREADS, STORE_PREPARED
+from util.metrics import MetricsMiddleware
+import jobs as job_runner
 
-Base.metadata.create_all(bind=engine)
+# Under gunicorn the master process prepares the store once, before forking workers
+if not STORE_PREPARED:
+    prepare_store()
 
 PREFIX = "/api/v1"
 
@@ -25,5 +25,26 @@ app = FastAPI(
     openapi_url=f"{PREFIX}/openapi.json",
 )
 
+app.add_middleware(MetricsMiddleware)
+
 app.include_router(datasets.router, prefix=PREFIX)
 app.include_router(samples.router, prefix=PREFIX)
+app.include_router(jobs.router, prefix=PREFIX)
+app.include_router(admin.router, prefix=PREFIX)
+
+
+@app.on_event("startup")
+async def configure_threadpool():
+    """Bound the thread pool that runs the (blocking) route handlers
+
+    Every route is a plain `def`, so FastAPI runs it in this pool and database
+    calls never stall the event loop."""
+
+    anyio.to_thread.current_default_thread_limiter().total_tokens = REQUEST_THREADS
+
+
+@app.on_event("startup")
+def resume_jobs():
+    """Queue pending jobs, including those interrupted by a previous shutdown"""
+
+    job_runner.resume_pending()
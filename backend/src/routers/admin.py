@@ -0,0 +1,130 @@
+"""
+Administrative routes for maintaining the application's store
+"""
+
+from typing import Dict, Optional
+import logging
+
+from fastapi import APIRouter, Depends, HTTPException
+from fastapi.responses import PlainTextResponse
+from pydantic import BaseModel  # pylint: disable=no-name-in-module
+from sqlalchemy.orm import Session
+
+from database import IS_SQLITE, counters, dataset, engine, get_db, label_stats, storage
+from util import cache, config, metrics
+
+router = APIRouter(route_class=metrics.MetricsRoute)
+logger = logging.getLogger(__name__)
+
+
+class DatasetCounters(BaseModel):
+    """Schema of the recomputed counters of a dataset"""
+
+    dataset_id: int
+    sample_count: int
+    labeled_count: int
+
+
+@router.post(
+    "/admin/datasets/{dataset_id}/recount",
+    response_model=DatasetCounters,
+    tags=["admin"],
+)
+def recount_dataset(dataset_id, db_session: Session = Depends(get_db)):
+    """Recompute a dataset's sample and label counters, and its label statistics,
+    from its samples"""
+
+    db_dataset = (
+        db_session.query(dataset.Dataset).filter_by(dataset_id=dataset_id).first()
+    )
+
+    if db_dataset is None:
+        raise HTTPException(
+            status_code=404, detail=f"No dataset found with id `{dataset_id}`"
+        )
+
+    result = counters.recount(db_session, db_dataset.dataset_id)
+    label_stats.recompute(db_session, db_dataset.dataset_id)
+    cache.invalidate_on_commit(db_session, db_dataset.dataset_id)
+    db_session.commit()
+
+    logger.info(f"Recounted dataset {dataset_id}: {result}")
+
+    return dict(dataset_id=db_dataset.dataset_id, **result)
+
+
+class PoolStatus(BaseModel):
+    """Schema of the connection pool's configuration and usage"""
+
+    size: int
+    max_overflow: int
+    checked_out: int
+    overflow: int
+
+
+class StorageDiagnostics(BaseModel):
+    """Schema of the storage settings in effect
+
+    The profile and pragmas only apply to SQLite and are empty for other backends.
+    """
+
+    backend: str
+    profile: Optional[str]
+    requested_pragmas: Dict[str, str]
+    effective_pragmas: Dict[str, str]
+    pool: PoolStatus
+
+
+@router.get("/admin/storage", response_model=StorageDiagnostics, tags=["admin"])
+def get_storage_diagnostics():
+    """Report the active storage profile and the settings SQLite actually applied"""
+
+    requested, effective = {}, {}
+    if IS_SQLITE:
+        requested = storage.PRAGMAS
+        with engine.connect() as connection:
+            effective = storage.effective_pragmas(connection.connection)
+
+    pool = engine.pool
+    return dict(
+        backend=engine.dialect.name,
+        profile=storage.PROFILE_NAME if IS_SQLITE else None,
+        requested_pragmas=requested,
+        effective_pragmas=effective,
+        pool=dict(
+            size=pool.size(),
+            max_overflow=config.DB_MAX_OVERFLOW,
+            checked_out=pool.checkedout(),
+            overflow=max(pool.overflow(), 0),
+        ),
+    )
+
+
+class CacheStats(BaseModel):
+    """Schema of the response cache's counts, for tuning its size and TTL"""
+
+    size: int
+    ttl_seconds: float
+    entries: int
+    hits: int
+    misses: int
+    hit_rate: float
+    not_modified: int
+    evictions: int
+
+
+@router.get("/admin/cache", response_model=CacheStats, tags=["admin"])
+def get_cache_stats():
+    """Report the hits and misses of this worker process's response cache"""
+
+    return cache.responses.stats()
+
+
+@router.get("/metrics", response_class=PlainTextResponse, tags=["admin"])
+def get_metrics():
+    """Report this worker process's request latencies, database queries and
+    serialization times per route, in the Prometheus text format"""
+
+    return PlainTextResponse(
+        metrics.registry.render(), media_type="text/plain; version=0.0.4"
+    )
@@ -2,20 +2,23 @@
 Routes related to Dataset objects
 """
 
-from typing import List, Optional
+from typing import Dict, List, Optional
 from datetime import datetime
-from io import StringIO
-import csv
 import logging
 
-from fastapi import APIRouter, Depends, HTTPException, Response
+from fastapi import APIRouter, Depends, HTTPException, Request, Response
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel  # pylint: disable=no-name-in-module
 from sqlalchemy.orm import Session
 
-from database import dataset, label_definition, sample, get_db
-from util.constants import LabelVariants
+from database import dataset, job, label_definition, label_stats, get_db
+import jobs
+from jobs import delete
+from util import cache, export, metrics, validation
+from util.constants import JobKinds, JobStatus, LabelVariants
+from .jobs import JobGet
 
-router = APIRouter()
+router = APIRouter(route_class=metrics.MetricsRoute)
 logger = logging.getLogger(__name__)
 
 
@@ -57,6 +60,8 @@ class DatasetGetOne(DatasetGet):
     """Schema of a response for fetching a single dataset"""
 
     labels: List[LabelDefinition]
+    sample_count: int
+    labeled_count: int
     labeled_percent: float
 
 
@@ -66,17 +71,42 @@ class DatasetCreate(Dataset):
     labels: List[LabelDefinition]
 
 
-@router.get("/datasets", response_model=List[DatasetGet], tags=["datasets"])
-async def get_datasets(db_session: Session = Depends(get_db)):
+@router.get(
+    "/datasets",
+    response_model=List[DatasetGet],
+    responses=cache.NOT_MODIFIED,
+    tags=["datasets"],
+)
+def get_datasets(request: Request, db_session: Session = Depends(get_db)):
     """Get all datasets"""
 
-    return db_session.query(dataset.Dataset).all()
+    def read():
+        return [
+            DatasetGet.from_orm(db_dataset)
+            for db_dataset in db_session.query(dataset.Dataset).all()
+        ]
 
+    return cache.respond(request, "datasets", cache.DATASETS_SCOPE, read)
 
-@router.get("/datasets/{dataset_id}", response_model=DatasetGetOne, tags=["datasets"])
-async def get_dataset(dataset_id, db_session: Session = Depends(get_db)):
+
+@router.get(
+    "/datasets/{dataset_id}",
+    response_model=DatasetGetOne,
+    responses=cache.NOT_MODIFIED,
+    tags=["datasets"],
+)
+def get_dataset(dataset_id, request: Request, db_session: Session = Depends(get_db)):
     """Get one dataset"""
 
+    return cache.respond(
+        request,
+        f"dataset:{dataset_id}",
+        cache.dataset_scope(dataset_id),
+        lambda: _read_dataset(db_session, dataset_id),
+    )
+
+
+def _read_dataset(db_session: Session, dataset_id) -> DatasetGetOne:
     db_dataset = (
         db_session.query(dataset.Dataset).filter_by(dataset_id=dataset_id).first()
     )
@@ -86,15 +116,10 @@ async def get_dataset(dataset_id, db_session: Session = Depends(get_db)):
             status_code=404, detail=f"No dataset found with id `{dataset_id}`"
         )
 
-    # Calculate labeled percentage
-    query = db_session.query(sample.Sample).filter_by(dataset_id=dataset_id)
-
-    samples_count = query.count()
-    labeled_count = query.filter(sample.Sample.labels.isnot(None)).count()
-
+    # Calculate labeled percentage from the maintained counters
     labeled_percent = 1  # 100% labeled if there are zero samples to begin with
-    if samples_count > 0:
-        labeled_percent = float(labeled_count) / samples_count
+    if db_dataset.sample_count > 0:
+        labeled_percent = float(db_dataset.labeled_count) / db_dataset.sample_count
 
     response = dict(
         dataset_id=db_dataset.dataset_id,
@@ -102,15 +127,142 @@ async def get_dataset(dataset_id, db_session: Session = Depends(get_db)):
         description=db_dataset.description,
         created_at=db_dataset.created_at,
         labels=db_dataset.labels,
+        sample_count=db_dataset.sample_count,
+        labeled_count=db_dataset.labeled_count,
         labeled_percent=labeled_percent,
     )
 
-    return response
+    return DatasetGetOne(**response)
+
+
+class HistogramBin(BaseModel):
+    """Schema of the number of values of a label nearest to one step"""
+
+    value: float
+    count: int
+
+
+class LabelStats(BaseModel):
+    """Schema of the distribution of one label's values"""
+
+    name: str
+    variant: str
+    count: int
+    mean: Optional[float]
+    positive_rate: Optional[float]  # Boolean labels only
+    histogram: List[HistogramBin]
+
+
+class DatasetStats(BaseModel):
+    """Schema of a response for fetching the label statistics of a dataset"""
+
+    dataset_id: int
+    sample_count: int
+    labeled_count: int
+    labels: List[LabelStats]
+
+
+# Numerical labels with more steps than this only report their non-empty bins
+MAX_HISTOGRAM_BINS = 1000
+
+
+def _histogram(definition, bins: Dict[int, int]) -> List[dict]:
+    if definition.variant == LabelVariants.BOOLEAN:
+        return [dict(value=index, count=bins.get(index, 0)) for index in (0, 1)]
+
+    interval = definition.interval if (definition.interval or 0) > 0 else 0
+    steps = (
+        round((definition.maximum - definition.minimum) / interval) if interval else 0
+    )
+    indexes = range(steps + 1) if steps < MAX_HISTOGRAM_BINS else sorted(bins)
+    return [
+        dict(value=definition.minimum + index * interval, count=bins.get(index, 0))
+        for index in indexes
+    ]
+
+
+@router.get(
+    "/datasets/{dataset_id}/stats",
+    response_model=DatasetStats,
+    responses=cache.NOT_MODIFIED,
+    tags=["datasets"],
+)
+def get_dataset_stats(
+    dataset_id, request: Request, db_session: Session = Depends(get_db)
+):
+    """Get the count, mean and histogram of every label of a dataset.
+
+    The statistics are maintained as samples are labeled, so they are read without
+    scanning the samples."""
+
+    return cache.respond(
+        request,
+        f"dataset:{dataset_id}:stats",
+        cache.dataset_scope(dataset_id),
+        lambda: _read_dataset_stats(db_session, dataset_id),
+    )
+
+
+def _read_dataset_stats(db_session: Session, dataset_id) -> DatasetStats:
+    db_dataset = (
+        db_session.query(dataset.Dataset).filter_by(dataset_id=dataset_id).first()
+    )
+
+    if db_dataset is None:
+        raise HTTPException(
+            status_code=404, detail=f"No dataset found with id `{dataset_id}`"
+        )
+
+    bins_of: Dict[int, Dict[int, int]] = {}
+    sums: Dict[int, float] = {}
+    for stat in (
+        db_session.query(label_stats.LabelStat)
+        .filter_by(dataset_id=db_dataset.dataset_id)
+        .filter(label_stats.LabelStat.count > 0)
+    ):
+        bins_of.setdefault(stat.label_definition_id, {})[stat.bin] = stat.count
+        sums[stat.label_definition_id] = (
+            sums.get(stat.label_definition_id, 0.0) + stat.value_sum
+        )
+
+    labels = []
+    for definition in db_dataset.labels:
+        bins = bins_of.get(definition.label_definition_id, {})
+        count = sum(bins.values())
+        mean = sums[definition.label_definition_id] / count if count else None
+        labels.append(
+            dict(
+                name=definition.name,
+                variant=definition.variant,
+                count=count,
+                mean=mean,
+                positive_rate=(
+                    mean if definition.variant == LabelVariants.BOOLEAN else None
+                ),
+                histogram=_histogram(definition, bins),
+            )
+        )
+
+    return DatasetStats(
+        dataset_id=db_dataset.dataset_id,
+        sample_count=db_dataset.sample_count,
+        labeled_count=db_dataset.labeled_count,
+        labels=labels,
+    )
 
 
 @router.delete("/datasets/{dataset_id}", tags=["datasets"])
-async def delete_dataset(dataset_id, db_session: Session = Depends(get_db)):
-    """Delete a dataset and its dependent label definitions and samples"""
+def delete_dataset(
+    dataset_id,
+    response: Response,
+    background: bool = False,
+    db_session: Session = Depends(get_db),
+):
+    """Delete a dataset and its dependent label definitions and samples.
+
+    With `background`, samples are deleted in chunks by a job, which is returned
+    immediately with a 202 so that its progress can be polled.  The dataset's score
+    jobs are cancelled."""
 
     # Fetch dataset
     db_dataset = (
@@ -122,24 +274,49 @@ async def delete_dataset(dataset_id, db_session: Session = Depends(get_db)):
             status_code=404, detail=f"No dataset found with id `{dataset_id}`"
         )
 
-    # Delete label definitions
-    for label in db_dataset.labels:
-        db_session.delete(label)
+    # Score jobs only rank the samples, and are started by reading the queue, so
+    # they are cancelled.  Refuse while another job is still writing to or deleting
+    # the dataset.
+    jobs.cancel(db_session, db_dataset.dataset_id, JobKinds.SCORE)
+    active_jobs = jobs.count_active(db_session, db_dataset.dataset_id)
+    if active_jobs > 0:
+        raise HTTPException(
+            status_code=409,
+            detail=f"Dataset with id `{dataset_id}` has {active_jobs} job(s) in progress",
+        )
 
-    # Delete samples
-    for db_sample in db_dataset.samples:
-        db_session.delete(db_sample)
+    if background:
+        db_job = job.Job(
+            dataset_id=db_dataset.dataset_id,
+            kind=JobKinds.DELETE,
+            status=JobStatus.PENDING,
+            params=dict(
+                dataset_id=db_dataset.dataset_id,
+                sample_count=db_dataset.sample_count,
+            ),
+            rows_done=0,
+            errors=[],
+            created_at=datetime.now(),
+        )
+        db_session.add(db_job)
+        db_session.commit()
+
+        jobs.submit(db_job.job_id)
 
-    # Delete dataset
-    db_session.delete(db_dataset)
+        response.status_code = 202
+        return JobGet.from_orm(db_job)
 
+    # Delete samples, label definitions, jobs and the dataset with set-based statements
+    deleted_id = db_dataset.dataset_id
+    delete.delete_dataset_rows(db_session, deleted_id)
     db_session.commit()
+    delete.forget_dataset(deleted_id)
 
     return f"Successfully deleted dataset with id `{dataset_id}`"
 
 
 @router.post("/datasets", response_model=DatasetGet, tags=["datasets"])
-async def create_dataset(data: DatasetCreate, db_session: Session = Depends(get_db)):
+def create_dataset(data: DatasetCreate, db_session: Session = Depends(get_db)):
     """Create a dataset and its dependent label definitions and samples"""
 
     # Create dataset object
@@ -147,8 +324,11 @@ async def create_dataset(data: DatasetCreate, db_session: Session = Depends(get_
         name=data.name,
         description=data.description,
         created_at=datetime.now(),
+        sample_count=0,
+        labeled_count=0,
     )
     db_session.add(db_dataset)
+    cache.invalidate_on_commit(db_session)
     db_session.commit()
 
     # Create label definitions
@@ -156,6 +336,7 @@ async def create_dataset(data: DatasetCreate, db_session: Session = Depends(get_
     for label in data.labels:
         if label.variant not in LabelVariants.valid_labels:
             db_session.delete(db_dataset)
+            cache.invalidate_on_commit(db_session)
             db_session.commit()
             raise HTTPException(
                 status_code=422,
@@ -176,16 +357,29 @@ async def create_dataset(data: DatasetCreate, db_session: Session = Depends(get_
     for db_label in db_labels:
         db_session.add(db_label)
 
+    cache.invalidate_on_commit(db_session, db_dataset.dataset_id)
     db_session.commit()
+    validation.invalidate_validator(db_dataset.dataset_id)
 
     db_session.refresh(db_dataset)
 
     return db_dataset
 
 
-@router.get("/datasets/{dataset_id}/export", response_class=Response, tags=["datasets"])
-async def export_labels(dataset_id, db_session: Session = Depends(get_db)):
-    """Export a dataset's labels in CSV format"""
+@router.get(
+    "/datasets/{dataset_id}/export",
+    response_class=StreamingResponse,
+    tags=["datasets"],
+)
+def export_labels(
+    dataset_id,
+    format: str = "csv",  # pylint: disable=redefined-builtin
+    include_text: bool = False,
+    db_session: Session = Depends(get_db),
+):
+    """Export a dataset's labels, streamed as they are generated.
+
+    `format` is one of `csv`, `jsonl`, `arrow` (IPC stream) or `parquet`."""
 
     db_dataset = (
         db_session.query(dataset.Dataset).filter_by(dataset_id=dataset_id).first()
@@ -196,23 +390,23 @@ async def export_labels(dataset_id, db_session: Session = Depends(get_db)):
             status_code=404, detail=f"No dataset found with id `{dataset_id}`"
         )
 
-    output = StringIO()
-
-    label_names = ["id"]
-    for label in db_dataset.labels:
-        label_names.append(label.name)
-
-    writer = csv.DictWriter(output, label_names)
-    writer.writeheader()
-
-    for db_sample in db_dataset.samples:
-        if db_sample.labels is None:
-            continue
-
-        body = dict(
-            id=db_sample.original_id,
-            **db_sample.labels,
+    exporter_class = export.EXPORTERS.get(format)
+    if exporter_class is None:
+        raise HTTPException(
+            status_code=422,
+            detail=f"Format `{format}` must be one of {tuple(export.EXPORTERS)}",
         )
-        writer.writerow(body)
 
-    return Response(content=output.getvalue(), media_type="text/csv")
+    labels = [(label.name, label.variant) for label in db_dataset.labels]
+    exporter = exporter_class(labels, include_text=include_text)
+    definitions = [
+        (label.label_definition_id, label.name) for label in db_dataset.labels
+    ]
+    rows = export.iter_labeled_samples(db_dataset.dataset_id, definitions, include_text)
+    filename = f"dataset-{dataset_id}.{exporter.extension}"
+
+    return StreamingResponse(
+        exporter.stream(rows),
+        media_type=exporter.media_type,
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
@@ -0,0 +1,53 @@
+"""
+Routes related to Job objects
+"""
+
+from typing import Any, Dict, List, Optional
+from datetime import datetime
+import logging
+
+from fastapi import APIRouter, Depends, HTTPException
+from pydantic import BaseModel  # pylint: disable=no-name-in-module
+from sqlalchemy.orm import Session
+
+from database import job, get_db
+from util import metrics
+
+router = APIRouter(route_class=metrics.MetricsRoute)
+logger = logging.getLogger(__name__)
+
+
+class JobGet(BaseModel):
+    """Schema of a response for fetching a job and its progress"""
+
+    job_id: int
+    dataset_id: Optional[int]
+    kind: str
+    status: str
+    rows_done: int
+    rows_per_second: float
+    bytes_done: int
+    bytes_total: int
+    eta_seconds: Optional[float]
+    errors: List[str]
+    stats: Optional[Dict[str, Any]]
+    created_at: datetime
+    started_at: Optional[datetime]
+    finished_at: Optional[datetime]
+
+    class Config:
+        """Pydantic Config subclass"""
+
+        orm_mode = True
+
+
+@router.get("/jobs/{job_id}", response_model=JobGet, tags=["jobs"])
+def get_job(job_id, db_session: Session = Depends(get_db)):
+    """Get the progress of a background job"""
+
+    db_job = db_session.query(job.Job).filter_by(job_id=job_id).first()
+
+    if db_job is None:
+        raise HTTPException(status_code=404, detail=f"No job found with id `{job_id}`")
+
+    return db_job
@@ -3,18 +3,46 @@ Routes related to Dataset objects
 """
 
 from typing import Dict, List, Optional
-from io import StringIO
+from datetime import datetime
 import logging
-import csv
-
-from fastapi import APIRouter, HTTPException, Depends, File, UploadFile, Form
+import operator
+import os
+import shutil
+import uuid
+
+from fastapi import (
+    APIRouter,
+    HTTPException,
+    Depends,
+    File,
+    UploadFile,
+    Form,
+    Query,
+    Request,
+)
 from pydantic import BaseModel  # pylint: disable=no-name-in-module
-from sqlalchemy.orm import Session
-
-from database import dataset, sample, label_definition, get_db
-from util.constants import LabelVariants
-
-router = APIRouter()
+from sqlalchemy import select
+from sqlalchemy.orm import Session, selectinload
+
+from database import (
+    counters,
+    dataset,
+    label_definition,
+    label_stats,
+    sample,
+    sample_label,
+    job,
+    get_db,
+)
+import ingestion
+import jobs
+from util import cache, config, metrics, search, validation, work_queue
+from util.chunks import chunks
+from util.constants import DedupModes, JobKinds, JobStatus, QueueOrders
+from util.pagination import InvalidCursorError, decode_cursor, encode_cursor
+from .jobs import JobGet
+
+router = APIRouter(route_class=metrics.MetricsRoute)
 logger = logging.getLogger(__name__)
 
 
@@ -26,6 +54,8 @@ class Sample(BaseModel):
     text: str
     labels: Optional[Dict[str, float]]
     save_for_later: bool
+    cluster_id: Optional[str]
+    is_duplicate: bool
 
     class Config:
         """Pydantic Config subclass"""
@@ -39,6 +69,7 @@ class PaginationMetadata(BaseModel):
     offset: int
     limit: int
     next_offset: Optional[int]
+    next_cursor: Optional[str]
     total: int
 
 
@@ -56,46 +87,156 @@ class SamplesGet(BaseModel):
     metadata: Metadata
 
 
+# Comparisons of a label value filter
+LABEL_FILTER_OPS = dict(
+    eq=operator.eq,
+    ne=operator.ne,
+    gt=operator.gt,
+    ge=operator.ge,
+    lt=operator.lt,
+    le=operator.le,
+)
+
+
+def _label_filter(validator: validation.LabelValidator, spec: str):
+    """Condition selecting the samples matching a `<name>:<op>:<value>` filter"""
+
+    try:
+        name, op_name, value = spec.rsplit(":", 2)
+        op = LABEL_FILTER_OPS[op_name]
+        value = float(value)
+    except (KeyError, ValueError) as error:
+        raise ValueError(
+            f"Label filter `{spec}` must be written `<name>:<op>:<value>` with an op "
+            f"among {tuple(LABEL_FILTER_OPS)}"
+        ) from error
+
+    rule = validator.rules.get(name)
+    if rule is None:
+        raise ValueError(f"Label `{name}` is not a valid label for this dataset")
+
+    values = sample_label.SampleLabel
+    return sample.Sample.sample_id.in_(
+        select(values.sample_id).where(
+            values.label_definition_id == rule.label_definition_id,
+            op(values.value, value),
+        )
+    )
+
+
 @router.get(
     "/datasets/{dataset_id}/samples", response_model=SamplesGet, tags=["samples"]
 )
-def get_samples(
+def get_samples(  # pylint: disable=too-many-branches,too-many-statements
     dataset_id,
     offset: int = 0,
     limit: int = 1,
+    after: Optional[str] = None,
     labeled: Optional[bool] = None,
+    q: Optional[str] = None,
+    label: Optional[List[str]] = Query(None),
     db_session: Session = Depends(get_db),
 ):
-    """Get multiple samples belonging to a dataset"""
+    """Get multiple samples belonging to a dataset
+
+    Samples are paginated either with `offset` or, at a constant cost per page,
+    by passing the `next_cursor` of the previous page as `after`.
+
+    Every `label` filter, written `<name>:<op>:<value>` with an op among `eq`, `ne`,
+    `gt`, `ge`, `lt` and `le` (e.g. `sentiment:gt:0.5`), keeps only samples whose
+    value of that label compares accordingly.
+
+    With `q`, only samples whose text contains every word of `q` are returned, best
+    matches first, and they are paginated with `offset`."""
+
+    db_dataset = (
+        db_session.query(dataset.Dataset).filter_by(dataset_id=dataset_id).first()
+    )
+
+    if db_dataset is None:
+        raise HTTPException(
+            status_code=404, detail=f"No dataset found with id `{dataset_id}`"
+        )
 
-    query = db_session.query(sample.Sample).filter_by(dataset_id=dataset_id)
+    query = (
+        db_session.query(sample.Sample)
+        .filter_by(dataset_id=dataset_id)
+        .options(selectinload(sample.Sample.label_values))
+    )
 
-    samples_count = query.count()
-    labeled_count = query.filter(sample.Sample.labels.isnot(None)).count()
+    # Totals come from the dataset's maintained counters rather than COUNT(*)
+    samples_count = db_dataset.sample_count
+    labeled_count = db_dataset.labeled_count
     labeled_percent = 0
     if samples_count > 0:
         labeled_percent = float(labeled_count) / samples_count
 
     # Filter by labeled or not
+    total = samples_count
     if labeled is not None:
         if labeled:
-            query = query.filter(sample.Sample.labels.isnot(None))
+            query = query.filter_by(is_labeled=True)
+            total = labeled_count
         else:
-            query = query.filter_by(labels=None)
+            query = query.filter_by(is_labeled=False)
+            total = samples_count - labeled_count
+
+    # Filter by label values, each with a range scan of the label values index
+    if label:
+        validator = validation.get_validator(db_session, db_dataset.dataset_id)
+        try:
+            query = query.filter(*[_label_filter(validator, spec) for spec in label])
+        except ValueError as error:
+            raise HTTPException(status_code=422, detail=str(error)) from error
+
+        # The counters cannot tell how many samples match
+        total = query.count()
+
+    # Full-text search
+    searching = bool(q) and not q.isspace()
+    if searching:
+        if after is not None:
+            raise HTTPException(
+                status_code=422,
+                detail="Search results are paginated with `offset`, not `after`",
+            )
+        # The counters cannot tell how many samples match
+        total = search.matching(db_session, query, q).count()
+        query = search.ranked(db_session, query, q)
+    else:
+        query = query.order_by(sample.Sample.sample_id)
 
     # Pagination Metadata
-    total = query.count()
-    query = query.offset(offset).limit(limit)
-
-    next_offset = offset + limit
-    if next_offset >= total:
+    if after is not None:
+        try:
+            after_id = decode_cursor(after)
+        except InvalidCursorError as error:
+            raise HTTPException(status_code=422, detail=str(error)) from error
+
+        # Keyset pagination seeks directly to the cursor through the primary key
+        offset = 0
         next_offset = None
+        query = query.filter(sample.Sample.sample_id > after_id)
+    else:
+        next_offset = offset + limit
+        if next_offset >= total:
+            next_offset = None
+        query = query.offset(offset)
+
+    # Fetch one extra row to find out whether another page follows
+    db_samples = query.limit(limit + 1).all()
+    next_cursor = None
+    if len(db_samples) > limit:
+        db_samples = db_samples[:limit]
+        if not searching:
+            next_cursor = encode_cursor(db_samples[-1].sample_id)
 
     pagination = dict(
         limit=limit,
         offset=offset,
         total=total,
         next_offset=next_offset,
+        next_cursor=next_cursor,
     )
 
     # Metadata
@@ -105,30 +246,174 @@ def get_samples(
     )
 
     return dict(
-        samples=query.all(),
+        samples=db_samples,
         metadata=metadata,
     )
 
 
+class SamplesQueueGet(BaseModel):
+    """Schema of a batch of samples leased to an annotator"""
+
+    samples: List[Sample]
+    annotator: str
+    leased_until: Optional[datetime]
+    remaining: int
+
+
+# Largest batch handed out by a single queue request
+MAX_QUEUE_BATCH = 500
+
+
+def _refuse_while_deleting(db_session: Session, dataset_id) -> None:
+    """Refuse to write to a dataset that a job is deleting in the background, whose
+    samples are about to be removed"""
+
+    if jobs.count_active(db_session, dataset_id, kind=JobKinds.DELETE):
+        raise HTTPException(
+            status_code=409,
+            detail=f"Dataset with id `{dataset_id}` is being deleted",
+        )
+
+
+def _schedule_scoring(db_session: Session, db_dataset: dataset.Dataset) -> None:
+    """Retrain the dataset's scorer in the background once it has enough new labels
+
+    The scorer learns the dataset's first label.  A score job is started when none
+    is active and `config.RESCORE_EVERY` samples were labeled since the last one, or
+    any sample was when the last one was skipped."""
+
+    definition = (
+        db_session.query(label_definition.LabelDefinition)
+        .filter_by(dataset_id=db_dataset.dataset_id)
+        .order_by(label_definition.LabelDefinition.label_definition_id)
+        .first()
+    )
+    if definition is None or db_dataset.labeled_count < config.SCORE_MIN_LABELS:
+        return
+    if jobs.count_active(db_session, db_dataset.dataset_id, JobKinds.SCORE):
+        return
+
+    last_job = (
+        db_session.query(job.Job)
+        .filter_by(dataset_id=db_dataset.dataset_id, kind=JobKinds.SCORE)
+        .order_by(job.Job.job_id.desc())
+        .first()
+    )
+    if last_job is not None:
+        # A job skipped for lack of labels of each class is retried with the next one
+        skipped = (last_job.stats or {}).get("skipped", False)
+        new_labels = db_dataset.labeled_count - last_job.params["labeled_count"]
+        if new_labels < (1 if skipped else config.RESCORE_EVERY):
+            return
+
+    # Concurrent queue requests may all get here, but only one of them adds a job
+    job_id = jobs.create_unless_active(
+        db_session,
+        db_dataset.dataset_id,
+        JobKinds.SCORE,
+        dict(
+            dataset_id=db_dataset.dataset_id,
+            label_definition_id=definition.label_definition_id,
+            labeled_count=db_dataset.labeled_count,
+            sample_count=db_dataset.sample_count - db_dataset.labeled_count,
+        ),
+    )
+    db_session.commit()
+    if job_id is not None:
+        jobs.submit(job_id)
+
+
+@router.get(
+    "/datasets/{dataset_id}/queue", response_model=SamplesQueueGet, tags=["samples"]
+)
+def get_queue(
+    dataset_id,
+    n: int = Query(50, ge=1, le=MAX_QUEUE_BATCH),
+    annotator: Optional[str] = None,
+    order: str = QueueOrders.INSERTION,
+    db_session: Session = Depends(get_db),
+):
+    """Lease a batch of up to `n` unlabeled samples to an annotator
+
+    Leased samples are not handed to anyone else until they are labeled or their
+    lease expires.  Samples still leased to `annotator` are renewed and returned
+    first, so a client fetches its next batch before the current one runs out by
+    asking again with the same `annotator`.  Without one, a new annotator id is
+    generated and returned.
+
+    With `order=uncertainty`, samples are handed out from those a model trained on
+    the dataset's labels is the least sure about, and the model is retrained in the
+    background as labels come in.  Until the dataset's first label has values of
+    both classes, no model is trained, and unscored samples are served in insertion
+    order."""
+
+    if order not in QueueOrders.valid_orders:
+        raise HTTPException(
+            status_code=422,
+            detail=f"Queue order `{order}` must be one of {QueueOrders.valid_orders}",
+        )
+
+    db_dataset = (
+        db_session.query(dataset.Dataset).filter_by(dataset_id=dataset_id).first()
+    )
+
+    if db_dataset is None:
+        raise HTTPException(
+            status_code=404, detail=f"No dataset found with id `{dataset_id}`"
+        )
+
+    _refuse_while_deleting(db_session, db_dataset.dataset_id)
+
+    if annotator is None:
+        annotator = uuid.uuid4().hex
+
+    if order == QueueOrders.UNCERTAINTY:
+        _schedule_scoring(db_session, db_dataset)
+
+    remaining = db_dataset.sample_count - db_dataset.labeled_count
+    db_samples = work_queue.lease_samples(
+        db_session, db_dataset.dataset_id, annotator, n, order
+    )
+
+    return dict(
+        samples=db_samples,
+        annotator=annotator,
+        leased_until=db_samples[0].leased_until if db_samples else None,
+        remaining=remaining,
+    )
+
+
 @router.get(
     "/datasets/{dataset_id}/samples/{sample_id}",
     response_model=Sample,
+    responses=cache.NOT_MODIFIED,
     tags=["samples"],
 )
-async def get_one_sample(dataset_id, sample_id, db_session: Session = Depends(get_db)):
+def get_one_sample(
+    dataset_id, sample_id, request: Request, db_session: Session = Depends(get_db)
+):
     """Get a single sample"""
-    db_sample = (
-        db_session.query(sample.Sample)
-        .filter_by(sample_id=sample_id, dataset_id=dataset_id)
-        .first()
-    )
 
-    if db_sample is None:
-        raise HTTPException(
-            status_code=404, detail=f"No sample found with id `{sample_id}`"
+    def read():
+        db_sample = (
+            db_session.query(sample.Sample)
+            .filter_by(sample_id=sample_id, dataset_id=dataset_id)
+            .first()
         )
 
-    return db_sample
+        if db_sample is None:
+            raise HTTPException(
+                status_code=404, detail=f"No sample found with id `{sample_id}`"
+            )
+
+        return Sample.from_orm(db_sample)
+
+    return cache.respond(
+        request,
+        f"dataset:{dataset_id}:sample:{sample_id}",
+        cache.dataset_scope(dataset_id),
+        read,
+    )
 
 
 class SamplePut(BaseModel):
@@ -137,50 +422,44 @@ class SamplePut(BaseModel):
     labels: Dict[str, float]
 
 
-@router.put("/datasets/{dataset_id}/samples/{sample_id}", tags=["samples"])
-async def label_sample(
-    data: SamplePut, dataset_id, sample_id, db_session: Session = Depends(get_db)
-):
-    """Label a sample"""
+def _write_labels(
+    db_session: Session,
+    dataset_id: int,
+    validator: validation.LabelValidator,
+    values: Dict[int, Dict[int, float]],
+) -> None:
+    """Store the label values of samples locked by the caller, ending their leases
 
-    db_labels = (
-        db_session.query(label_definition.LabelDefinition)
-        .filter_by(dataset_id=dataset_id)
-        .all()
-    )
+    Their previous values are moved out of the dataset's label statistics."""
 
-    # Validate labels
-    for label, value in data.labels.items():
+    previous = sample_label.read(db_session, values)
+    label_stats.update(
+        db_session,
+        dataset_id,
+        validator.rules.values(),
+        [(previous.get(sample_id), new) for sample_id, new in values.items()],
+    )
+    sample_label.replace(db_session, values)
 
-        # Check that label is valid for a dataset
-        label_def = None
-        for db_label in db_labels:
-            if label == db_label.name:
-                label_def = db_label
+    # Labeling a sample ends its work queue lease
+    for chunk in chunks(sorted(values)):
+        db_session.query(sample.Sample).filter(
+            sample.Sample.sample_id.in_(chunk)
+        ).update(dict(leased_by=None, leased_until=None), synchronize_session=False)
 
-        if label_def is None:
-            raise HTTPException(
-                status_code=422,
-                detail=f"Label `{label}` is not a valid label for dataset with dataset_id `{dataset_id}`",
-            )
 
-        # Check if numerical label is within valid bounds
-        if (
-            label_def.variant == LabelVariants.NUMERICAL
-            and not label_def.minimum <= value <= label_def.maximum
-        ):
-            raise HTTPException(
-                status_code=422,
-                detail=f"Value `{value}` of label `{label}` "
-                f"must be within range ({label_def.minimum}, {label_def.maximum}).",
-            )
+@router.put("/datasets/{dataset_id}/samples/{sample_id}", tags=["samples"])
+def label_sample(
+    data: SamplePut, dataset_id, sample_id, db_session: Session = Depends(get_db)
+):
+    """Label a sample, and every sample of its near-duplicate cluster"""
 
-        # Check if boolean variable is either 0 or 1
-        if label_def.variant == LabelVariants.BOOLEAN and value not in (0, 1):
-            raise HTTPException(
-                status_code=422,
-                detail=f"Value `{value}` of label `{label}` must be either 0 or 1.",
-            )
+    # Validate labels
+    validator = validation.get_validator(db_session, dataset_id)
+    try:
+        validator.validate(data.labels)
+    except validation.InvalidLabelError as error:
+        raise HTTPException(status_code=422, detail=str(error)) from error
 
     # Get and update sample
     db_sample = (
@@ -194,21 +473,155 @@ async def label_sample(
             status_code=404, detail=f"No sample found with id `{sample_id}`"
         )
 
-    db_sample.labels = data.labels
+    _refuse_while_deleting(db_session, db_sample.dataset_id)
+
+    targets = db_session.query(sample.Sample).filter_by(dataset_id=db_sample.dataset_id)
+    if db_sample.cluster_id is None:
+        targets = targets.filter_by(sample_id=db_sample.sample_id)
+    else:
+        targets = targets.filter_by(cluster_id=db_sample.cluster_id)
+
+    # Lock the targets in order, so that concurrent requests relabeling them are
+    # applied, and accounted for in the label statistics, one at a time
+    target_ids = [
+        sample_id
+        for (sample_id,) in targets.with_entities(sample.Sample.sample_id)
+        .order_by(sample.Sample.sample_id)
+        .with_for_update()
+    ]
+
+    # Flip the labeled flags with a conditional update, so that concurrent requests
+    # labeling the same sample count it exactly once
+    newly_labeled = targets.filter_by(is_labeled=False).update(
+        dict(is_labeled=True), synchronize_session=False
+    )
+    counters.increment(db_session, db_sample.dataset_id, labeled=newly_labeled)
+
+    values = validator.definition_values(data.labels)
+    _write_labels(
+        db_session,
+        db_sample.dataset_id,
+        validator,
+        {sample_id: values for sample_id in target_ids},
+    )
+    cache.invalidate_on_commit(db_session, db_sample.dataset_id)
     db_session.commit()
 
     return dict()
 
 
-@router.post("/datasets/{dataset_id}/samples", tags=["samples"])
-async def create_samples(
-    dataset_id,
-    id_field: str = Form(...),
-    text_field: str = Form(...),
-    file: UploadFile = File(...),
-    db_session: Session = Depends(get_db),
+class SamplesBatchPut(BaseModel):
+    """Schema of the request body for labeling many samples at once"""
+
+    samples: Dict[str, Dict[str, float]]
+
+
+class SamplesBatchPutResult(BaseModel):
+    """Schema of the response after labeling many samples at once"""
+
+    # Samples written, including the near-duplicates that took their cluster's labels
+    updated: int
+    errors: Dict[str, str]
+
+
+@router.put(
+    "/datasets/{dataset_id}/samples:batch",
+    response_model=SamplesBatchPutResult,
+    tags=["samples"],
+)
+def label_samples_batch(  # pylint: disable=too-many-branches
+    data: SamplesBatchPut, dataset_id, db_session: Session = Depends(get_db)
 ):
-    """Create samples for a given dataset from a CSV file upload."""
+    """Label many samples in a single transaction.
+
+    Items that fail validation or refer to unknown samples are skipped and reported
+    in `errors`, keyed by sample_id.  `updated` counts every sample written, so it
+    includes the near-duplicates labeled along with their cluster."""
+
+    db_dataset = (
+        db_session.query(dataset.Dataset).filter_by(dataset_id=dataset_id).first()
+    )
+
+    if db_dataset is None:
+        raise HTTPException(
+            status_code=404, detail=f"No dataset found with id `{dataset_id}`"
+        )
+
+    _refuse_while_deleting(db_session, db_dataset.dataset_id)
+
+    validator = validation.get_validator(db_session, db_dataset.dataset_id)
+
+    errors = {}
+    valid = {}
+    for sample_id, sample_labels in data.samples.items():
+        try:
+            validator.validate(sample_labels)
+            valid[int(sample_id)] = sample_labels
+        except validation.InvalidLabelError as error:
+            errors[sample_id] = str(error)
+        except ValueError:
+            errors[sample_id] = f"Invalid sample id `{sample_id}`"
+
+    # Look up which samples exist, and their near-duplicate clusters
+    clusters = {}
+    sample_ids = list(valid)
+    for chunk in chunks(sample_ids):
+        clusters.update(
+            db_session.query(sample.Sample.sample_id, sample.Sample.cluster_id)
+            .filter_by(dataset_id=db_dataset.dataset_id)
+            .filter(sample.Sample.sample_id.in_(chunk))
+        )
+
+    for sample_id in set(sample_ids).difference(clusters):
+        errors[str(sample_id)] = f"No sample found with id `{sample_id}`"
+
+    # Labels spread to every sample of a cluster, with the labels of its first sample
+    # in the batch
+    values = {}
+    by_cluster = {}
+    for sample_id, cluster_id in sorted(clusters.items()):
+        sample_values = validator.definition_values(valid[sample_id])
+        if cluster_id is None:
+            values[sample_id] = sample_values
+        else:
+            by_cluster.setdefault(cluster_id, sample_values)
+
+    for chunk in chunks(sorted(by_cluster)):
+        members = (
+            db_session.query(sample.Sample.sample_id, sample.Sample.cluster_id)
+            .filter_by(dataset_id=db_dataset.dataset_id)
+            .filter(sample.Sample.cluster_id.in_(chunk))
+        )
+        for sample_id, cluster_id in members:
+            values[sample_id] = by_cluster[cluster_id]
+
+    # Lock the targets in order, which keeps concurrent batches on a database server
+    # from deadlocking each other, then flip the labeled flags of those that were
+    # unlabeled
+    newly_labeled = 0
+    for chunk in chunks(sorted(values)):
+        db_session.query(sample.Sample.sample_id).filter(
+            sample.Sample.sample_id.in_(chunk)
+        ).order_by(sample.Sample.sample_id).with_for_update().all()
+        newly_labeled += (
+            db_session.query(sample.Sample)
+            .filter_by(is_labeled=False)
+            .filter(sample.Sample.sample_id.in_(chunk))
+            .update(dict(is_labeled=True), synchronize_session=False)
+        )
+
+    _write_labels(db_session, db_dataset.dataset_id, validator, values)
+
+    counters.increment(db_session, db_dataset.dataset_id, labeled=newly_labeled)
+    cache.invalidate_on_commit(db_session, db_dataset.dataset_id)
+    db_session.commit()
+
+    return dict(updated=len(values), errors=errors)
+
+
+def _ingestion_target(db_session: Session, dataset_id, filename: str, dedup: str):
+    """Check that samples can be ingested into a dataset from a file, and return the
+    dataset with the file's format and compression"""
 
     # Fetch dataset
     db_dataset = (
@@ -220,36 +633,188 @@ async def create_samples(
             status_code=404, detail=f"No dataset found with id `{dataset_id}`"
         )
 
+    _refuse_while_deleting(db_session, db_dataset.dataset_id)
+
     # Validate file type
-    if not file.filename.endswith(".csv"):
+    try:
+        file_format, compression = ingestion.upload_format(filename)
+    except ingestion.InvalidUploadError as error:
+        raise HTTPException(status_code=422, detail=str(error)) from error
+
+    if dedup not in DedupModes.valid_modes:
         raise HTTPException(
-            status_code=422, detail="File provided is not in .csv format."
+            status_code=422,
+            detail=f"Dedup mode `{dedup}` must be one of {DedupModes.valid_modes}",
         )
 
-    # Read CSV
-    contents = await file.read()
-    contents = StringIO(contents.decode("utf-8"))
-    reader = csv.DictReader(contents, delimiter=",")
+    return db_dataset, file_format, compression
+
+
+def _check_fields(path: str, params: dict) -> None:
+    """Read the header (or first record) of a file, so that invalid fields fail the
+    request itself rather than its job"""
+
+    with open(path, "rb") as fileobj:
+        ingestion.open_reader(
+            fileobj,
+            params["id_field"],
+            params["text_field"],
+            params["format"],
+            params["compression"],
+        ).close()
+
+
+def _ingest_job(db_dataset: dataset.Dataset, params: dict) -> job.Job:
+    return job.Job(
+        dataset_id=db_dataset.dataset_id,
+        kind=JobKinds.INGEST,
+        status=JobStatus.PENDING,
+        params=params,
+        rows_done=0,
+        errors=[],
+        stats={},
+        created_at=datetime.now(),
+    )
 
-    # Check that id and text fields are valid
-    for field in (id_field, text_field):
-        if field not in reader.fieldnames:
-            raise HTTPException(
-                status_code=422,
-                detail=f"Field `{field}` not found in provided CSV.  Must be one of {reader.fieldnames}",
-            )
 
-    # Create samples in DB
-    sample_count = 0
-    for row in reader:
-        db_sample = sample.Sample(
-            dataset_id=db_dataset.dataset_id,
-            original_id=row[id_field],
-            text=row[text_field],
+@router.post(
+    "/datasets/{dataset_id}/samples",
+    response_model=JobGet,
+    status_code=202,
+    tags=["samples"],
+)
+def create_samples(
+    dataset_id,
+    id_field: str = Form(...),
+    text_field: str = Form(...),
+    file: UploadFile = File(...),
+    dedup: str = Form(DedupModes.NONE),
+    db_session: Session = Depends(get_db),
+):
+    """Start a background job creating samples for a dataset from a file upload.
+
+    The file is read according to its extension: `.csv`, `.jsonl` (one JSON object
+    per line) or `.parquet`, and CSV and JSONL files may be compressed as `.gz` or
+    `.zst`.  `id_field` and `text_field` name the columns, or keys, to read.
+
+    Progress can be polled with the returned job's id.  With `dedup` set to `drop`,
+    rows whose text nearly duplicates an earlier row of the file are skipped; with
+    `link`, they are stored as duplicates of that row and share its labels.  The
+    counts of duplicates are reported in the job's `stats`."""
+
+    db_dataset, file_format, compression = _ingestion_target(
+        db_session, dataset_id, file.filename, dedup
+    )
+
+    # Spool the upload to the state directory so that the job can be resumed.  It is
+    # copied under a temporary name before the job is written, since writing takes
+    # the store's write lock until the transaction commits.
+    extension = file_format if compression is None else f"{file_format}.{compression}"
+    spool_path = os.path.join(config.UPLOADS_DIR, f"{uuid.uuid4().hex}.part")
+    params = dict(
+        id_field=id_field,
+        text_field=text_field,
+        dedup=dedup,
+        format=file_format,
+        compression=compression,
+    )
+    path = None
+    try:
+        with open(spool_path, "wb") as spooled:
+            shutil.copyfileobj(file.file, spooled)
+
+        try:
+            _check_fields(spool_path, params)
+        except ingestion.InvalidUploadError as error:
+            raise HTTPException(status_code=422, detail=str(error)) from error
+
+        db_job = _ingest_job(db_dataset, params)
+        db_session.add(db_job)
+        db_session.flush()
+
+        # The spool is named after its job, renamed before the job is committed so
+        # that no runner can see the job without its file
+        path = os.path.join(config.UPLOADS_DIR, f"{db_job.job_id}.{extension}")
+        db_job.params = dict(params, path=path)
+        os.rename(spool_path, path)
+        db_session.commit()
+    except Exception:
+        # Neither a job nor its spool outlives a failed request
+        db_session.rollback()
+        for leftover in (spool_path, path):
+            if leftover is not None and os.path.exists(leftover):
+                os.remove(leftover)
+        raise
+
+    jobs.submit(db_job.job_id)
+
+    return db_job
+
+
+class SamplesImport(BaseModel):
+    """Schema of the request body for importing samples from a file on the server"""
+
+    path: str
+    id_field: str
+    text_field: str
+    dedup: str = DedupModes.NONE
+
+
+@router.post(
+    "/datasets/{dataset_id}/samples:import",
+    response_model=JobGet,
+    status_code=202,
+    tags=["samples"],
+)
+def import_samples(
+    data: SamplesImport, dataset_id, db_session: Session = Depends(get_db)
+):
+    """Start a background job creating samples for a dataset from a file on the server.
+
+    `path` is relative to the `LABLR_IMPORT_ROOT` directory, and imports are refused
+    unless it is set.  The file is read in place, without being copied, and is left
+    untouched once the job completes.  Formats and fields are those of uploads."""
+
+    if not config.IMPORT_ROOT:
+        raise HTTPException(
+            status_code=403,
+            detail="Importing files from the server is disabled; "
+            "set LABLR_IMPORT_ROOT to enable it",
         )
-        db_session.add(db_sample)
-        sample_count += 1
 
+    db_dataset, file_format, compression = _ingestion_target(
+        db_session, dataset_id, data.path, data.dedup
+    )
+
+    # Resolve symbolic links and `..` before checking that the file is under the root
+    root = os.path.realpath(config.IMPORT_ROOT)
+    path = os.path.realpath(os.path.join(root, data.path))
+    if os.path.commonpath([root, path]) != root:
+        raise HTTPException(
+            status_code=403,
+            detail=f"Path `{data.path}` is outside of the import root",
+        )
+    if not os.path.isfile(path):
+        raise HTTPException(status_code=404, detail=f"No file found at `{data.path}`")
+
+    params = dict(
+        id_field=data.id_field,
+        text_field=data.text_field,
+        dedup=data.dedup,
+        format=file_format,
+        compression=compression,
+        path=path,
+        delete_source=False,
+    )
+    try:
+        _check_fields(path, params)
+    except ingestion.InvalidUploadError as error:
+        raise HTTPException(status_code=422, detail=str(error)) from error
+
+    db_job = _ingest_job(db_dataset, params)
+    db_session.add(db_job)
     db_session.commit()
 
-    return f"Successfully created {sample_count} samples."
+    jobs.submit(db_job.job_id)
+
+    return db_job
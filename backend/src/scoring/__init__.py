@@ -0,0 +1,14 @@
+"""
+Active learning: ranking a dataset's unlabeled samples by the uncertainty of a model
+trained on its labels so far
+"""
+
+from .base import Scorer, uncertainty
+from .registry import (
+    SCORERS,
+    binary_targets,
+    forget_scorer,
+    get_scorer,
+    scorer_class,
+)
+from .tfidf import TfidfLogisticScorer
@@ -0,0 +1,31 @@
+"""
+Interface of the models ranking unlabeled samples by how uncertain they are
+"""
+
+from typing import Optional, Sequence
+
+import numpy as np
+
+
+class Scorer:
+    """Binary classifier of texts, refitted as a dataset gains labels
+
+    A scorer instance is kept per dataset between fits, so it may start each fit
+    from the state of the previous one.
+    """
+
+    def fit(self, texts: Sequence[Optional[str]], targets: np.ndarray) -> None:
+        """Train on labeled texts and their boolean targets"""
+
+        raise NotImplementedError
+
+    def predict_proba(self, texts: Sequence[Optional[str]]) -> np.ndarray:
+        """Probability that the target of each text is true"""
+
+        raise NotImplementedError
+
+
+def uncertainty(probabilities: np.ndarray) -> np.ndarray:
+    """1 for a probability of one half, down to 0 for a certain prediction"""
+
+    return 1.0 - np.abs(2.0 * probabilities - 1.0)
@@ -0,0 +1,77 @@
+"""
+Choice of the scorer class, and the fitted scorer of each dataset
+"""
+
+from typing import Dict, Type
+from collections import OrderedDict
+import importlib
+import threading
+
+import numpy as np
+
+from database import label_definition
+from util import config
+from util.constants import LabelVariants
+from .base import Scorer
+from .tfidf import TfidfLogisticScorer
+
+SCORERS: Dict[str, Type[Scorer]] = {
+    "tfidf-logistic": TfidfLogisticScorer,
+}
+
+# Number of datasets whose fitted scorers are kept in memory
+SCORER_CACHE_SIZE = 16
+
+
+def scorer_class(name: str = None) -> Type[Scorer]:
+    """Scorer registered under a name, or imported from `package.module:ClassName`"""
+
+    name = name or config.SCORER
+    if name in SCORERS:
+        return SCORERS[name]
+
+    module, _, attribute = name.partition(":")
+    if not attribute:
+        raise ValueError(
+            f"Unknown scorer `{name}`.  Must be one of {list(SCORERS)} "
+            "or `package.module:ClassName`"
+        )
+    return getattr(importlib.import_module(module), attribute)
+
+
+_scorers: "OrderedDict[int, Scorer]" = OrderedDict()
+_scorers_lock = threading.Lock()
+
+
+def get_scorer(dataset_id: int) -> Scorer:
+    """Fetch the scorer of a dataset, creating an unfitted one on a miss"""
+
+    key = int(dataset_id)
+    with _scorers_lock:
+        scorer = _scorers.get(key)
+        if scorer is None:
+            scorer = _scorers[key] = scorer_class()()
+            while len(_scorers) > SCORER_CACHE_SIZE:
+                _scorers.popitem(last=False)
+        else:
+            _scorers.move_to_end(key)
+
+        return scorer
+
+
+def forget_scorer(dataset_id: int) -> None:
+    """Drop the scorer of a dataset once its deletion is committed"""
+
+    with _scorers_lock:
+        _scorers.pop(int(dataset_id), None)
+
+
+def binary_targets(
+    definition: label_definition.LabelDefinition, values: np.ndarray
+) -> np.ndarray:
+    """Targets of a label's values: boolean labels as they are, numerical labels
+    split at the middle of their range"""
+
+    if definition.variant == LabelVariants.BOOLEAN:
+        return values >= 0.5
+    return values >= (definition.minimum + definition.maximum) / 2
@@ -0,0 +1,172 @@
+"""
+TF-IDF features and a logistic regression, in vectorized NumPy
+
+Every text is lowercased and split into words; its words and word pairs are hashed
+into `NUM_FEATURES` columns, so no vocabulary is stored.  A batch of texts becomes a
+sparse matrix in coordinate form (row, column and value arrays).  Term counts are
+damped logarithmically, weighted by the inverse document frequency of the training
+texts and scaled to unit length per row.
+
+The logistic regression is fitted by accelerated gradient descent over the weights
+of the features present in the training texts, with the rows' products with the
+weights and the gradient both summed by `np.bincount` over the nonzero entries.
+Classes are weighted to count equally, since the labels of a skewed dataset would
+otherwise push every probability towards the common class.  A refit starts from the
+previous weights, so retraining after a few more labels converges in few steps.
+"""
+
+from typing import NamedTuple, Optional, Sequence
+from itertools import chain
+import re
+import zlib
+
+import numpy as np
+
+from .base import Scorer
+
+NUM_FEATURES = 2**18
+
+TOKEN_PATTERN = re.compile(r"\w+")
+
+# Odd 64-bit constant mixing the hashes of two words into the hash of their pair
+PAIR_MULTIPLIER = np.uint64(0x9E3779B97F4A7C15)
+
+# L2 penalty on the weights, and the gradient descent step and stopping criteria.  The
+# rows have unit length and the sample weights sum to one, so the gradient of the loss
+# is (1/4 + penalty)-Lipschitz, whose inverse is the largest step sure to converge.
+REGULARIZATION = 1e-4
+STEP_SIZE = 1.0 / (0.25 + REGULARIZATION)
+MAX_ITERATIONS = 500
+TOLERANCE = 1e-5
+
+
+class Features(NamedTuple):
+    """Sparse matrix of the features of a batch of texts, in coordinate form"""
+
+    rows: np.ndarray
+    columns: np.ndarray
+    values: np.ndarray
+    n_rows: int
+
+
+def term_counts(texts: Sequence[Optional[str]]) -> Features:
+    """Damped count of every hashed term of every text"""
+
+    words = [TOKEN_PATTERN.findall((text or "").lower()) for text in texts]
+    lengths = np.array([len(text_words) for text_words in words], dtype=np.int64)
+    hashes = np.fromiter(
+        (zlib.crc32(word.encode("utf-8")) for word in chain.from_iterable(words)),
+        dtype=np.uint64,
+        count=int(lengths.sum()),
+    )
+    owners = np.repeat(np.arange(len(texts), dtype=np.int64), lengths)
+
+    # A word pair's hash combines the hashes of its words, when both are of one text
+    paired = np.flatnonzero(owners[1:] == owners[:-1])
+    pair_hashes = (
+        (hashes[paired] * PAIR_MULTIPLIER) ^ hashes[paired + 1]
+    ) * PAIR_MULTIPLIER >> np.uint64(32)
+
+    rows = np.concatenate([owners, owners[paired]])
+    columns = np.concatenate([hashes, pair_hashes]).astype(np.int64) % NUM_FEATURES
+
+    # Repeated terms of a text are merged into a single entry with their count
+    keys, counts = np.unique(rows * NUM_FEATURES + columns, return_counts=True)
+    return Features(
+        keys // NUM_FEATURES,
+        keys % NUM_FEATURES,
+        1.0 + np.log(counts),
+        len(texts),
+    )
+
+
+def _sigmoid(values: np.ndarray) -> np.ndarray:
+    return 0.5 * (1.0 + np.tanh(0.5 * values))
+
+
+class TfidfLogisticScorer(Scorer):
+    """Logistic regression over hashed TF-IDF word and word pair features"""
+
+    def __init__(self):
+        self.idf = np.ones(NUM_FEATURES)
+        self.weights = np.zeros(NUM_FEATURES)
+        self.bias = 0.0
+        self.iterations = 0
+
+    def transform(self, texts: Sequence[Optional[str]]) -> Features:
+        """TF-IDF features of texts, each row scaled to unit length"""
+
+        return self._weigh(term_counts(texts))
+
+    def _weigh(self, features: Features) -> Features:
+        values = features.values * self.idf[features.columns]
+        norms = np.sqrt(
+            np.bincount(features.rows, weights=values**2, minlength=features.n_rows)
+        )
+        norms[norms == 0] = 1.0
+        return features._replace(values=values / norms[features.rows])
+
+    def _decision(self, features: Features) -> np.ndarray:
+        return (
+            np.bincount(
+                features.rows,
+                weights=self.weights[features.columns] * features.values,
+                minlength=features.n_rows,
+            )
+            + self.bias
+        )
+
+    def fit(self, texts: Sequence[Optional[str]], targets: np.ndarray) -> None:
+        targets = np.asarray(targets, dtype=np.float64)
+
+        counts = term_counts(texts)
+        frequencies = np.bincount(counts.columns, minlength=NUM_FEATURES)
+        self.idf = np.log((1.0 + len(texts)) / (1.0 + frequencies)) + 1.0
+        features = self._weigh(counts)
+
+        positive_share = targets.mean()
+        sample_weights = np.where(
+            targets > 0.5, 0.5 / positive_share, 0.5 / (1.0 - positive_share)
+        ) / len(targets)
+
+        # Descend on the weights of the features present in the training texts only,
+        # renumbered from 0; the others only shrink with the penalty
+        active, columns = np.unique(features.columns, return_inverse=True)
+        weights = self.weights[active]
+        previous_weights, previous_bias = weights, self.bias
+        bias = self.bias
+
+        for self.iterations in range(1, MAX_ITERATIONS + 1):
+            # Nesterov momentum, from the previous step's direction
+            momentum = (self.iterations - 1) / (self.iterations + 2)
+            look_weights = weights + momentum * (weights - previous_weights)
+            look_bias = bias + momentum * (bias - previous_bias)
+
+            decision = np.bincount(
+                features.rows,
+                weights=look_weights[columns] * features.values,
+                minlength=features.n_rows,
+            )
+            errors = (_sigmoid(decision + look_bias) - targets) * sample_weights
+            gradient = (
+                np.bincount(
+                    columns,
+                    weights=errors[features.rows] * features.values,
+                    minlength=len(active),
+                )
+                + REGULARIZATION * look_weights
+            )
+            bias_gradient = errors.sum()
+
+            previous_weights, previous_bias = weights, bias
+            weights = look_weights - STEP_SIZE * gradient
+            bias = look_bias - STEP_SIZE * bias_gradient
+            if max(np.abs(gradient).max(), abs(bias_gradient)) < TOLERANCE:
+                break
+
+        self.weights *= (1.0 - STEP_SIZE * REGULARIZATION) ** self.iterations
+        self.weights[active] = weights
+        self.bias = bias
+
+    def predict_proba(self, texts: Sequence[Optional[str]]) -> np.ndarray:
+        return _sigmoid(self._decision(self.transform(texts)))
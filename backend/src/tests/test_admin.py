@@ -0,0 +1,150 @@
+"""
+Test admin endpoints
+"""
+
+import time
+
+import pytest
+from fastapi.testclient import TestClient
+
+from main import app, PREFIX
+from database import IS_SQLITE, SessionLocal, dataset
+from routers import samples
+from util import config, metrics
+from util.pagination import encode_cursor
+
+from .test_samples import create_demo_dataset, delete_demo_dataset
+
+client = TestClient(app)
+
+
+def test_recount_dataset():
+    """Unit test for recomputing a dataset's counters after they drift"""
+
+    dataset_id = create_demo_dataset()
+
+    db_session = SessionLocal()
+    db_session.query(dataset.Dataset).filter_by(dataset_id=dataset_id).update(
+        dict(sample_count=0, labeled_count=5)
+    )
+    db_session.commit()
+    db_session.close()
+
+    response = client.post(f"{PREFIX}/admin/datasets/{dataset_id}/recount")
+    assert response.status_code == 200
+    assert response.json()["sample_count"] == 9
+    assert response.json()["labeled_count"] == 0
+
+    response = client.get(f"{PREFIX}/datasets/{dataset_id}")
+    assert response.json()["labeled_percent"] == 0
+
+    delete_demo_dataset(dataset_id)
+
+
+def test_recount_nonexistent_dataset():
+    """Unit test for recounting a nonexistent dataset"""
+
+    response = client.post(f"{PREFIX}/admin/datasets/123456789/recount")
+
+    assert response.status_code == 404
+
+
+@pytest.mark.skipif(not IS_SQLITE, reason="storage profiles only apply to SQLite")
+def test_storage_diagnostics():
+    """Unit test for reading back the storage profile applied to connections"""
+
+    response = client.get(f"{PREFIX}/admin/storage")
+    assert response.status_code == 200
+
+    body = response.json()
+    assert body["backend"] == "sqlite"
+    assert body["profile"] == "balanced"
+    assert body["effective_pragmas"]["journal_mode"] == "wal"
+    assert body["effective_pragmas"]["synchronous"] == "1"  # NORMAL
+    assert body["effective_pragmas"]["busy_timeout"] == "5000"
+    assert body["pool"]["size"] == 10
+
+
+@pytest.mark.skipif(IS_SQLITE, reason="requires a database server")
+def test_storage_diagnostics_server():
+    """Unit test for reporting the storage settings of a database server"""
+
+    response = client.get(f"{PREFIX}/admin/storage")
+    assert response.status_code == 200
+
+    body = response.json()
+    assert body["profile"] is None
+    assert body["effective_pragmas"] == {}
+    assert body["pool"]["size"] == 10
+
+
+def test_cache_stats():
+    """Unit test for counting hits of the response cache"""
+
+    client.get(f"{PREFIX}/datasets")
+    before = client.get(f"{PREFIX}/admin/cache").json()
+
+    response = client.get(f"{PREFIX}/datasets")
+    client.get(
+        f"{PREFIX}/datasets", headers={"If-None-Match": response.headers["etag"]}
+    )
+
+    body = client.get(f"{PREFIX}/admin/cache").json()
+    assert body["hits"] == before["hits"] + 2
+    assert body["not_modified"] == before["not_modified"] + 1
+    assert 0 < body["hit_rate"] <= 1
+    assert body["entries"] <= body["size"]
+
+
+def test_request_metrics():
+    """Unit test for the per-route latency, query and serialization histograms"""
+
+    metrics.registry.clear()
+    dataset_id = create_demo_dataset()
+
+    client.get(f"{PREFIX}/datasets/{dataset_id}/samples", params=dict(limit=5))
+    client.get(f"{PREFIX}/datasets/123456789/samples")
+
+    response = client.get(f"{PREFIX}/metrics")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain; version=0.0.4")
+
+    route = f'method="GET",route="{PREFIX}/datasets/{{dataset_id}}/samples"'
+    lines = response.text.splitlines()
+    assert f'lablr_requests_total{{{route},status="200"}} 1' in lines
+    assert f'lablr_requests_total{{{route},status="404"}} 1' in lines
+    assert f"lablr_request_duration_seconds_count{{{route}}} 2" in lines
+    assert f'lablr_request_db_queries_bucket{{{route},le="0"}} 0' in lines
+    assert f"lablr_request_serialization_seconds_count{{{route}}} 2" in lines
+
+    delete_demo_dataset(dataset_id)
+
+
+def test_request_profile(monkeypatch):
+    """Unit test for returning the sampled stacks of a request"""
+
+    dataset_id = create_demo_dataset()
+    url = f"{PREFIX}/datasets/{dataset_id}/samples"
+
+    # Profiles are only returned when enabled
+    response = client.get(url, headers={"X-Lablr-Profile": "1"})
+    assert response.headers["content-type"] == "application/json"
+
+    # Keep the handler busy for long enough to be sampled
+    def slow_encode_cursor(sample_id):
+        time.sleep(0.05)
+        return encode_cursor(sample_id)
+
+    monkeypatch.setattr(samples, "encode_cursor", slow_encode_cursor)
+    monkeypatch.setattr(config, "PROFILING", True)
+    response = client.get(url, params=dict(limit=5), headers={"X-Lablr-Profile": "1"})
+    assert response.status_code == 200
+    assert response.headers["X-Lablr-Profile-Status"] == "200"
+    assert response.headers["content-type"].startswith("text/plain")
+
+    stacks = [line.rsplit(" ", 1) for line in response.text.splitlines()]
+    assert stacks
+    assert all(count.isdigit() for _, count in stacks)
+    assert any("routers.samples:get_samples" in stack for stack, _ in stacks)
+
+    delete_demo_dataset(dataset_id)
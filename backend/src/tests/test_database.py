@@ -0,0 +1,157 @@
+"""
+Test the shared database layer
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+import os
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine, text
+
+from main import app, PREFIX
+from database import IS_SQLITE, Base, write_lock
+from database.migrations import run_migrations
+from routers import samples
+
+from .test_samples import create_demo_dataset, delete_demo_dataset, upload_samples
+from .test_jobs import wait_for_job
+
+client = TestClient(app)
+
+
+def test_concurrent_writers():
+    """Unit test for checking that concurrent write transactions are serialized"""
+
+    dataset_id = create_demo_dataset()
+
+    response = client.get(
+        f"{PREFIX}/datasets/{dataset_id}/samples", params=dict(limit=9)
+    )
+    sample_ids = [s["sample_id"] for s in response.json()["samples"]]
+
+    def label(i: int) -> int:
+        sample_id = sample_ids[i % len(sample_ids)]
+        response = client.put(
+            f"{PREFIX}/datasets/{dataset_id}/samples/{sample_id}",
+            json={"labels": {"Boolean": i % 2}},
+        )
+        return response.status_code
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        statuses = list(executor.map(label, range(200)))
+
+    assert statuses == [200] * 200
+
+    response = client.get(f"{PREFIX}/datasets/{dataset_id}")
+    assert response.json()["labeled_count"] == 9
+
+    delete_demo_dataset(dataset_id)
+
+
+@pytest.mark.skipif(not IS_SQLITE, reason="only SQLite stores use the write lock")
+def test_write_lock_released():
+    """Unit test for checking that no transaction leaks the write lock"""
+
+    write_lock.acquire()
+    write_lock.release()
+
+    assert os.path.exists(write_lock.path)
+
+
+@pytest.mark.skipif(not IS_SQLITE, reason="only SQLite stores use the write lock")
+def test_upload_spooled_without_write_lock(monkeypatch):
+    """Unit test for checking that uploads are copied before their job is written"""
+
+    dataset_id = create_demo_dataset()
+
+    copy = samples.shutil.copyfileobj
+
+    def copy_unlocked(source, destination):
+        # Raises after the timeout if this request already holds the lock
+        write_lock.acquire()
+        write_lock.release()
+        copy(source, destination)
+
+    monkeypatch.setattr(write_lock, "timeout", 1)
+    monkeypatch.setattr(samples.shutil, "copyfileobj", copy_unlocked)
+
+    response = upload_samples(dataset_id, "more.csv", b"id,text\n1,a\n2,b\n")
+    assert response.status_code == 202
+    assert wait_for_job(response.json()["job_id"])["status"] == "completed"
+
+    delete_demo_dataset(dataset_id)
+
+
+# Schema of the stores created by the first release, before any migration
+BASELINE_SCHEMA = (
+    "CREATE TABLE datasets (dataset_id INTEGER PRIMARY KEY, name VARCHAR, "
+    "description VARCHAR, created_at DATETIME)",
+    "CREATE TABLE label_definitions (label_definition_id INTEGER PRIMARY KEY, "
+    "dataset_id INTEGER REFERENCES datasets (dataset_id), name VARCHAR, "
+    "variant VARCHAR, minimum FLOAT, maximum FLOAT, interval FLOAT)",
+    "CREATE TABLE samples (sample_id INTEGER PRIMARY KEY, "
+    "dataset_id INTEGER REFERENCES datasets (dataset_id), original_id VARCHAR, "
+    "text VARCHAR, labels JSON, save_for_later BOOLEAN)",
+)
+
+
+def test_migrate_baseline_store(tmp_path):
+    """Unit test for upgrading a store created by the first release, with data"""
+
+    engine = create_engine(f"sqlite:///{tmp_path}/store.db")
+    with engine.begin() as connection:
+        for statement in BASELINE_SCHEMA:
+            connection.execute(text(statement))
+        connection.execute(text("INSERT INTO datasets VALUES (1, 'd', '', NULL)"))
+        connection.execute(
+            text(
+                "INSERT INTO label_definitions VALUES (1, 1, 'Boolean', 'boolean', "
+                "0, 1, 1)"
+            )
+        )
+        connection.execute(
+            text(
+                "INSERT INTO samples VALUES (1, 1, 'a', 'first', '{\"Boolean\": 1}', 0),"
+                " (2, 1, 'b', 'second', NULL, 0), (3, 1, 'c', 'third', NULL, 0)"
+            )
+        )
+
+    # As `prepare_store` does, twice to check that migrating again changes nothing
+    for _ in range(2):
+        Base.metadata.create_all(bind=engine)
+        run_migrations(engine)
+
+    with engine.connect() as connection:
+        counts = connection.execute(
+            text("SELECT sample_count, labeled_count FROM datasets")
+        ).fetchall()
+        labeled = connection.execute(
+            text("SELECT sample_id FROM samples WHERE is_labeled")
+        ).fetchall()
+        values = connection.execute(
+            text("SELECT sample_id, label_definition_id, value FROM sample_labels")
+        ).fetchall()
+
+    assert counts == [(3, 1)]
+    assert labeled == [(1,)]
+    assert values == [(1, 1, 1.0)]
+
+    # Counters left at zero by an interrupted backfill are repaired
+    with engine.begin() as connection:
+        connection.execute(text("UPDATE datasets SET sample_count = 0"))
+    run_migrations(engine)
+    with engine.connect() as connection:
+        counts = connection.execute(
+            text("SELECT sample_count, labeled_count FROM datasets")
+        ).fetchall()
+    assert counts == [(3, 1)]
+
+    # The ids of deleted datasets are not reused
+    with engine.begin() as connection:
+        connection.execute(text("DELETE FROM datasets"))
+        connection.execute(text("INSERT INTO datasets (name) VALUES ('e')"))
+        dataset_ids = connection.execute(text("SELECT dataset_id FROM datasets"))
+        assert dataset_ids.fetchall() == [(2,)]
+
+    engine.dispose()
@@ -62,6 +62,14 @@ def test_create_delete_dataset():
     response = client.delete(f"{PREFIX}/datasets/{dataset_id}")
     assert response.status_code == 200
 
+    # The next dataset does not take the deleted one's id, which other processes
+    # may still have cached
+    response = client.post(f"{PREFIX}/datasets", json=body)
+    assert response.json()["dataset_id"] > dataset_id
+
+    response = client.delete(f"{PREFIX}/datasets/{response.json()['dataset_id']}")
+    assert response.status_code == 200
+
 
 def test_create_missing_fields_dataset():
     """Unit test for creating a dataset with missing important fields"""
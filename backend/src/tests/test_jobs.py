@@ -0,0 +1,509 @@
+"""
+Test jobs endpoints
+"""
+
+import gzip
+import os
+import shutil
+import time
+from datetime import datetime
+
+import pytest
+from fastapi.testclient import TestClient
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from main import app, PREFIX
+from database import SessionLocal, job
+from database.setup import prepare_store
+import ingestion
+import jobs
+from util import config
+from util.constants import JobKinds, JobStatus
+
+from .test_datasets import EXAMPLE_DATASET_BODY
+
+client = TestClient(app)
+
+SCRIPT_DIR = os.path.dirname(os.path.realpath(__file__))
+
+
+def wait_for_job(job_id: int, timeout: float = 30) -> dict:
+    """Helper method that polls a job until it is no longer in progress"""
+
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        response = client.get(f"{PREFIX}/jobs/{job_id}")
+        assert response.status_code == 200
+
+        body = response.json()
+        if body["status"] not in JobStatus.active:
+            return body
+
+        time.sleep(0.05)
+
+    raise TimeoutError(f"Job {job_id} did not finish within {timeout}s")
+
+
+def test_get_nonexistent_job():
+    """Unit test for trying to fetch a nonexistent job"""
+
+    response = client.get(f"{PREFIX}/jobs/123456789")
+
+    assert response.status_code == 404
+
+
+def test_ingest_job_progress():
+    """Unit test for polling an ingestion job until it completes"""
+
+    response = client.post(f"{PREFIX}/datasets", json=EXAMPLE_DATASET_BODY)
+    dataset_id = response.json()["dataset_id"]
+
+    data = dict(id_field="id", text_field="text")
+    with open(f"{SCRIPT_DIR}/test_samples.csv", "rb") as fileobj:
+        files = dict(file=("test.csv", fileobj, "text/csv"))
+        response = client.post(
+            f"{PREFIX}/datasets/{dataset_id}/samples", data=data, files=files
+        )
+
+    assert response.status_code == 202
+
+    body = wait_for_job(response.json()["job_id"])
+    assert body["status"] == JobStatus.COMPLETED
+    assert body["rows_done"] == 9
+    assert body["bytes_done"] == body["bytes_total"]
+    assert not os.path.exists(os.path.join(config.UPLOADS_DIR, f"{body['job_id']}.csv"))
+
+    response = client.delete(f"{PREFIX}/datasets/{dataset_id}")
+    assert response.status_code == 200
+
+
+def test_ingest_job_resume():
+    """Unit test for resuming an interrupted ingestion job from its checkpoint"""
+
+    response = client.post(f"{PREFIX}/datasets", json=EXAMPLE_DATASET_BODY)
+    dataset_id = response.json()["dataset_id"]
+
+    # Simulate a job that committed its first 5 rows before the process stopped
+    db_session = SessionLocal()
+    db_job = job.Job(
+        dataset_id=dataset_id,
+        kind=JobKinds.INGEST,
+        status=JobStatus.RUNNING,
+        params=dict(id_field="id", text_field="text"),
+        rows_done=5,
+        errors=[],
+        created_at=datetime.now(),
+    )
+    db_session.add(db_job)
+    db_session.flush()
+
+    path = os.path.join(config.UPLOADS_DIR, f"{db_job.job_id}.csv")
+    shutil.copyfile(f"{SCRIPT_DIR}/test_samples.csv", path)
+    db_job.params = dict(db_job.params, path=path)
+    db_session.commit()
+    job_id = db_job.job_id
+    db_session.close()
+
+    # The next start re-queues it and a worker resumes it from its checkpoint
+    prepare_store()
+    jobs.run_job(job_id)
+
+    body = wait_for_job(job_id)
+    assert body["status"] == JobStatus.COMPLETED
+    assert body["rows_done"] == 9
+
+    response = client.get(f"{PREFIX}/datasets/{dataset_id}/samples")
+    assert response.json()["metadata"]["pagination"]["total"] == 4
+
+    response = client.delete(f"{PREFIX}/datasets/{dataset_id}")
+    assert response.status_code == 200
+
+
+def test_running_job_left_to_its_process(monkeypatch):
+    """Unit test for checking that only jobs whose heartbeat stopped are resumed"""
+
+    response = client.post(f"{PREFIX}/datasets", json=EXAMPLE_DATASET_BODY)
+    dataset_id = response.json()["dataset_id"]
+
+    # Simulate a job that another process is running
+    db_session = SessionLocal()
+    db_job = job.Job(
+        dataset_id=dataset_id,
+        kind=JobKinds.INGEST,
+        status=JobStatus.RUNNING,
+        params=dict(id_field="id", text_field="text"),
+        rows_done=0,
+        errors=[],
+        created_at=datetime.now(),
+        heartbeat_at=datetime.now(),
+    )
+    db_session.add(db_job)
+    db_session.flush()
+
+    path = os.path.join(config.UPLOADS_DIR, f"{db_job.job_id}.csv")
+    shutil.copyfile(f"{SCRIPT_DIR}/test_samples.csv", path)
+    db_job.params = dict(db_job.params, path=path)
+    db_session.commit()
+    job_id = db_job.job_id
+    db_session.close()
+
+    # A process starting meanwhile leaves it alone
+    prepare_store()
+    jobs.beat()
+    response = client.get(f"{PREFIX}/jobs/{job_id}")
+    assert response.json()["status"] == JobStatus.RUNNING
+
+    # Once its heartbeat is stale, the next beat of any process resumes it
+    monkeypatch.setattr(config, "JOB_STALE_SECONDS", 0)
+    jobs.beat()
+
+    body = wait_for_job(job_id)
+    assert body["status"] == JobStatus.COMPLETED
+    assert body["rows_done"] == 9
+
+    response = client.delete(f"{PREFIX}/datasets/{dataset_id}")
+    assert response.status_code == 200
+
+
+def test_delete_job():
+    """Unit test for deleting a dataset in chunks with a background job"""
+
+    response = client.post(f"{PREFIX}/datasets", json=EXAMPLE_DATASET_BODY)
+    dataset_id = response.json()["dataset_id"]
+
+    data = dict(id_field="id", text_field="text")
+    with open(f"{SCRIPT_DIR}/test_samples.csv", "rb") as fileobj:
+        files = dict(file=("test.csv", fileobj, "text/csv"))
+        response = client.post(
+            f"{PREFIX}/datasets/{dataset_id}/samples", data=data, files=files
+        )
+    wait_for_job(response.json()["job_id"])
+
+    response = client.delete(
+        f"{PREFIX}/datasets/{dataset_id}", params=dict(background=True)
+    )
+    assert response.status_code == 202
+    assert response.json()["kind"] == JobKinds.DELETE
+
+    body = wait_for_job(response.json()["job_id"])
+    assert body["status"] == JobStatus.COMPLETED
+    assert body["rows_done"] == 9
+    assert body["dataset_id"] is None
+
+    response = client.get(f"{PREFIX}/datasets/{dataset_id}")
+    assert response.status_code == 404
+
+
+def test_delete_job_refuses_writes():
+    """Unit test for refusing labels and leases while a dataset is being deleted"""
+
+    response = client.post(f"{PREFIX}/datasets", json=EXAMPLE_DATASET_BODY)
+    dataset_id = response.json()["dataset_id"]
+
+    data = dict(id_field="id", text_field="text")
+    with open(f"{SCRIPT_DIR}/test_samples.csv", "rb") as fileobj:
+        files = dict(file=("test.csv", fileobj, "text/csv"))
+        response = client.post(
+            f"{PREFIX}/datasets/{dataset_id}/samples", data=data, files=files
+        )
+    wait_for_job(response.json()["job_id"])
+
+    response = client.get(f"{PREFIX}/datasets/{dataset_id}/samples")
+    sample_id = response.json()["samples"][0]["sample_id"]
+
+    # Simulate a delete job that another process is running
+    db_session = SessionLocal()
+    db_job = job.Job(
+        dataset_id=dataset_id,
+        kind=JobKinds.DELETE,
+        status=JobStatus.RUNNING,
+        params=dict(dataset_id=dataset_id, sample_count=9),
+        rows_done=0,
+        errors=[],
+        created_at=datetime.now(),
+        heartbeat_at=datetime.now(),
+    )
+    db_session.add(db_job)
+    db_session.commit()
+
+    url = f"{PREFIX}/datasets/{dataset_id}"
+    labels = {"Boolean": 1}
+    response = client.put(f"{url}/samples/{sample_id}", json=dict(labels=labels))
+    assert response.status_code == 409
+    response = client.put(f"{url}/samples:batch", json={"samples": {sample_id: labels}})
+    assert response.status_code == 409
+    response = client.get(f"{url}/queue")
+    assert response.status_code == 409
+
+    response = client.get(url)
+    assert response.json()["labeled_count"] == 0
+
+    db_job.status = JobStatus.FAILED
+    db_session.commit()
+    db_session.close()
+
+    response = client.delete(url)
+    assert response.status_code == 200
+
+
+def test_delete_cancels_score_jobs():
+    """Unit test for deleting a dataset while its samples wait to be scored"""
+
+    response = client.post(f"{PREFIX}/datasets", json=EXAMPLE_DATASET_BODY)
+    dataset_id = response.json()["dataset_id"]
+
+    # Only one of two concurrent queue requests adds a score job
+    db_session = SessionLocal()
+    params = dict(dataset_id=dataset_id, label_definition_id=0, labeled_count=0)
+    job_id = jobs.create_unless_active(db_session, dataset_id, JobKinds.SCORE, params)
+    db_session.commit()
+    assert job_id is not None
+    assert (
+        jobs.create_unless_active(db_session, dataset_id, JobKinds.SCORE, params)
+        is None
+    )
+    db_session.commit()
+    db_session.close()
+
+    # The pending score job does not block the deletion, and is cancelled instead
+    response = client.delete(f"{PREFIX}/datasets/{dataset_id}")
+    assert response.status_code == 200
+
+    body = client.get(f"{PREFIX}/jobs/{job_id}").json()
+    assert body["status"] == JobStatus.CANCELLED
+    assert body["dataset_id"] is None
+    assert body["stats"] == {}
+
+    db_session = SessionLocal()
+    assert db_session.query(job.Job).filter_by(job_id=job_id).one().params == params
+    db_session.close()
+
+    jobs.run_job(job_id)
+    assert client.get(f"{PREFIX}/jobs/{job_id}").json()["status"] == (
+        JobStatus.CANCELLED
+    )
+
+
+def test_score_job_skipped(monkeypatch):
+    """Unit test for retrying a score job that had labels of a single class"""
+
+    monkeypatch.setattr(config, "SCORE_MIN_LABELS", 2)
+    monkeypatch.setattr(config, "RESCORE_EVERY", 50)
+
+    response = client.post(f"{PREFIX}/datasets", json=EXAMPLE_DATASET_BODY)
+    dataset_id = response.json()["dataset_id"]
+
+    data = dict(id_field="id", text_field="text")
+    with open(f"{SCRIPT_DIR}/test_samples.csv", "rb") as fileobj:
+        files = dict(file=("test.csv", fileobj, "text/csv"))
+        response = client.post(
+            f"{PREFIX}/datasets/{dataset_id}/samples", data=data, files=files
+        )
+    wait_for_job(response.json()["job_id"])
+
+    response = client.get(
+        f"{PREFIX}/datasets/{dataset_id}/samples", params=dict(limit=50)
+    )
+    sample_ids = [s["sample_id"] for s in response.json()["samples"]]
+
+    def label_and_score(labels: dict) -> list:
+        response = client.put(
+            f"{PREFIX}/datasets/{dataset_id}/samples:batch", json={"samples": labels}
+        )
+        assert response.status_code == 200
+        response = client.get(
+            f"{PREFIX}/datasets/{dataset_id}/queue", params=dict(order="uncertainty")
+        )
+        assert response.status_code == 200
+
+        db_session = SessionLocal()
+        job_ids = [
+            job_id
+            for (job_id,) in db_session.query(job.Job.job_id)
+            .filter_by(dataset_id=dataset_id, kind=JobKinds.SCORE)
+            .order_by(job.Job.job_id)
+        ]
+        db_session.close()
+        return [wait_for_job(job_id) for job_id in job_ids]
+
+    # Labels of a single class are not enough to train, which the job records
+    positives = {sample_id: {"Boolean": 1} for sample_id in sample_ids[:2]}
+    (result,) = label_and_score(positives)
+    assert result["status"] == JobStatus.COMPLETED
+    assert result["stats"]["skipped"] and result["rows_done"] == 0
+
+    # The next label starts another job, rather than the 50th one
+    results = label_and_score({sample_ids[2]: {"Boolean": 0}})
+    assert len(results) == 2
+    assert "skipped" not in results[1]["stats"]
+    assert results[1]["rows_done"] == 6
+
+    response = client.delete(f"{PREFIX}/datasets/{dataset_id}")
+    assert response.status_code == 200
+
+
+def write_tricky_csv(path: str, num_rows: int) -> None:
+    """Helper method writing a CSV whose quoted fields hold newlines, commas and quotes"""
+
+    with open(path, "w", encoding="utf-8", newline="") as fileobj:
+        fileobj.write("id,text,other\r\n")
+        for i in range(num_rows):
+            if i % 3 == 0:
+                fileobj.write(f'{i},"line one\nline ""two"", with commas",x\r\n')
+            elif i % 3 == 1:
+                fileobj.write(f"{i},plain text {i} é,y\n\n")
+            else:
+                fileobj.write(f'"{i}","""quoted"" \r\nstart",z\n')
+
+
+def test_parallel_csv_reader(tmp_path, monkeypatch):
+    """Unit test for parsing byte ranges of a CSV in a process pool"""
+
+    monkeypatch.setattr(config, "INGESTION_WORKERS", 2)
+    path = str(tmp_path / "tricky.csv")
+    write_tricky_csv(path, 500)
+
+    with open(path, "rb") as fileobj:
+        expected = list(ingestion.CSVSampleReader(fileobj, "id", "text"))
+
+    # Tiny ranges put a boundary next to almost every quote and newline
+    for chunk_bytes in (7, 64, 1000):
+        with open(path, "rb") as fileobj:
+            reader = ingestion.ParallelCSVReader(fileobj, "id", "text", chunk_bytes)
+            assert list(reader) == expected
+            assert reader.tell() == os.path.getsize(path)
+            reader.close()
+
+    # Errors report the line of the file, as the sequential reader does
+    with open(path, "ab") as fileobj:
+        fileobj.write(b'1,"unterminated\n')
+        fileobj.write(b"2,\xff\n")
+    with open(path, "rb") as fileobj:
+        reader = ingestion.ParallelCSVReader(fileobj, "id", "text", 64)
+        with pytest.raises(ingestion.InvalidUploadError, match="not valid UTF-8"):
+            list(reader)
+        reader.close()
+
+
+def test_parallel_csv_bare_quotes(tmp_path, monkeypatch):
+    """Unit test for splitting a CSV whose unquoted fields hold quote characters"""
+
+    monkeypatch.setattr(config, "INGESTION_WORKERS", 2)
+    path = str(tmp_path / "bare.csv")
+    with open(path, "w", encoding="utf-8", newline="") as fileobj:
+        fileobj.write("id,text,other\n")
+        for i in range(200):
+            if i % 4 == 0:
+                fileobj.write(f'{i},5" screen,x\n')
+            elif i % 4 == 1:
+                fileobj.write(f'{i},"multi\nline, ""quoted""\n",y\n')
+            elif i % 4 == 2:
+                fileobj.write(f'{i},say "hi" twice,"z"\r\n')
+            else:
+                fileobj.write(f'"{i}",a"b,"c\nd"\n')
+
+    with open(path, "rb") as fileobj:
+        expected = list(ingestion.CSVSampleReader(fileobj, "id", "text"))
+    assert expected[0] == ("0", '5" screen')
+
+    for chunk_bytes in (1, 7, 13, 64):
+        with open(path, "rb") as fileobj:
+            reader = ingestion.ParallelCSVReader(fileobj, "id", "text", chunk_bytes)
+            assert list(reader) == expected
+            reader.close()
+
+
+def test_ingest_job_parallel(monkeypatch):
+    """Unit test for ingesting a large upload with several parsing processes"""
+
+    monkeypatch.setattr(config, "INGESTION_WORKERS", 2)
+    monkeypatch.setattr(config, "INGESTION_CHUNK_BYTES", 256)
+
+    response = client.post(f"{PREFIX}/datasets", json=EXAMPLE_DATASET_BODY)
+    dataset_id = response.json()["dataset_id"]
+
+    path = os.path.join(config.UPLOADS_DIR, "tricky.csv")
+    write_tricky_csv(path, 300)
+    data = dict(id_field="id", text_field="text")
+    with open(path, "rb") as fileobj:
+        files = dict(file=("tricky.csv", fileobj, "text/csv"))
+        response = client.post(
+            f"{PREFIX}/datasets/{dataset_id}/samples", data=data, files=files
+        )
+    os.remove(path)
+
+    body = wait_for_job(response.json()["job_id"])
+    assert body["status"] == JobStatus.COMPLETED
+    assert body["rows_done"] == 300
+    assert body["bytes_done"] == body["bytes_total"]
+
+    response = client.get(
+        f"{PREFIX}/datasets/{dataset_id}/samples", params=dict(limit=3)
+    )
+    texts = [s["text"] for s in response.json()["samples"]]
+    assert texts == [
+        'line one\nline "two", with commas',
+        "plain text 1 é",
+        '"quoted" \r\nstart',
+    ]
+
+    response = client.delete(f"{PREFIX}/datasets/{dataset_id}")
+    assert response.status_code == 200
+
+
+def test_ingest_job_invalid_rows(monkeypatch):
+    """Unit test for uploads that are corrupt or hold rows without a text"""
+
+    response = client.post(f"{PREFIX}/datasets", json=EXAMPLE_DATASET_BODY)
+    dataset_id = response.json()["dataset_id"]
+    url = f"{PREFIX}/datasets/{dataset_id}/samples"
+    data = dict(id_field="id", text_field="text")
+    csv_body = b"id,text\n" + b"".join(f"{i},text {i}\n".encode() for i in range(9999))
+    compressed = gzip.compress(csv_body)
+    table = pa.table(dict(id=["a", None], text=["first", "second"]))
+    parquet = pa.BufferOutputStream()
+    pq.write_table(table, parquet)
+
+    # A corrupt header fails the request itself
+    files = dict(file=("samples.csv.gz", b"\x1f\x8b" + b"x" * 100))
+    response = client.post(url, data=data, files=files)
+    assert response.status_code == 422
+    assert "decompress" in response.json()["detail"]
+
+    # A truncated file, null or missing texts and null Parquet values fail the job
+    uploads = [
+        ("samples.csv.gz", compressed[: len(compressed) // 2], "decompress"),
+        (
+            "samples.jsonl",
+            b'{"id": 1, "text": "one"}\n{"id": 2, "text": null}\n',
+            "Row 2",
+        ),
+        ("samples.jsonl", b'{"id": 1, "text": "one"}\n{"id": 2}\n', "`text`"),
+        ("samples.parquet", parquet.getvalue().to_pybytes(), "`id`"),
+        ("samples.csv", b"id,other,text\n1,a,one\n2,b\n", "`text`"),
+    ]
+    for filename, contents, error in uploads:
+        files = dict(file=(filename, contents))
+        body = wait_for_job(client.post(url, data=data, files=files).json()["job_id"])
+        assert body["status"] == JobStatus.FAILED
+        assert error in body["errors"][0]
+
+    response = client.get(url)
+    assert response.status_code == 200
+
+    # Neither the spool nor the job outlives a request failing unexpectedly
+    def fail(*args):
+        raise RuntimeError(f"Unexpected {args}")
+
+    db_session = SessionLocal()
+    num_jobs = db_session.query(job.Job).count()
+    monkeypatch.setattr(os, "rename", fail)
+    with pytest.raises(RuntimeError):
+        client.post(url, data=data, files=dict(file=("samples.csv", csv_body)))
+    assert not os.listdir(config.UPLOADS_DIR)
+    assert db_session.query(job.Job).count() == num_jobs
+    db_session.close()
+
+    response = client.delete(f"{PREFIX}/datasets/{dataset_id}")
+    assert response.status_code == 200
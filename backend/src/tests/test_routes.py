@@ -0,0 +1,17 @@
+"""
+Test properties shared by every route
+"""
+
+import inspect
+
+from fastapi.routing import APIRoute
+
+from main import app
+
+
+def test_routes_are_not_coroutines():
+    """Unit test for checking that no route blocks the event loop with database calls"""
+
+    for route in app.routes:
+        if isinstance(route, APIRoute):
+            assert not inspect.iscoroutinefunction(route.endpoint), route.path
@@ -2,13 +2,23 @@
 Test samples endpoints
 """
 
+from datetime import datetime, timedelta
+import gzip
+import json
 import os
 
 from fastapi.testclient import TestClient
+import pyarrow as pa
+import pyarrow.parquet as pq
 
 from main import app, PREFIX
+from database import SessionLocal, sample
+from database.job import Job
+from util import config
+from util.constants import JobKinds
 
 from .test_datasets import EXAMPLE_DATASET_BODY
+from .test_jobs import wait_for_job
 
 client = TestClient(app)
 
@@ -36,7 +46,8 @@ def create_demo_dataset() -> int:
         f"{PREFIX}/datasets/{dataset_id}/samples", data=data, files=files
     )
 
-    assert response.status_code == 200
+    assert response.status_code == 202
+    assert wait_for_job(response.json()["job_id"])["status"] == "completed"
 
     return dataset_id
 
@@ -250,3 +261,734 @@ def test_export_labels():
     assert response.status_code == 200
 
     delete_demo_dataset(dataset_id)
+
+
+def test_samples_create_count():
+    """Unit test for checking that every row of an uploaded CSV becomes a sample"""
+
+    dataset_id = create_demo_dataset()
+
+    response = client.get(f"{PREFIX}/datasets/{dataset_id}/samples")
+    assert response.status_code == 200
+    assert response.json()["metadata"]["pagination"]["total"] == 9
+
+    delete_demo_dataset(dataset_id)
+
+
+def test_create_samples_invalid_encoding():
+    """Unit test for uploading a CSV that is not valid UTF-8"""
+
+    dataset_id = create_demo_dataset()
+    data = dict(id_field="id", text_field="text")
+
+    # Invalid bytes within the header's read buffer fail the request itself
+    files = dict(file=("test.csv", b"id,text\n1,\xff\xfe\xfa\n", "text/csv"))
+    response = client.post(
+        f"{PREFIX}/datasets/{dataset_id}/samples", data=data, files=files
+    )
+    assert response.status_code == 422
+
+    # Invalid bytes further into the file fail the ingestion job
+    contents = b"id,text\n" + b"1,valid\n" * 5000 + b"2,\xff\xfe\xfa\n"
+    files = dict(file=("test.csv", contents, "text/csv"))
+    response = client.post(
+        f"{PREFIX}/datasets/{dataset_id}/samples", data=data, files=files
+    )
+    assert response.status_code == 202
+
+    body = wait_for_job(response.json()["job_id"])
+    assert body["status"] == "failed"
+    assert body["errors"]
+
+    delete_demo_dataset(dataset_id)
+
+
+def upload_samples(dataset_id: int, filename: str, contents: bytes, **fields):
+    """Helper method that uploads a file and returns the response"""
+
+    data = {"id_field": "id", "text_field": "text", **fields}
+    files = dict(file=(filename, contents, "application/octet-stream"))
+    return client.post(
+        f"{PREFIX}/datasets/{dataset_id}/samples", data=data, files=files
+    )
+
+
+def test_create_samples_formats():
+    """Unit test for uploading JSONL, Parquet and compressed files"""
+
+    response = client.post(f"{PREFIX}/datasets", json=EXAMPLE_DATASET_BODY)
+    dataset_id = response.json()["dataset_id"]
+
+    records = [dict(id=i, text=f"text {i}", other=[i]) for i in range(3)]
+    jsonl = "".join(json.dumps(record) + "\n" for record in records).encode()
+    csv_body = b"id,text\n" + b"".join(f"{i},text {i}\n".encode() for i in range(3))
+
+    parquet = pa.BufferOutputStream()
+    table = pa.table(dict(id=list(range(3)), text=[f"text {i}" for i in range(3)]))
+    pq.write_table(table, parquet, row_group_size=2)
+
+    uploads = [
+        ("samples.jsonl", jsonl),
+        ("samples.jsonl.gz", gzip.compress(jsonl)),
+        ("samples.csv.gz", gzip.compress(csv_body)),
+        ("samples.csv.zst", pa.compress(csv_body, "zstd", asbytes=True)),
+        ("samples.parquet", parquet.getvalue().to_pybytes()),
+    ]
+    for filename, contents in uploads:
+        response = upload_samples(dataset_id, filename, contents)
+        assert response.status_code == 202, filename
+
+        body = wait_for_job(response.json()["job_id"])
+        assert body["status"] == "completed", body["errors"]
+        assert body["rows_done"] == 3
+        assert body["bytes_done"] == body["bytes_total"] == len(contents)
+
+    response = client.get(
+        f"{PREFIX}/datasets/{dataset_id}/samples", params=dict(limit=100)
+    )
+    samples = response.json()["samples"]
+    assert [(s["original_id"], s["text"]) for s in samples] == [
+        (str(i), f"text {i}") for i in range(3)
+    ] * len(uploads)
+
+    # Unknown extensions, and fields missing from the first object or the schema
+    response = upload_samples(dataset_id, "samples.parquet.gz", b"")
+    assert response.status_code == 422
+    response = upload_samples(dataset_id, "samples.txt", csv_body)
+    assert response.status_code == 422
+    response = upload_samples(dataset_id, "samples.jsonl", jsonl, text_field="body")
+    assert response.status_code == 422
+    assert "first JSON object" in response.json()["detail"]
+    response = upload_samples(
+        dataset_id, "samples.parquet", uploads[-1][1], id_field="missing"
+    )
+    assert response.status_code == 422
+    response = upload_samples(dataset_id, "samples.parquet", csv_body)
+    assert response.status_code == 422
+    assert not os.listdir(config.UPLOADS_DIR)
+
+    # Malformed lines further into the file fail the ingestion job
+    response = upload_samples(dataset_id, "samples.jsonl", jsonl + b"{not json\n")
+    body = wait_for_job(response.json()["job_id"])
+    assert body["status"] == "failed"
+    assert "line 4" in body["errors"][0]
+
+    delete_demo_dataset(dataset_id)
+
+
+def test_import_samples(tmp_path, monkeypatch):
+    """Unit test for ingesting files of the server in place"""
+
+    response = client.post(f"{PREFIX}/datasets", json=EXAMPLE_DATASET_BODY)
+    dataset_id = response.json()["dataset_id"]
+    url = f"{PREFIX}/datasets/{dataset_id}/samples:import"
+    body = dict(path="samples.csv", id_field="id", text_field="text")
+
+    # Disabled unless an import root is configured
+    monkeypatch.setattr(config, "IMPORT_ROOT", None)
+    assert client.post(url, json=body).status_code == 403
+
+    monkeypatch.setattr(config, "IMPORT_ROOT", str(tmp_path))
+    assert client.post(url, json=body).status_code == 404
+
+    (tmp_path / "nested").mkdir()
+    with open(f"{SCRIPT_DIR}/test_samples.csv", "rb") as fileobj:
+        (tmp_path / "nested" / "samples.csv").write_bytes(fileobj.read())
+    table = pa.table(dict(id=["a", "b"], text=["first", "second"]))
+    pq.write_table(table, str(tmp_path / "samples.parquet"))
+
+    for path, rows in (("nested/samples.csv", 9), ("samples.parquet", 2)):
+        response = client.post(url, json=dict(body, path=path))
+        assert response.status_code == 202
+
+        job = wait_for_job(response.json()["job_id"])
+        assert job["status"] == "completed", job["errors"]
+        assert job["rows_done"] == rows
+
+    # Imported files are left in place
+    assert (tmp_path / "nested" / "samples.csv").exists()
+    assert (tmp_path / "samples.parquet").exists()
+
+    response = client.get(f"{PREFIX}/datasets/{dataset_id}")
+    assert response.json()["sample_count"] == 11
+
+    # Paths may not escape the import root, even through a symbolic link
+    (tmp_path / "link").symlink_to(SCRIPT_DIR)
+    for path in ("../samples.csv", f"{SCRIPT_DIR}/test_samples.csv", "link/x.csv"):
+        response = client.post(url, json=dict(body, path=path))
+        assert response.status_code == 403
+
+    response = client.post(url, json=dict(body, path="samples.parquet", text_field="x"))
+    assert response.status_code == 422
+    assert (tmp_path / "samples.parquet").exists()
+
+    delete_demo_dataset(dataset_id)
+
+
+def test_samples_get_cursor():
+    """Unit test for paging through a dataset's samples with keyset cursors"""
+
+    dataset_id = create_demo_dataset()
+
+    sample_ids = []
+    params = dict(limit=4)
+    while True:
+        response = client.get(f"{PREFIX}/datasets/{dataset_id}/samples", params=params)
+        assert response.status_code == 200
+
+        body = response.json()
+        sample_ids.extend(s["sample_id"] for s in body["samples"])
+
+        next_cursor = body["metadata"]["pagination"]["next_cursor"]
+        if next_cursor is None:
+            break
+        params = dict(limit=4, after=next_cursor)
+
+    assert len(sample_ids) == 9
+    assert len(set(sample_ids)) == 9
+
+    # Offset pagination returns the same order
+    response = client.get(
+        f"{PREFIX}/datasets/{dataset_id}/samples", params=dict(offset=4, limit=4)
+    )
+    assert [s["sample_id"] for s in response.json()["samples"]] == sample_ids[4:8]
+
+    response = client.get(
+        f"{PREFIX}/datasets/{dataset_id}/samples", params=dict(after="not-a-cursor")
+    )
+    assert response.status_code == 422
+
+    delete_demo_dataset(dataset_id)
+
+
+def test_label_sample_counters():
+    """Unit test for checking that labeling maintains the dataset's counters"""
+
+    dataset_id = create_demo_dataset()
+
+    response = client.get(f"{PREFIX}/datasets/{dataset_id}")
+    assert response.json()["sample_count"] == 9
+    assert response.json()["labeled_count"] == 0
+
+    response = client.get(f"{PREFIX}/datasets/{dataset_id}/samples")
+    sample_id = response.json()["samples"][0]["sample_id"]
+
+    # Labeling the same sample twice only counts it once
+    for value in (1, 0):
+        response = client.put(
+            f"{PREFIX}/datasets/{dataset_id}/samples/{sample_id}",
+            json={"labels": {"Boolean": value}},
+        )
+        assert response.status_code == 200
+
+    response = client.get(f"{PREFIX}/datasets/{dataset_id}")
+    assert response.json()["labeled_count"] == 1
+
+    response = client.get(
+        f"{PREFIX}/datasets/{dataset_id}/samples", params=dict(labeled=False)
+    )
+    assert response.json()["metadata"]["pagination"]["total"] == 8
+
+    delete_demo_dataset(dataset_id)
+
+
+def test_export_labels_csv():
+    """Unit test for checking the contents of a streamed CSV export"""
+
+    dataset_id = create_demo_dataset()
+
+    response = client.get(f"{PREFIX}/datasets/{dataset_id}/samples")
+    db_sample = response.json()["samples"][0]
+
+    response = client.put(
+        f"{PREFIX}/datasets/{dataset_id}/samples/{db_sample['sample_id']}",
+        json={"labels": {"Boolean": 1, "Numerical": 0.5}},
+    )
+    assert response.status_code == 200
+
+    response = client.get(f"{PREFIX}/datasets/{dataset_id}/export")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/csv")
+
+    lines = response.text.splitlines()
+    assert lines == ["id,Boolean,Numerical", f"{db_sample['original_id']},1.0,0.5"]
+
+    delete_demo_dataset(dataset_id)
+
+
+def test_export_labels_columnar():
+    """Unit test for exporting labels as typed JSONL, Arrow and Parquet columns"""
+
+    dataset_id = create_demo_dataset()
+
+    response = client.get(
+        f"{PREFIX}/datasets/{dataset_id}/samples", params=dict(limit=2)
+    )
+    sample_ids = [s["sample_id"] for s in response.json()["samples"]]
+
+    client.put(
+        f"{PREFIX}/datasets/{dataset_id}/samples/{sample_ids[0]}",
+        json={"labels": {"Boolean": 1, "Numerical": 0.5}},
+    )
+    client.put(
+        f"{PREFIX}/datasets/{dataset_id}/samples/{sample_ids[1]}",
+        json={"labels": {"Boolean": 0}},
+    )
+
+    params = dict(format="jsonl", include_text=True)
+    response = client.get(f"{PREFIX}/datasets/{dataset_id}/export", params=params)
+    assert response.status_code == 200
+    rows = [json.loads(line) for line in response.text.splitlines()]
+    assert [row["Boolean"] for row in rows] == [True, False]
+    assert [row["Numerical"] for row in rows] == [0.5, None]
+    assert all(row["text"] for row in rows)
+
+    for export_format, read in (
+        ("arrow", lambda data: pa.ipc.open_stream(data).read_all()),
+        ("parquet", lambda data: pq.read_table(pa.BufferReader(data))),
+    ):
+        response = client.get(
+            f"{PREFIX}/datasets/{dataset_id}/export", params=dict(format=export_format)
+        )
+        assert response.status_code == 200
+
+        table = read(response.content)
+        assert table.column_names == ["id", "Boolean", "Numerical"]
+        assert table.schema.field("Boolean").type == pa.bool_()
+        assert table.column("Numerical").to_pylist() == [0.5, None]
+
+    response = client.get(
+        f"{PREFIX}/datasets/{dataset_id}/export", params=dict(format="xlsx")
+    )
+    assert response.status_code == 422
+
+    delete_demo_dataset(dataset_id)
+
+
+def test_label_samples_batch():
+    """Unit test for labeling many samples at once with per-item errors"""
+
+    dataset_id = create_demo_dataset()
+
+    response = client.get(
+        f"{PREFIX}/datasets/{dataset_id}/samples", params=dict(limit=3)
+    )
+    sample_ids = [s["sample_id"] for s in response.json()["samples"]]
+
+    body = {
+        "samples": {
+            sample_ids[0]: {"Boolean": 1, "Numerical": 0.5},
+            sample_ids[1]: {"Boolean": 0},
+            sample_ids[2]: {"Numerical": 10},
+            "123456789": {"Boolean": 1},
+        }
+    }
+    response = client.put(f"{PREFIX}/datasets/{dataset_id}/samples:batch", json=body)
+    assert response.status_code == 200
+
+    result = response.json()
+    assert result["updated"] == 2
+    assert set(result["errors"]) == {str(sample_ids[2]), "123456789"}
+
+    response = client.get(f"{PREFIX}/datasets/{dataset_id}/samples/{sample_ids[0]}")
+    assert response.json()["labels"] == {"Boolean": 1, "Numerical": 0.5}
+
+    # Relabeling in a second batch does not count samples twice
+    body = {"samples": {sample_ids[0]: {"Boolean": 0}}}
+    response = client.put(f"{PREFIX}/datasets/{dataset_id}/samples:batch", json=body)
+    assert response.json()["updated"] == 1
+
+    response = client.get(f"{PREFIX}/datasets/{dataset_id}")
+    assert response.json()["labeled_count"] == 2
+
+    delete_demo_dataset(dataset_id)
+
+
+def test_samples_queue():
+    """Unit test for leasing disjoint batches of unlabeled samples to annotators"""
+
+    dataset_id = create_demo_dataset()
+    url = f"{PREFIX}/datasets/{dataset_id}/queue"
+
+    def lease(annotator: str, n: int = 4) -> list:
+        response = client.get(url, params=dict(annotator=annotator, n=n))
+        assert response.status_code == 200
+        return [s["sample_id"] for s in response.json()["samples"]]
+
+    first, second = lease("a"), lease("b")
+    assert len(first) == 4 and len(second) == 4
+    assert not set(first) & set(second)
+
+    # Asking again renews and returns the same batch
+    assert lease("a") == first
+
+    # Only one unleased sample is left
+    third = lease("c")
+    assert len(third) == 1
+    assert not set(third) & set(first + second)
+
+    # Labeling releases the lease
+    response = client.put(
+        f"{PREFIX}/datasets/{dataset_id}/samples/{first[0]}",
+        json={"labels": {"Boolean": 1}},
+    )
+    assert response.status_code == 200
+    assert lease("a") == first[1:]
+
+    # Expired leases are handed out again
+    db_session = SessionLocal()
+    db_session.query(sample.Sample).filter_by(leased_by="b").update(
+        dict(leased_until=datetime.now() - timedelta(seconds=1))
+    )
+    db_session.commit()
+    db_session.close()
+
+    assert sorted(lease("a", n=7)) == sorted(first[1:] + second)
+
+    # Without an annotator a new one is generated
+    response = client.get(url)
+    assert response.json()["annotator"]
+    assert response.json()["remaining"] == 8
+
+    response = client.get(f"{PREFIX}/datasets/123456789/queue")
+    assert response.status_code == 404
+
+    delete_demo_dataset(dataset_id)
+
+
+def test_samples_queue_uncertainty(monkeypatch):
+    """Unit test for serving the queue from the samples a model is least sure about"""
+
+    monkeypatch.setattr(config, "SCORE_MIN_LABELS", 4)
+    monkeypatch.setattr(config, "RESCORE_EVERY", 4)
+
+    response = client.post(f"{PREFIX}/datasets", json=EXAMPLE_DATASET_BODY.copy())
+    dataset_id = response.json()["dataset_id"]
+
+    rows = [(f"p{i}", f"a great and lovely day number {i}") for i in range(8)]
+    rows += [(f"n{i}", f"an awful and terrible day number {i}") for i in range(8)]
+    rows += [("m0", "a great day and an awful day"), ("m1", "lovely but terrible")]
+    csv_body = "id,text\n" + "".join(f"{i},{t}\n" for i, t in rows)
+    response = upload_samples(dataset_id, "test.csv", csv_body.encode())
+    assert wait_for_job(response.json()["job_id"])["status"] == "completed"
+
+    url = f"{PREFIX}/datasets/{dataset_id}/queue"
+
+    def lease(annotator: str, n: int) -> list:
+        response = client.get(
+            url, params=dict(annotator=annotator, n=n, order="uncertainty")
+        )
+        assert response.status_code == 200
+        return [s["original_id"] for s in response.json()["samples"]]
+
+    def score_jobs() -> list:
+        db_session = SessionLocal()
+        job_ids = [
+            job_id
+            for (job_id,) in db_session.query(Job.job_id)
+            .filter_by(dataset_id=dataset_id, kind=JobKinds.SCORE)
+            .order_by(Job.job_id)
+        ]
+        db_session.close()
+        return job_ids
+
+    # Before the model is trained, samples are served in insertion order
+    assert lease("a", 2) == ["p0", "p1"]
+    assert not score_jobs()
+
+    response = client.get(
+        f"{PREFIX}/datasets/{dataset_id}/samples", params=dict(limit=50)
+    )
+    sample_ids = {s["original_id"]: s["sample_id"] for s in response.json()["samples"]}
+    labels = {
+        sample_ids[original_id]: {"Boolean": int(original_id[0] == "p")}
+        for original_id in ("p0", "p1", "p2", "n0", "n1", "n2")
+    }
+    response = client.put(
+        f"{PREFIX}/datasets/{dataset_id}/samples:batch", json={"samples": labels}
+    )
+    assert response.status_code == 200
+
+    # Enough labels start a score job, which ranks the mixed samples first
+    lease("b", 2)
+    (job_id,) = score_jobs()
+    result = wait_for_job(job_id)
+    assert result["status"] == "completed"
+    assert result["rows_done"] == 12
+    assert result["stats"]["labels"] == 6 and result["stats"]["positives"] == 3
+
+    assert sorted(lease("c", 2)) == ["m0", "m1"]
+
+    # The model is only retrained once enough new samples are labeled
+    lease("c", 2)
+    assert len(score_jobs()) == 1
+
+    response = client.get(url, params=dict(order="random"))
+    assert response.status_code == 422
+
+    delete_demo_dataset(dataset_id)
+
+
+def test_samples_search():
+    """Unit test for full-text search over the text of a dataset's samples"""
+
+    dataset_id = create_demo_dataset()
+    url = f"{PREFIX}/datasets/{dataset_id}/samples"
+
+    response = client.get(url, params=dict(q="love", limit=1))
+    assert response.status_code == 200
+
+    body = response.json()
+    assert len(body["samples"]) == 1
+    assert "love" in body["samples"][0]["text"]
+    assert body["metadata"]["pagination"]["total"] == 2
+    assert body["metadata"]["pagination"]["next_offset"] == 1
+    assert body["metadata"]["pagination"]["next_cursor"] is None
+
+    # Every word must match, and query operators are matched literally
+    response = client.get(url, params=dict(q="LOVE land", limit=10))
+    assert [s["original_id"] for s in response.json()["samples"]] == ["9"]
+
+    response = client.get(url, params=dict(q='"#school" AND', limit=10))
+    assert response.json()["metadata"]["pagination"]["total"] == 0
+
+    response = client.get(url, params=dict(q="#school", limit=10))
+    assert [s["original_id"] for s in response.json()["samples"]] == ["8"]
+
+    # Search composes with the labeled filter
+    sample_id = response.json()["samples"][0]["sample_id"]
+    client.put(f"{url}/{sample_id}", json={"labels": {"Boolean": 1}})
+    response = client.get(url, params=dict(q="school", labeled=False))
+    assert response.json()["metadata"]["pagination"]["total"] == 0
+
+    response = client.get(url, params=dict(q="love", after="MQ=="))
+    assert response.status_code == 422
+
+    delete_demo_dataset(dataset_id)
+
+
+def upload_near_duplicates(dedup: str) -> tuple:
+    """Helper method that uploads a CSV with near-duplicate rows"""
+
+    response = client.post(f"{PREFIX}/datasets", json=EXAMPLE_DATASET_BODY.copy())
+    dataset_id = response.json()["dataset_id"]
+
+    text = "The quick brown fox jumps over the lazy dog near the river bank today"
+    rows = [
+        ("1", text),
+        ("2", "Something else entirely, about a slow green turtle"),
+        ("3", "  " + text.upper() + "  "),
+        ("4", text.replace("today", "today!")),
+    ]
+    csv_body = "id,text\n" + "".join(f'{i},"{t}"\n' for i, t in rows)
+
+    response = client.post(
+        f"{PREFIX}/datasets/{dataset_id}/samples",
+        data=dict(id_field="id", text_field="text", dedup=dedup),
+        files=dict(file=("test.csv", csv_body.encode(), "text/csv")),
+    )
+    assert response.status_code == 202
+
+    job = wait_for_job(response.json()["job_id"])
+    assert job["status"] == "completed"
+
+    return dataset_id, job
+
+
+def test_samples_dedup_link():
+    """Unit test for linking near-duplicates, which take their cluster's labels"""
+
+    dataset_id, job = upload_near_duplicates("link")
+    assert job["stats"] == dict(dedup="link", rows=4, duplicates=2, clusters=1)
+
+    url = f"{PREFIX}/datasets/{dataset_id}/samples"
+    samples = client.get(url, params=dict(limit=10)).json()["samples"]
+    by_id = {s["original_id"]: s for s in samples}
+    assert len(samples) == 4
+    assert [by_id[i]["is_duplicate"] for i in "1234"] == [False, False, True, True]
+    assert by_id["1"]["cluster_id"] == by_id["3"]["cluster_id"]
+    assert by_id["2"]["cluster_id"] != by_id["1"]["cluster_id"]
+
+    # Duplicates are not handed out to annotators
+    response = client.get(f"{PREFIX}/datasets/{dataset_id}/queue", params=dict(n=10))
+    assert {s["original_id"] for s in response.json()["samples"]} == {"1", "2"}
+
+    # Labeling the canonical sample labels its whole cluster
+    response = client.put(
+        f"{url}/{by_id['1']['sample_id']}", json={"labels": {"Boolean": 1}}
+    )
+    assert response.status_code == 200
+
+    response = client.get(f"{url}/{by_id['4']['sample_id']}")
+    assert response.json()["labels"] == {"Boolean": 1}
+
+    response = client.get(f"{PREFIX}/datasets/{dataset_id}")
+    assert response.json()["labeled_count"] == 3
+
+    # A batch reports every sample written, duplicates included
+    body = {"samples": {by_id["3"]["sample_id"]: {"Boolean": 0}}}
+    response = client.put(f"{url}:batch", json=body)
+    assert response.json() == dict(updated=3, errors={})
+
+    delete_demo_dataset(dataset_id)
+
+
+def test_samples_dedup_drop():
+    """Unit test for dropping near-duplicates at ingestion"""
+
+    dataset_id, job = upload_near_duplicates("drop")
+    assert job["stats"] == dict(dedup="drop", rows=4, duplicates=2, clusters=1)
+
+    response = client.get(f"{PREFIX}/datasets/{dataset_id}")
+    assert response.json()["sample_count"] == 2
+
+    response = client.post(
+        f"{PREFIX}/datasets/{dataset_id}/samples",
+        data=dict(id_field="id", text_field="text", dedup="merge"),
+        files=dict(file=("test.csv", b"id,text\n1,a\n", "text/csv")),
+    )
+    assert response.status_code == 422
+
+    delete_demo_dataset(dataset_id)
+
+
+def test_cached_reads_revalidate():
+    """Unit test for ETags of cached reads, which change when a sample is labeled"""
+
+    response = client.get(f"{PREFIX}/datasets")
+    list_etag = response.headers["etag"]
+
+    dataset_id = create_demo_dataset()
+    dataset_url = f"{PREFIX}/datasets/{dataset_id}"
+
+    # Creating a dataset changes the list of datasets
+    response = client.get(f"{PREFIX}/datasets", headers={"If-None-Match": list_etag})
+    assert response.status_code == 200
+    assert dataset_id in [d["dataset_id"] for d in response.json()]
+
+    response = client.get(dataset_url)
+    etag = response.headers["etag"]
+    assert response.headers["last-modified"]
+    assert response.json()["sample_count"] == 9
+
+    response = client.get(dataset_url, headers={"If-None-Match": etag})
+    assert response.status_code == 304
+    assert response.headers["etag"] == etag
+
+    response = client.get(
+        dataset_url,
+        headers={"If-Modified-Since": client.get(dataset_url).headers["last-modified"]},
+    )
+    assert response.status_code == 304
+
+    sample_id = client.get(f"{dataset_url}/samples").json()["samples"][0]["sample_id"]
+    sample_url = f"{dataset_url}/samples/{sample_id}"
+    sample_etag = client.get(sample_url).headers["etag"]
+
+    response = client.put(sample_url, json={"labels": {"Boolean": 1}})
+    assert response.status_code == 200
+
+    response = client.get(dataset_url, headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.json()["labeled_count"] == 1
+
+    response = client.get(sample_url, headers={"If-None-Match": sample_etag})
+    assert response.status_code == 200
+    assert response.json()["labels"] == {"Boolean": 1}
+
+    delete_demo_dataset(dataset_id)
+
+    response = client.get(dataset_url)
+    assert response.status_code == 404
+    response = client.get(sample_url, headers={"If-None-Match": sample_etag})
+    assert response.status_code == 404
+
+
+def test_dataset_stats():
+    """Unit test for the label statistics maintained as samples are labeled"""
+
+    dataset_id = create_demo_dataset()
+    url = f"{PREFIX}/datasets/{dataset_id}"
+
+    response = client.get(f"{url}/stats")
+    assert response.status_code == 200
+    boolean, numerical = response.json()["labels"]
+    assert boolean["count"] == 0 and boolean["mean"] is None
+    assert [b["value"] for b in numerical["histogram"]] == [-1, -0.5, 0, 0.5, 1]
+
+    sample_ids = [
+        s["sample_id"]
+        for s in client.get(f"{url}/samples", params=dict(limit=10)).json()["samples"]
+    ]
+    for sample_id, labels in zip(
+        sample_ids,
+        [
+            {"Boolean": 1, "Numerical": 0.5},
+            {"Boolean": 0, "Numerical": 0.5},
+            {"Boolean": 1, "Numerical": -0.9},
+        ],
+    ):
+        client.put(f"{url}/samples/{sample_id}", json={"labels": labels})
+
+    # Relabeling moves the sample's previous values out of their bins
+    client.put(f"{url}/samples/{sample_ids[1]}", json={"labels": {"Boolean": 1}})
+    client.put(
+        f"{url}/samples:batch",
+        json={"samples": {sample_ids[3]: {"Numerical": 1}}},
+    )
+
+    body = client.get(f"{url}/stats").json()
+    assert body["labeled_count"] == 4
+    boolean, numerical = body["labels"]
+    assert boolean["count"] == 3
+    assert boolean["positive_rate"] == 1
+    assert [b["count"] for b in boolean["histogram"]] == [0, 3]
+    assert numerical["count"] == 3
+    assert abs(numerical["mean"] - 0.2) < 1e-9
+    assert [b["count"] for b in numerical["histogram"]] == [1, 0, 0, 1, 1]
+
+    # Recomputing from the samples gives the same statistics
+    client.post(f"{PREFIX}/admin/datasets/{dataset_id}/recount")
+    assert client.get(f"{url}/stats").json() == body
+
+    response = client.get(f"{PREFIX}/datasets/123456789/stats")
+    assert response.status_code == 404
+
+    delete_demo_dataset(dataset_id)
+
+
+def test_samples_label_filters():
+    """Unit test for filtering samples by the values of their labels"""
+
+    dataset_id = create_demo_dataset()
+    url = f"{PREFIX}/datasets/{dataset_id}/samples"
+
+    sample_ids = [
+        s["sample_id"] for s in client.get(url, params=dict(limit=10)).json()["samples"]
+    ]
+    for sample_id, value in zip(sample_ids, (-1, 0, 0.5, 1)):
+        client.put(
+            f"{url}/{sample_id}", json={"labels": {"Numerical": value, "Boolean": 1}}
+        )
+
+    def matching(*filters) -> list:
+        response = client.get(url, params=dict(limit=10, label=list(filters)))
+        assert response.status_code == 200
+        body = response.json()
+        assert body["metadata"]["pagination"]["total"] == len(body["samples"])
+        return [s["sample_id"] for s in body["samples"]]
+
+    assert matching("Numerical:gt:0") == sample_ids[2:4]
+    assert matching("Numerical:ge:0", "Numerical:lt:1") == sample_ids[1:3]
+    assert matching("Numerical:eq:-1", "Boolean:eq:1") == sample_ids[:1]
+    assert matching("Boolean:eq:0") == []
+
+    # Label values keep the shape of the `labels` object
+    response = client.get(f"{url}/{sample_ids[2]}")
+    assert response.json()["labels"] == {"Boolean": 1, "Numerical": 0.5}
+
+    for spec in ("Numerical:gt", "Numerical:between:0", "Missing:eq:1"):
+        response = client.get(url, params=dict(label=spec))
+        assert response.status_code == 422
+
+    delete_demo_dataset(dataset_id)
@@ -0,0 +1,229 @@
+"""
+In-process cache of serialized read responses, revalidated with ETags
+
+Responses are cached per process in an LRU of `config.CACHE_SIZE` entries, each kept
+for at most `config.CACHE_TTL_SECONDS`.  Every entry records the version of the scope
+it was read from: the list of datasets, or a single dataset and its samples.  Writes
+mark the scopes they change on their session, and the versions are bumped once the
+session commits, so that later reads miss and query the store again.  Other worker
+processes do not see those bumps, which the TTL bounds.
+
+Cached responses carry an `ETag` (a hash of the body) and a `Last-Modified` date, and
+conditional requests repeating them are answered with `304 Not Modified`.
+"""
+
+from typing import Any, Callable, Dict, NamedTuple, Optional
+from collections import OrderedDict
+from email.utils import formatdate, parsedate_to_datetime
+import hashlib
+import itertools
+import json
+import threading
+import time
+
+from fastapi import Request, Response
+from fastapi.encoders import jsonable_encoder
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from util import config
+
+# Scope of the list of datasets, changed when a dataset is created or deleted
+DATASETS_SCOPE = "datasets"
+
+# OpenAPI description of the conditional responses of cached routes
+NOT_MODIFIED = {304: {"description": "Unchanged since the request's `If-None-Match`"}}
+
+# Session info key holding the scopes to bump when the session commits
+PENDING_KEY = "cache_invalidations"
+
+
+def dataset_scope(dataset_id) -> Optional[str]:
+    """Scope of a dataset and its samples, or None for a malformed id"""
+
+    try:
+        return f"dataset:{int(dataset_id)}"
+    except (TypeError, ValueError):
+        return None
+
+
+class CacheEntry(NamedTuple):
+    """A serialized response and the scope version it was read at"""
+
+    version: int
+    body: bytes
+    etag: str
+    modified: int  # Unix time, in whole seconds like the `Last-Modified` header
+    expires: float
+
+
+class ResponseCache:
+    """LRU of serialized responses whose entries expire after a TTL"""
+
+    def __init__(self, size: int, ttl: float):
+        self.size = size
+        self.ttl = ttl
+        self.entries: "OrderedDict[str, CacheEntry]" = OrderedDict()
+        self.lock = threading.Lock()
+        self.counts = dict(hits=0, misses=0, not_modified=0, evictions=0)
+
+    def get(self, key: str, version: int) -> Optional[CacheEntry]:
+        """Fetch an entry that is neither expired nor older than `version`"""
+
+        with self.lock:
+            entry = self.entries.get(key)
+            if (
+                entry is None
+                or entry.version != version
+                or entry.expires < time.monotonic()
+            ):
+                self.counts["misses"] += 1
+                return None
+
+            self.entries.move_to_end(key)
+            self.counts["hits"] += 1
+            return entry
+
+    def put(self, key: str, version: int, body: bytes) -> CacheEntry:
+        """Store a freshly serialized response, keeping its date if it is unchanged"""
+
+        etag = '"' + hashlib.blake2b(body, digest_size=16).hexdigest() + '"'
+        with self.lock:
+            previous = self.entries.pop(key, None)
+            modified = int(time.time())
+            if previous is not None and previous.etag == etag:
+                modified = previous.modified
+
+            entry = CacheEntry(
+                version, body, etag, modified, time.monotonic() + self.ttl
+            )
+            self.entries[key] = entry
+            while len(self.entries) > self.size:
+                self.entries.popitem(last=False)
+                self.counts["evictions"] += 1
+
+            return entry
+
+    def count_not_modified(self) -> None:
+        """Record a conditional request answered without a body"""
+
+        with self.lock:
+            self.counts["not_modified"] += 1
+
+    def clear(self) -> None:
+        """Drop every entry and reset the counts"""
+
+        with self.lock:
+            self.entries.clear()
+            self.counts = dict.fromkeys(self.counts, 0)
+
+    def stats(self) -> Dict[str, Any]:
+        """Counts of lookups, for tuning the size and TTL of the cache"""
+
+        with self.lock:
+            lookups = self.counts["hits"] + self.counts["misses"]
+            return dict(
+                size=self.size,
+                ttl_seconds=self.ttl,
+                entries=len(self.entries),
+                hit_rate=self.counts["hits"] / lookups if lookups else 0.0,
+                **self.counts,
+            )
+
+
+responses = ResponseCache(config.CACHE_SIZE, config.CACHE_TTL_SECONDS)
+
+_versions: Dict[str, int] = {}
+_versions_lock = threading.Lock()
+_version_counter = itertools.count(1)
+
+
+def current_version(scope: str) -> int:
+    """Current version of a scope, 0 until it is first changed"""
+
+    with _versions_lock:
+        return _versions.get(scope, 0)
+
+
+def bump(*scopes: str) -> None:
+    """Give scopes new versions, so that entries read from them are no longer used"""
+
+    with _versions_lock:
+        for scope in scopes:
+            _versions[scope] = next(_version_counter)
+
+
+def invalidate_on_commit(db_session: Session, dataset_id=None) -> None:
+    """Bump a dataset's scope, or the list of datasets, when the session commits"""
+
+    scope = DATASETS_SCOPE if dataset_id is None else dataset_scope(dataset_id)
+    if scope is not None:
+        db_session.info.setdefault(PENDING_KEY, set()).add(scope)
+
+
+@event.listens_for(Session, "after_commit")
+def _bump_pending(db_session: Session) -> None:
+    bump(*db_session.info.pop(PENDING_KEY, ()))
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_pending(db_session: Session) -> None:
+    db_session.info.pop(PENDING_KEY, None)
+
+
+def _encode(content: Any) -> bytes:
+    # Serialized like FastAPI's JSONResponse
+    return json.dumps(
+        jsonable_encoder(content),
+        ensure_ascii=False,
+        allow_nan=False,
+        separators=(",", ":"),
+    ).encode("utf-8")
+
+
+def _not_modified(request: Request, entry: CacheEntry) -> bool:
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        # Weak comparison, as for GET requests
+        tags = {tag.strip().replace("W/", "", 1) for tag in if_none_match.split(",")}
+        return "*" in tags or entry.etag in tags
+
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since is not None:
+        try:
+            since = parsedate_to_datetime(if_modified_since).timestamp()
+        except (TypeError, ValueError):
+            return False
+        return entry.modified <= since
+
+    return False
+
+
+def respond(
+    request: Request, key: str, scope: Optional[str], build: Callable[[], Any]
+) -> Response:
+    """Serve a JSON response from the cache, calling `build` to read it on a miss
+
+    Responses to malformed ids (a None scope) are built without being cached.
+    Exceptions raised by `build`, such as 404s, are never cached.
+    """
+
+    if scope is None:
+        return Response(_encode(build()), media_type="application/json")
+
+    current = current_version(scope)
+    entry = responses.get(key, current)
+    if entry is None:
+        entry = responses.put(key, current, _encode(build()))
+
+    headers = {
+        "ETag": entry.etag,
+        "Last-Modified": formatdate(entry.modified, usegmt=True),
+        # Browsers revalidate on every request, which costs a 304 at most
+        "Cache-Control": "no-cache",
+    }
+    if _not_modified(request, entry):
+        responses.count_not_modified()
+        return Response(status_code=304, headers=headers)
+
+    return Response(entry.body, media_type="application/json", headers=headers)
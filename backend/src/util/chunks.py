@@ -0,0 +1,17 @@
+"""
+Helpers for splitting lists of ids bound into `IN (...)` clauses
+"""
+
+from typing import Iterator, Sequence, TypeVar
+
+T = TypeVar("T")
+
+# Maximum number of bound ids per `IN (...)` statement, below SQLite's variable limit
+IN_CLAUSE_SIZE = 500
+
+
+def chunks(values: Sequence[T], size: int = IN_CLAUSE_SIZE) -> Iterator[Sequence[T]]:
+    """Consecutive slices of at most `size` values"""
+
+    for start in range(0, len(values), size):
+        yield values[start : start + size]
@@ -10,3 +10,61 @@ class LabelVariants:
     BOOLEAN = "boolean"
 
     valid_labels = (NUMERICAL, BOOLEAN)
+
+
+class JobKinds:
+    """Valid values for the `kind` field of a job"""
+
+    INGEST = "ingest"
+    DELETE = "delete"
+    SCORE = "score"
+
+
+class DedupModes:
+    """Valid values for the `dedup` field of a samples upload"""
+
+    NONE = "none"
+    DROP = "drop"
+    LINK = "link"
+
+    valid_modes = (NONE, DROP, LINK)
+
+
+class UploadFormats:
+    """Valid formats of a samples upload, named after their file extension"""
+
+    CSV = "csv"
+    JSONL = "jsonl"
+    PARQUET = "parquet"
+
+    valid_formats = (CSV, JSONL, PARQUET)
+
+
+class Compressions:
+    """Valid compressions of a CSV or JSONL upload, named after their file extension"""
+
+    GZIP = "gz"
+    ZSTD = "zst"
+
+    valid_compressions = (GZIP, ZSTD)
+
+
+class JobStatus:
+    """Valid values for the `status` field of a job"""
+
+    PENDING = "pending"
+    RUNNING = "running"
+    COMPLETED = "completed"
+    FAILED = "failed"
+    CANCELLED = "cancelled"
+
+    active = (PENDING, RUNNING)
+
+
+class QueueOrders:
+    """Valid values for the `order` parameter of the work queue"""
+
+    INSERTION = "insertion"
+    UNCERTAINTY = "uncertainty"
+
+    valid_orders = (INSERTION, UNCERTAINTY)
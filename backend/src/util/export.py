@@ -0,0 +1,300 @@
+"""
+Stream a dataset's labels out of the database in bounded memory
+
+Every export format shares the same column-only database cursor and is produced one
+record batch at a time, so memory use is independent of the size of the dataset.
+"""
+
+from typing import Dict, Iterator, List, Optional, Tuple, Type
+from io import StringIO
+import csv
+import io
+import json
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+from sqlalchemy import case, func
+
+from database import SessionLocal, sample, sample_label
+from util.constants import LabelVariants
+
+# Rows fetched from the database cursor per round trip
+EXPORT_BATCH_SIZE = 1000
+
+# Rows per record batch of the columnar formats (a row group in Parquet)
+COLUMNAR_BATCH_SIZE = 64 * 1024
+
+ExportRow = Tuple[str, Optional[str], dict]
+
+
+def iter_labeled_samples(
+    dataset_id: int,
+    definitions: List[Tuple[int, str]],
+    include_text: bool = False,
+) -> Iterator[ExportRow]:
+    """Yield (original_id, text, labels) for every labeled sample of a dataset
+
+    `definitions` are the (label_definition_id, name) of the dataset's labels.  A
+    single query pivots the label values of each sample into one column per label,
+    and rows are streamed from the cursor in batches, so neither the whole result set
+    nor unused sample text is held in memory.  `text` is None unless `include_text`
+    is set.  The iterator owns its session, since it outlives the request's
+    dependencies.
+    """
+
+    values = sample_label.SampleLabel
+    columns = [sample.Sample.original_id]
+    if include_text:
+        columns.append(sample.Sample.text)
+    columns.extend(
+        func.max(case((values.label_definition_id == definition_id, values.value)))
+        for definition_id, _ in definitions
+    )
+    names = [name for _, name in definitions]
+    first_label = 2 if include_text else 1
+
+    db_session = SessionLocal()
+    try:
+        query = (
+            db_session.query(*columns)
+            .outerjoin(values, values.sample_id == sample.Sample.sample_id)
+            .filter(
+                sample.Sample.dataset_id == dataset_id,
+                sample.Sample.is_labeled.is_(True),
+            )
+            .group_by(sample.Sample.sample_id)
+            .order_by(sample.Sample.sample_id)
+            .execution_options(stream_results=True)
+            .yield_per(EXPORT_BATCH_SIZE)
+        )
+        for row in query:
+            labels = {
+                name: value
+                for name, value in zip(names, row[first_label:])
+                if value is not None
+            }
+            yield row[0], row[1] if include_text else None, labels
+    finally:
+        db_session.close()
+
+
+class Exporter:
+    """Base class of an export format, written one batch of rows at a time"""
+
+    media_type = "application/octet-stream"
+    extension = ""
+    batch_size = EXPORT_BATCH_SIZE
+
+    def __init__(self, labels: List[Tuple[str, str]], include_text: bool = False):
+        """`labels` is a list of (name, variant) tuples of the dataset's label definitions"""
+
+        self.labels = labels
+        self.include_text = include_text
+
+    @property
+    def column_names(self) -> List[str]:
+        """Names of the exported columns, in order"""
+
+        names = ["id"]
+        if self.include_text:
+            names.append("text")
+        return names + [name for name, _ in self.labels]
+
+    def typed_value(self, variant: str, value: Optional[float]):
+        """Convert a stored label value to the type of its label variant"""
+
+        if value is None:
+            return None
+        if variant == LabelVariants.BOOLEAN:
+            return bool(value)
+        return float(value)
+
+    def header(self) -> bytes:
+        """Bytes written before the first batch"""
+
+        return b""
+
+    def write_batch(self, rows: List[ExportRow]) -> bytes:
+        """Serialize one batch of rows"""
+
+        raise NotImplementedError
+
+    def footer(self) -> bytes:
+        """Bytes written after the last batch"""
+
+        return b""
+
+    def stream(self, rows: Iterator[ExportRow]) -> Iterator[bytes]:
+        """Yield the encoded export chunk by chunk"""
+
+        header = self.header()
+        if header:
+            yield header
+
+        batch = []
+        for row in rows:
+            batch.append(row)
+            if len(batch) >= self.batch_size:
+                yield self.write_batch(batch)
+                batch = []
+
+        if batch:
+            yield self.write_batch(batch)
+
+        footer = self.footer()
+        if footer:
+            yield footer
+
+
+class CSVExporter(Exporter):
+    """Comma separated values with a header row"""
+
+    media_type = "text/csv"
+    extension = "csv"
+
+    def __init__(self, labels: List[Tuple[str, str]], include_text: bool = False):
+        super().__init__(labels, include_text)
+        self._output = StringIO()
+        self._writer = csv.DictWriter(self._output, self.column_names)
+
+    def _drain(self) -> bytes:
+        value = self._output.getvalue().encode("utf-8")
+        self._output.seek(0)
+        self._output.truncate()
+        return value
+
+    def header(self) -> bytes:
+        self._writer.writeheader()
+        return self._drain()
+
+    def write_batch(self, rows: List[ExportRow]) -> bytes:
+        for original_id, text, labels in rows:
+            body = dict(id=original_id, **labels)
+            if self.include_text:
+                body["text"] = text
+            self._writer.writerow(body)
+
+        return self._drain()
+
+
+class JSONLExporter(Exporter):
+    """One JSON object per line with typed label values"""
+
+    media_type = "application/x-ndjson"
+    extension = "jsonl"
+
+    def write_batch(self, rows: List[ExportRow]) -> bytes:
+        lines = []
+        for original_id, text, labels in rows:
+            body = dict(id=original_id)
+            if self.include_text:
+                body["text"] = text
+            for name, variant in self.labels:
+                body[name] = self.typed_value(variant, labels.get(name))
+            lines.append(json.dumps(body, ensure_ascii=False))
+
+        return ("\n".join(lines) + "\n").encode("utf-8")
+
+
+class _ChunkSink(io.RawIOBase):
+    """Writable file object that hands back whatever was written since the last drain"""
+
+    def __init__(self):
+        super().__init__()
+        self._chunks = []
+        self._position = 0
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        self._chunks.append(bytes(data))
+        self._position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self._position
+
+    def drain(self) -> bytes:
+        """Return and forget the bytes written so far"""
+
+        value = b"".join(self._chunks)
+        self._chunks = []
+        return value
+
+
+class ArrowExporter(Exporter):
+    """Arrow IPC stream of typed record batches"""
+
+    media_type = "application/vnd.apache.arrow.stream"
+    extension = "arrow"
+    batch_size = COLUMNAR_BATCH_SIZE
+
+    def __init__(self, labels: List[Tuple[str, str]], include_text: bool = False):
+        super().__init__(labels, include_text)
+        self._sink = _ChunkSink()
+        self._writer = None
+
+        fields = [pa.field("id", pa.string())]
+        if include_text:
+            fields.append(pa.field("text", pa.string()))
+        for name, variant in labels:
+            arrow_type = (
+                pa.bool_() if variant == LabelVariants.BOOLEAN else pa.float64()
+            )
+            fields.append(pa.field(name, arrow_type))
+        self.schema = pa.schema(fields)
+
+    def open_writer(self, sink):
+        """Create the pyarrow writer for this format"""
+
+        return pa.ipc.new_stream(sink, self.schema)
+
+    def record_batch(self, rows: List[ExportRow]) -> pa.RecordBatch:
+        """Pivot a batch of rows into typed columns"""
+
+        columns = [[original_id for original_id, _, _ in rows]]
+        if self.include_text:
+            columns.append([text for _, text, _ in rows])
+        for name, variant in self.labels:
+            columns.append(
+                [self.typed_value(variant, labels.get(name)) for _, _, labels in rows]
+            )
+
+        return pa.RecordBatch.from_arrays(
+            [
+                pa.array(column, type=field.type)
+                for column, field in zip(columns, self.schema)
+            ],
+            schema=self.schema,
+        )
+
+    def header(self) -> bytes:
+        self._writer = self.open_writer(self._sink)
+        return self._sink.drain()
+
+    def write_batch(self, rows: List[ExportRow]) -> bytes:
+        self._writer.write_batch(self.record_batch(rows))
+        return self._sink.drain()
+
+    def footer(self) -> bytes:
+        self._writer.close()
+        return self._sink.drain()
+
+
+class ParquetExporter(ArrowExporter):
+    """Parquet file with one row group per record batch"""
+
+    media_type = "application/vnd.apache.parquet"
+    extension = "parquet"
+
+    def open_writer(self, sink):
+        return pq.ParquetWriter(sink, self.schema)
+
+
+EXPORTERS: Dict[str, Type[Exporter]] = {
+    "csv": CSVExporter,
+    "jsonl": JSONLExporter,
+    "arrow": ArrowExporter,
+    "parquet": ParquetExporter,
+}
@@ -0,0 +1,334 @@
+"""
+Per-route request metrics, exposed in the Prometheus text format, and a request profiler
+
+`MetricsMiddleware` gives every HTTP request a `RequestStats` in a context variable,
+which is copied into the threads running route handlers.  SQLAlchemy cursor events add
+each query's duration to it, and `MetricsRoute` notes when the handler returned, so the
+time spent validating and rendering its response is known.  Once the response is sent,
+the request is added to histograms labeled by method and route template.
+
+Requests carrying the `X-Lablr-Profile` header, when `config.PROFILING` is set, are
+sampled by a thread reading the stacks of the threads serving them.  Their response is
+replaced by the sampled stacks in the collapsed format read by flamegraph tools, with
+the original status in `X-Lablr-Profile-Status`.
+
+Metrics are kept per worker process.
+"""
+
+from typing import Callable, Dict, List, Optional, Sequence, Set, Tuple
+from collections import Counter
+from contextvars import ContextVar
+import functools
+import math
+import sys
+import threading
+import time
+
+from fastapi.routing import APIRoute
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from util import config
+
+# Request header asking for a profile of the request, and the response's original status
+PROFILE_HEADER = "x-lablr-profile"
+PROFILE_STATUS_HEADER = "X-Lablr-Profile-Status"
+
+# Route label of requests that matched no route
+UNMATCHED_ROUTE = "unmatched"
+
+# Upper bounds of the histogram buckets, in seconds and in queries
+DURATION_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 500)
+
+
+class RequestStats:  # pylint: disable=too-few-public-methods
+    """Timings of one request, filled in as it is served"""
+
+    def __init__(self):
+        self.route = UNMATCHED_ROUTE
+        self.queries = 0
+        self.query_seconds = 0.0
+        self.serialization_seconds = 0.0
+        self.handler_returned: Optional[float] = None
+        self.threads: Set[int] = {threading.get_ident()}
+
+
+_current: ContextVar[Optional[RequestStats]] = ContextVar("request_stats", default=None)
+
+
+class Histogram:
+    """Cumulative histogram of observations, keyed by label values"""
+
+    def __init__(self, name: str, description: str, buckets: Sequence[float]):
+        self.name = name
+        self.description = description
+        self.buckets = tuple(buckets) + (math.inf,)
+        self.series: Dict[Tuple[str, ...], List[float]] = {}
+
+    def observe(self, labels: Tuple[str, ...], value: float) -> None:
+        """Count a value in its bucket, under the registry's lock"""
+
+        # Bucket counts, then the sum of values
+        series = self.series.setdefault(labels, [0] * len(self.buckets) + [0.0])
+        for index, bound in enumerate(self.buckets):
+            if value <= bound:
+                series[index] += 1
+                break
+        series[-1] += value
+
+    def render(self, label_names: Sequence[str]) -> List[str]:
+        """Lines of the histogram in the Prometheus text format"""
+
+        lines = [
+            f"# HELP {self.name} {self.description}",
+            f"# TYPE {self.name} histogram",
+        ]
+        for labels, series in sorted(self.series.items()):
+            pairs = [f'{n}="{_escape(v)}"' for n, v in zip(label_names, labels)]
+            cumulative = 0
+            for bound, count in zip(self.buckets, series):
+                cumulative += count
+                le = "+Inf" if bound == math.inf else f"{bound:g}"
+                bucket_pairs = ",".join(pairs + [f'le="{le}"'])
+                lines.append(f"{self.name}_bucket{{{bucket_pairs}}} {cumulative}")
+            lines.append(f"{self.name}_sum{{{','.join(pairs)}}} {series[-1]:.6f}")
+            lines.append(f"{self.name}_count{{{','.join(pairs)}}} {cumulative}")
+
+        return lines
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class Registry:
+    """The request metrics of this process"""
+
+    label_names = ("method", "route")
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.requests: Counter = Counter()
+        self.histograms = dict(
+            duration=Histogram(
+                "lablr_request_duration_seconds",
+                "Time from receiving a request to sending its response.",
+                DURATION_BUCKETS,
+            ),
+            queries=Histogram(
+                "lablr_request_db_queries",
+                "Database queries executed by a request.",
+                QUERY_BUCKETS,
+            ),
+            query_seconds=Histogram(
+                "lablr_request_db_seconds",
+                "Time a request spent executing database queries.",
+                DURATION_BUCKETS,
+            ),
+            serialization_seconds=Histogram(
+                "lablr_request_serialization_seconds",
+                "Time a request spent validating and rendering its response.",
+                DURATION_BUCKETS,
+            ),
+        )
+
+    def record(
+        self, method: str, stats: RequestStats, status: int, seconds: float
+    ) -> None:
+        """Add a served request to the metrics"""
+
+        labels = (method, stats.route)
+        with self.lock:
+            self.requests[labels + (str(status),)] += 1
+            self.histograms["duration"].observe(labels, seconds)
+            self.histograms["queries"].observe(labels, stats.queries)
+            self.histograms["query_seconds"].observe(labels, stats.query_seconds)
+            self.histograms["serialization_seconds"].observe(
+                labels, stats.serialization_seconds
+            )
+
+    def clear(self) -> None:
+        """Forget every recorded request"""
+
+        with self.lock:
+            self.requests.clear()
+            for histogram in self.histograms.values():
+                histogram.series.clear()
+
+    def render(self) -> str:
+        """All metrics in the Prometheus text exposition format"""
+
+        with self.lock:
+            lines = [
+                "# HELP lablr_requests_total Requests served, by response status.",
+                "# TYPE lablr_requests_total counter",
+            ]
+            for (method, route, status), count in sorted(self.requests.items()):
+                lines.append(
+                    f'lablr_requests_total{{method="{method}",'
+                    f'route="{_escape(route)}",status="{status}"}} {count}'
+                )
+            for histogram in self.histograms.values():
+                lines.extend(histogram.render(self.label_names))
+
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+
+@event.listens_for(Engine, "before_cursor_execute")
+def _start_query(conn, cursor, statement, parameters, context, executemany):
+    # pylint: disable=unused-argument,too-many-arguments
+    if _current.get() is not None:
+        conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def _end_query(conn, cursor, statement, parameters, context, executemany):
+    # pylint: disable=unused-argument,too-many-arguments
+    stats = _current.get()
+    starts = conn.info.get("query_start")
+    if stats is not None and starts:
+        stats.queries += 1
+        stats.query_seconds += time.perf_counter() - starts.pop()
+
+
+def _timed(endpoint: Callable) -> Callable:
+    # FastAPI reads the endpoint's signature through `functools.wraps`
+    @functools.wraps(endpoint)
+    def timed_endpoint(*args, **kwargs):
+        stats = _current.get()
+        if stats is not None:
+            stats.threads.add(threading.get_ident())
+        try:
+            return endpoint(*args, **kwargs)
+        finally:
+            if stats is not None:
+                stats.handler_returned = time.perf_counter()
+
+    timed_endpoint.timed = True
+    return timed_endpoint
+
+
+class MetricsRoute(APIRoute):
+    """Route recording its template, and the time spent serializing its response"""
+
+    def __init__(self, path: str, endpoint: Callable, **kwargs):
+        # Routes are created again, with the wrapped endpoint, when their router is
+        # included in the app
+        if not getattr(endpoint, "timed", False):
+            endpoint = _timed(endpoint)
+        super().__init__(path, endpoint, **kwargs)
+
+    def get_route_handler(self) -> Callable:
+        handler = super().get_route_handler()
+
+        async def timed_handler(request):
+            stats = _current.get()
+            if stats is not None:
+                stats.route = self.path_format
+
+            response = await handler(request)
+            if stats is not None and stats.handler_returned is not None:
+                stats.serialization_seconds = (
+                    time.perf_counter() - stats.handler_returned
+                )
+            return response
+
+        return timed_handler
+
+
+class Profiler(threading.Thread):
+    """Sample the stacks of a request's threads until stopped"""
+
+    def __init__(self, threads: Set[int], interval: float):
+        super().__init__(daemon=True)
+        self.threads = threads
+        self.interval = interval
+        self.stacks: Counter = Counter()
+        self.stopped = threading.Event()
+
+    def run(self) -> None:
+        while True:
+            frames = sys._current_frames()  # pylint: disable=protected-access
+            for thread_id in list(self.threads):
+                frame = frames.get(thread_id)
+                if frame is not None:
+                    self.stacks[_collapse(frame)] += 1
+            if self.stopped.wait(self.interval):
+                break
+
+    def collapsed(self) -> str:
+        """Sampled stacks, one `root;...;leaf count` line per distinct stack"""
+
+        self.stopped.set()
+        self.join()
+        return "".join(f"{stack} {count}\n" for stack, count in self.stacks.items())
+
+
+def _collapse(frame) -> str:
+    names = []
+    while frame is not None:
+        module = frame.f_globals.get("__name__", "?")
+        names.append(f"{module}:{frame.f_code.co_name}:{frame.f_lineno}")
+        frame = frame.f_back
+    return ";".join(reversed(names))
+
+
+class MetricsMiddleware:  # pylint: disable=too-few-public-methods
+    """ASGI middleware recording the metrics of every HTTP request, and profiling
+    those that ask for it"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        stats = RequestStats()
+        token = _current.set(stats)
+        status = 500
+        start = time.perf_counter()
+
+        profiler = None
+        if config.PROFILING and any(
+            name == PROFILE_HEADER.encode() for name, _ in scope["headers"]
+        ):
+            profiler = Profiler(stats.threads, config.PROFILE_INTERVAL_MS / 1000)
+            profiler.start()
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            if profiler is None:
+                await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            _current.reset(token)
+            registry.record(scope["method"], stats, status, time.perf_counter() - start)
+
+        if profiler is not None:
+            await _send_profile(send, profiler.collapsed(), status)
+
+
+async def _send_profile(send, collapsed: str, status: int) -> None:
+    body = collapsed.encode("utf-8")
+    await send(
+        dict(
+            type="http.response.start",
+            status=200,
+            headers=[
+                (b"content-type", b"text/plain; charset=utf-8"),
+                (b"content-length", str(len(body)).encode()),
+                (PROFILE_STATUS_HEADER.lower().encode(), str(status).encode()),
+            ],
+        )
+    )
+    await send(dict(type="http.response.body", body=body))
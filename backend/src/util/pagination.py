@@ -0,0 +1,30 @@
+"""
+Helpers for opaque keyset pagination cursors
+"""
+
+from typing import Optional
+import base64
+import binascii
+
+
+class InvalidCursorError(ValueError):
+    """Raised when a pagination cursor cannot be decoded"""
+
+
+def encode_cursor(sample_id: Optional[int]) -> Optional[str]:
+    """Encode the last seen sample_id into an opaque cursor string"""
+
+    if sample_id is None:
+        return None
+
+    return base64.urlsafe_b64encode(str(sample_id).encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> int:
+    """Decode a cursor produced by `encode_cursor` back into a sample_id"""
+
+    padded = cursor + "=" * (-len(cursor) % 4)
+    try:
+        return int(base64.urlsafe_b64decode(padded.encode()).decode())
+    except (binascii.Error, UnicodeDecodeError, ValueError) as error:
+        raise InvalidCursorError(f"Invalid pagination cursor `{cursor}`") from error
@@ -0,0 +1,69 @@
+"""
+Full-text search over the text of samples
+
+On SQLite, sample text is indexed by the `samples_fts` FTS5 table, which triggers on
+`samples` keep in sync (see `database.migrations.add_samples_fts`), and matches are
+ranked by bm25.  On PostgreSQL the equivalent inverted index is a GIN index over
+`to_tsvector('simple', text)`, ranked by `ts_rank`.  Both match samples containing
+every word of the query, in any order.
+"""
+
+from sqlalchemy import column, func, literal_column, select, table
+from sqlalchemy.orm import Query, Session
+
+from database import sample
+
+# Text search configuration of PostgreSQL; like FTS5's default tokenizer, it neither
+# stems words nor drops stop words
+TS_CONFIG = "simple"
+
+samples_fts = table("samples_fts", column("rowid"), column("rank"))
+
+
+def fts5_query(q: str) -> str:
+    """Quote every word of a user query, so FTS5 operators in it are matched literally"""
+
+    return " ".join('"' + word.replace('"', '""') + '"' for word in q.split())
+
+
+def _fts5_match(q: str):
+    return literal_column("samples_fts").op("MATCH")(fts5_query(q))
+
+
+def _ts_vector_and_query(q: str):
+    return (
+        func.to_tsvector(TS_CONFIG, sample.Sample.text),
+        func.plainto_tsquery(TS_CONFIG, q),
+    )
+
+
+def matching(db_session: Session, query: Query, q: str) -> Query:
+    """Restrict a query of samples to those matching `q`, e.g. to count them
+
+    On SQLite the matches are selected with `sample_id IN (...)`, which makes the
+    full-text index drive the query rather than the dataset's samples.
+    """
+
+    if db_session.get_bind().dialect.name == "postgresql":
+        vector, ts_query = _ts_vector_and_query(q)
+        return query.filter(vector.op("@@")(ts_query))
+
+    return query.filter(
+        sample.Sample.sample_id.in_(select(samples_fts.c.rowid).where(_fts5_match(q)))
+    )
+
+
+def ranked(db_session: Session, query: Query, q: str) -> Query:
+    """Restrict a query of samples to those matching `q`, best matches first"""
+
+    if db_session.get_bind().dialect.name == "postgresql":
+        vector, ts_query = _ts_vector_and_query(q)
+        return query.filter(vector.op("@@")(ts_query)).order_by(
+            func.ts_rank(vector, ts_query).desc(), sample.Sample.sample_id
+        )
+
+    return (
+        query.join(samples_fts, samples_fts.c.rowid == sample.Sample.sample_id)
+        .filter(_fts5_match(q))
+        .order_by(samples_fts.c.rank, sample.Sample.sample_id)
+    )
@@ -0,0 +1,147 @@
+"""
+Validation of submitted labels against a dataset's label definitions
+"""
+
+from typing import Dict, Iterable, NamedTuple, Optional
+from collections import OrderedDict
+import threading
+import time
+
+from sqlalchemy.orm import Session
+
+from database import label_definition
+from util import config
+from util.constants import LabelVariants
+
+# Number of datasets whose compiled validators are kept in memory
+VALIDATOR_CACHE_SIZE = 128
+
+
+class InvalidLabelError(ValueError):
+    """Raised when a submitted label does not match the dataset's label definitions"""
+
+
+class LabelRule(NamedTuple):
+    """Compiled constraints of a single label definition"""
+
+    variant: str
+    minimum: float
+    maximum: float
+    interval: float
+    label_definition_id: int
+
+
+class LabelValidator:
+    """Validates labels with a dict of a dataset's definitions keyed by name"""
+
+    def __init__(
+        self, dataset_id, definitions: Iterable[label_definition.LabelDefinition]
+    ):
+        self.dataset_id = dataset_id
+        self.rules: Dict[str, LabelRule] = {
+            definition.name: LabelRule(
+                definition.variant,
+                definition.minimum,
+                definition.maximum,
+                definition.interval,
+                definition.label_definition_id,
+            )
+            for definition in definitions
+        }
+
+    def validate(self, labels: Dict[str, float]) -> None:
+        """Raise an InvalidLabelError describing the first invalid label, if any"""
+
+        for label, value in labels.items():
+
+            # Check that label is valid for a dataset
+            rule = self.rules.get(label)
+            if rule is None:
+                raise InvalidLabelError(
+                    f"Label `{label}` is not a valid label for dataset "
+                    f"with dataset_id `{self.dataset_id}`"
+                )
+
+            # Check if numerical label is within valid bounds
+            if (
+                rule.variant == LabelVariants.NUMERICAL
+                and not rule.minimum <= value <= rule.maximum
+            ):
+                raise InvalidLabelError(
+                    f"Value `{value}` of label `{label}` "
+                    f"must be within range ({rule.minimum}, {rule.maximum})."
+                )
+
+            # Check if boolean variable is either 0 or 1
+            if rule.variant == LabelVariants.BOOLEAN and value not in (0, 1):
+                raise InvalidLabelError(
+                    f"Value `{value}` of label `{label}` must be either 0 or 1."
+                )
+
+    def definition_values(self, labels: Dict[str, float]) -> Dict[int, float]:
+        """Key validated labels by the ids of their definitions"""
+
+        return {
+            self.rules[label].label_definition_id: value
+            for label, value in labels.items()
+        }
+
+
+class CachedValidator(NamedTuple):
+    """A compiled validator and the monotonic time after which it is read again"""
+
+    validator: LabelValidator
+    expires: float
+
+
+_validators: "OrderedDict[int, CachedValidator]" = OrderedDict()
+_validators_lock = threading.Lock()
+
+
+def _cache_key(dataset_id) -> Optional[int]:
+    try:
+        return int(dataset_id)
+    except (TypeError, ValueError):
+        return None
+
+
+def get_validator(db_session: Session, dataset_id) -> LabelValidator:
+    """Fetch the compiled validator of a dataset, querying its definitions on a miss
+
+    Validators are kept for at most `config.CACHE_TTL_SECONDS`, which bounds how long
+    other worker processes use those of a dataset deleted by this one.  Malformed ids
+    match no definitions and are not cached."""
+
+    key = _cache_key(dataset_id)
+    with _validators_lock:
+        cached = _validators.get(key)
+        if cached is not None and cached.expires >= time.monotonic():
+            _validators.move_to_end(key)
+            return cached.validator
+
+    definitions = (
+        db_session.query(label_definition.LabelDefinition)
+        .filter_by(dataset_id=dataset_id)
+        .all()
+    )
+    validator = LabelValidator(dataset_id, definitions)
+    if key is None:
+        return validator
+
+    with _validators_lock:
+        _validators[key] = CachedValidator(
+            validator, time.monotonic() + config.CACHE_TTL_SECONDS
+        )
+        _validators.move_to_end(key)
+        while len(_validators) > VALIDATOR_CACHE_SIZE:
+            _validators.popitem(last=False)
+
+    return validator
+
+
+def invalidate_validator(dataset_id) -> None:
+    """Forget the compiled validator of a dataset once a change to its definitions
+    is committed"""
+
+    with _validators_lock:
+        _validators.pop(_cache_key(dataset_id), None)
@@ -0,0 +1,198 @@
+"""
+Work queue handing out batches of unlabeled samples to annotators
+
+A sample is reserved with a lease stored on its row (`leased_by` and `leased_until`),
+claimed with a conditional update, so no two annotators are handed the same sample,
+whichever worker process serves them.  Expired leases can be claimed again.
+Near-duplicates are never handed out, since they take the labels of their cluster's
+canonical sample.
+
+Each process keeps a buffer of candidate sample ids per dataset.  It is refilled ahead
+of demand by keyset scans of the `(dataset_id, is_labeled, sample_id)` index, which
+resume after the last id scanned and wrap around at the end of the dataset, so
+requests do not repeat a scan from the start.
+
+In the `uncertainty` order, samples are handed out from the one the dataset's scorer
+is most uncertain about.  Scores change with every retraining, so those candidates
+are read for each request from the `(dataset_id, is_labeled, uncertainty)` index
+instead of being buffered.
+"""
+
+from typing import Dict, List
+from collections import OrderedDict
+from datetime import datetime, timedelta
+import threading
+
+from sqlalchemy import or_
+from sqlalchemy.orm import Session
+
+from database import sample
+from util import config
+from util.constants import QueueOrders
+
+# Number of datasets whose candidate buffers are kept in memory
+QUEUE_CACHE_SIZE = 128
+
+# Candidate ids read per keyset scan
+REFILL_SIZE = 1000
+
+# Claim attempts per request, since candidates go stale when other processes claim them
+MAX_CLAIM_ROUNDS = 5
+
+
+class CandidateBuffer:
+    """Ids of a dataset's samples that were unlabeled and unleased when scanned"""
+
+    def __init__(self, dataset_id: int):
+        self.dataset_id = dataset_id
+        self.after_id = 0
+        self.sample_ids: Dict[int, None] = {}  # Insertion ordered set
+        self.lock = threading.Lock()
+
+    def _refill(self, db_session: Session, now: datetime) -> None:
+        rows = (
+            db_session.query(sample.Sample.sample_id)
+            .filter_by(dataset_id=self.dataset_id, is_labeled=False, is_duplicate=False)
+            .filter(sample.Sample.sample_id > self.after_id)
+            .filter(
+                or_(
+                    sample.Sample.leased_until.is_(None),
+                    sample.Sample.leased_until < now,
+                )
+            )
+            .order_by(sample.Sample.sample_id)
+            .limit(REFILL_SIZE)
+            .all()
+        )
+        self.sample_ids.update((sample_id, None) for (sample_id,) in rows)
+
+        # The next scan starts over once the end of the dataset is reached
+        self.after_id = rows[-1][0] if len(rows) == REFILL_SIZE else 0
+
+    def take(self, db_session: Session, count: int, now: datetime) -> List[int]:
+        """Remove and return up to `count` candidates, scanning for more when low"""
+
+        with self.lock:
+            for _ in range(2):
+                if len(self.sample_ids) >= count + REFILL_SIZE // 2:
+                    break
+                scanned_from = self.after_id
+                self._refill(db_session, now)
+                if scanned_from == 0:
+                    break
+
+            taken = list(self.sample_ids)[:count]
+            for sample_id in taken:
+                del self.sample_ids[sample_id]
+
+            return taken
+
+
+_buffers: "OrderedDict[int, CandidateBuffer]" = OrderedDict()
+_buffers_lock = threading.Lock()
+
+
+def get_buffer(dataset_id: int) -> CandidateBuffer:
+    """Fetch the candidate buffer of a dataset, creating an empty one on a miss"""
+
+    key = int(dataset_id)
+    with _buffers_lock:
+        buffer = _buffers.get(key)
+        if buffer is None:
+            buffer = _buffers[key] = CandidateBuffer(dataset_id)
+            while len(_buffers) > QUEUE_CACHE_SIZE:
+                _buffers.popitem(last=False)
+        else:
+            _buffers.move_to_end(key)
+
+        return buffer
+
+
+def invalidate_queue(dataset_id) -> None:
+    """Forget the candidate buffer of a deleted dataset"""
+
+    with _buffers_lock:
+        _buffers.pop(int(dataset_id), None)
+
+
+def _unleased(query, now: datetime):
+    return query.filter(
+        or_(
+            sample.Sample.leased_until.is_(None),
+            sample.Sample.leased_until < now,
+        )
+    )
+
+
+def most_uncertain(
+    db_session: Session, dataset_id: int, count: int, now: datetime
+) -> List[int]:
+    """Ids of up to `count` unleased samples the scorer is the most uncertain about"""
+
+    query = db_session.query(sample.Sample.sample_id).filter_by(
+        dataset_id=dataset_id, is_labeled=False, is_duplicate=False
+    )
+    return [
+        sample_id
+        for (sample_id,) in _unleased(query, now)
+        .order_by(sample.Sample.uncertainty.desc(), sample.Sample.sample_id)
+        .limit(count)
+    ]
+
+
+def lease_samples(
+    db_session: Session,
+    dataset_id: int,
+    annotator: str,
+    count: int,
+    order: str = QueueOrders.INSERTION,
+) -> List[sample.Sample]:
+    """Reserve up to `count` unlabeled samples of a dataset for an annotator
+
+    Samples still leased to the annotator are renewed and returned first, so asking
+    again, e.g. after reloading the page, hands back the same batch.  Samples are
+    returned in the given order.  Commits the session.
+    """
+
+    now = datetime.now()
+    until = now + timedelta(seconds=config.QUEUE_LEASE_SECONDS)
+
+    def leased():
+        return (
+            db_session.query(sample.Sample)
+            .filter_by(dataset_id=dataset_id, leased_by=annotator, is_labeled=False)
+            .filter(sample.Sample.leased_until >= now)
+        )
+
+    wanted = count - leased().update(
+        dict(leased_until=until), synchronize_session=False
+    )
+
+    for _ in range(MAX_CLAIM_ROUNDS):
+        if wanted <= 0:
+            break
+
+        if order == QueueOrders.UNCERTAINTY:
+            candidates = most_uncertain(db_session, dataset_id, wanted, now)
+        else:
+            candidates = get_buffer(dataset_id).take(db_session, wanted, now)
+        if not candidates:
+            break
+
+        # Only samples that are still unlabeled and unleased are claimed
+        query = (
+            db_session.query(sample.Sample)
+            .filter_by(dataset_id=dataset_id, is_labeled=False, is_duplicate=False)
+            .filter(sample.Sample.sample_id.in_(candidates))
+        )
+        wanted -= _unleased(query, now).update(
+            dict(leased_by=annotator, leased_until=until),
+            synchronize_session=False,
+        )
+
+    db_session.commit()
+
+    ordering = [sample.Sample.sample_id]
+    if order == QueueOrders.UNCERTAINTY:
+        ordering.insert(0, sample.Sample.uncertainty.desc())
+    return leased().order_by(*ordering).limit(count).all()
@@ -6,6 +6,8 @@ export interface Sample {
     [label: string]: number;
   };
   save_for_later: boolean;
+  cluster_id?: string;
+  is_duplicate: boolean;
 }
 
 export interface SampleMetadata {
@@ -14,6 +16,7 @@ export interface SampleMetadata {
     offset: number;
     limit: number;
     next_offset: number;
+    next_cursor?: string;
     total: number;
   };
 }